@@ -1,48 +1,206 @@
 import asyncio
+import base64
+import bisect
+import codecs
+import functools
+import io
+import hashlib
+import itertools
+import math
+import mimetypes
+import multiprocessing
+import re
 import json
 import uuid
+import shutil
+import subprocess
+import zipfile
+import zlib
 import os
 import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict, deque
 from pathlib import Path
-from typing import Optional, List, Dict, Any
-from dataclasses import dataclass
+from typing import Optional, List, Dict, Any, Tuple, Callable, AsyncIterator, Union
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import asynccontextmanager, contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field, fields, asdict
+from email.utils import formatdate, parsedate_to_datetime
 from enum import Enum
 
-from fastapi import FastAPI, HTTPException, BackgroundTasks
-from fastapi.responses import JSONResponse, FileResponse
-from pydantic import BaseModel
+from fastapi import FastAPI, HTTPException, Request, WebSocket, WebSocketDisconnect
+from fastapi.exceptions import RequestValidationError
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+from pydantic import BaseModel, Field, ValidationError
+from starlette.requests import ClientDisconnect
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, Counter, Histogram, generate_latest
+from prometheus_client.core import GaugeMetricFamily, HistogramMetricFamily
 import aiohttp
 import logging
+import sqlite3
+import stat
+import tarfile
+import threading
+
+from workflow_template import WorkflowTemplate
+
+try:
+    from watchfiles import Change, awatch
+except ImportError:  # Shipped with uvicorn[standard]; without it the output index falls back to scans
+    Change = None
+    awatch = None
+
+try:
+    from PIL import Image, ImageSequence
+except ImportError:  # Only needed to transcode animated WebP clips
+    Image = None
+    ImageSequence = None
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
+# watchfiles logs every batch of output-directory changes at INFO
+logging.getLogger("watchfiles").setLevel(logging.WARNING)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    loop_lag_monitor.start()
+    await run_fs(OUTPUT_DIR.mkdir, exist_ok=True)
+    get_http_session()
+    backend_pool.start()
+    await jobs_db.start()
+    await result_cache.load()
+    await output_index.start()
+    job_scheduler.start()
+    try:
+        yield
+    finally:
+        await job_scheduler.close()
+        await result_cache.close()
+        await output_index.close()
+        await close_postprocess_executor()
+        await loop_lag_monitor.close()
+        await backend_pool.close()
+        await close_http_session()
+        await jobs_db.close()
 
-app = FastAPI(title="Motion Video Generation API", version="1.0.0")
+app = FastAPI(title="Motion Video Generation API", version="1.0.0", lifespan=lifespan)
 
 COMFYUI_HOST = os.getenv("COMFYUI_HOST", "localhost")
 COMFYUI_PORT = os.getenv("COMFYUI_PORT", "9188")
 COMFYUI_URL = f"http://{COMFYUI_HOST}:{COMFYUI_PORT}"
+# Additional ComfyUI nodes: comma-separated URLs or host:port pairs, or a JSON file
+# listing them ([{"name": "gpu-1", "url": "http://10.0.0.5:9188"}, ...]).
+# When neither is set, COMFYUI_URL is the only backend.
+COMFYUI_BACKENDS = os.getenv("COMFYUI_BACKENDS", "")
+COMFYUI_BACKENDS_FILE = os.getenv("COMFYUI_BACKENDS_FILE", "")
+COMFYUI_HEALTH_INTERVAL_SECONDS = float(os.getenv("COMFYUI_HEALTH_INTERVAL_SECONDS", "10"))
+# Consecutive failures before a node stops receiving work until a health probe succeeds
+COMFYUI_BACKEND_MAX_FAILURES = int(os.getenv("COMFYUI_BACKEND_MAX_FAILURES", "3"))
+PROBE_TIMEOUT = aiohttp.ClientTimeout(total=5)
+# A node that already holds a workflow's models is preferred unless its queue is
+# more than this many prompts longer than the least-loaded node's
+COMFYUI_AFFINITY_SLACK = int(os.getenv("COMFYUI_AFFINITY_SLACK", "2"))
 API_PORT = int(os.getenv("API_PORT", "9000"))
 
 OUTPUT_DIR = Path("./output")
-OUTPUT_DIR.mkdir(exist_ok=True)
+
+# Blocking filesystem calls (stat, exists, directory scans, SQLite) run on this many threads
+FS_WORKERS = int(os.getenv("FS_WORKERS", "8"))
+# How often the event loop is sampled for stalls
+LOOP_LAG_SAMPLE_SECONDS = float(os.getenv("LOOP_LAG_SAMPLE_SECONDS", "0.05"))
+LOOP_LAG_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
 
 CLIENT_TIMEOUT_SECONDS = 36_000
 AIOHTTP_TIMEOUT = aiohttp.ClientTimeout(total=CLIENT_TIMEOUT_SECONDS)
 
+# History polling is only used while the ComfyUI WebSocket feed is unavailable
+HISTORY_POLL_INTERVAL_SECONDS = 2
+# While the socket is up, re-check /history this often in case an event was missed across a reconnect
+WS_RECHECK_SECONDS = float(os.getenv("COMFYUI_WS_RECHECK_SECONDS", "60"))
+WS_RECONNECT_DELAY_SECONDS = float(os.getenv("COMFYUI_WS_RECONNECT_DELAY", "2"))
+WS_HEARTBEAT_SECONDS = 30
+
+# Connection pool shared by every HTTP call to ComfyUI (submit, history, health)
+COMFYUI_CONNECTION_LIMIT = int(os.getenv("COMFYUI_CONNECTION_LIMIT", "100"))
+COMFYUI_CONNECTION_LIMIT_PER_HOST = int(os.getenv("COMFYUI_CONNECTION_LIMIT_PER_HOST", "32"))
+COMFYUI_KEEPALIVE_SECONDS = float(os.getenv("COMFYUI_KEEPALIVE_SECONDS", "60"))
+COMFYUI_DNS_CACHE_SECONDS = int(os.getenv("COMFYUI_DNS_CACHE_SECONDS", "300"))
+
+# Job persistence: "memory" (lost on restart) or "sqlite" (WAL-mode file at JOB_STORE_PATH)
+JOB_STORE = os.getenv("JOB_STORE", "memory")
+JOB_STORE_PATH = os.getenv("JOB_STORE_PATH", "./jobs.sqlite3")
+# Progress updates are written to SQLite in batches at this interval
+JOB_STORE_FLUSH_SECONDS = float(os.getenv("JOB_STORE_FLUSH_SECONDS", "1.0"))
+# Finished jobs are evicted this long after they complete or fail
+JOB_TTL_SECONDS = float(os.getenv("JOB_TTL_SECONDS", "86400"))
+JOB_EVICTION_INTERVAL_SECONDS = 60
+
+# Admission control: jobs wait in a bounded priority queue drained by JOB_WORKERS workers
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+JOB_QUEUE_MAX_DEPTH = int(os.getenv("JOB_QUEUE_MAX_DEPTH", "100"))
+# Assumed job duration until the scheduler has measured real ones
+DEFAULT_JOB_SECONDS_ESTIMATE = 300.0
+
+# Results of identical prompt graphs are served from OUTPUT_DIR instead of re-rendering
+RESULT_CACHE_ENABLED = os.getenv("RESULT_CACHE_ENABLED", "true").lower() in ("1", "true", "yes")
+RESULT_CACHE_MAX_ENTRIES = int(os.getenv("RESULT_CACHE_MAX_ENTRIES", "10000"))
+RESULT_CACHE_MAX_BYTES = int(os.getenv("RESULT_CACHE_MAX_BYTES", str(50 * 1024 ** 3)))
+# Evicted results' files, and the MP4s and posters derived from them, are deleted once no stored
+# job lists them, so the cache bounds OUTPUT_DIR; when unset, eviction only trims the index
+RESULT_CACHE_DELETE_EVICTED = os.getenv("RESULT_CACHE_DELETE_EVICTED", "true").lower() in ("1", "true", "yes")
+
+# How many of a job's scene workflows may be queued in ComfyUI at once (1 = serial)
+SCENE_CONCURRENCY = int(os.getenv("SCENE_CONCURRENCY", "4"))
+# Narration pace used to time plain-text scripts; SRT/WebVTT scripts carry their own timing
+SCENE_WORDS_PER_MINUTE = float(os.getenv("SCENE_WORDS_PER_MINUTE", "150"))
+# Scripts are segmented this many characters at a time, yielding to the event loop in between
+SCRIPT_CHUNK_CHARS = 16 * 1024
+
+# /status/{job_id}/stream and /ws: minimum gap between updates, and idle keepalive interval
+STATUS_STREAM_INTERVAL_SECONDS = float(os.getenv("STATUS_STREAM_INTERVAL_SECONDS", "0.25"))
+STATUS_STREAM_KEEPALIVE_SECONDS = 15
+
+# Finished jobs' traces are appended here as OTLP/JSON lines (the OpenTelemetry
+# Collector file exporter format); empty disables export
+TRACE_EXPORT_PATH = os.getenv("TRACE_EXPORT_PATH", "")
+# Spans beyond this are dropped so one huge script cannot bloat its trace
+TRACE_MAX_SPANS = int(os.getenv("TRACE_MAX_SPANS", "5000"))
+
+# CPU-side post-processing (transcodes, posters, checksums, concatenation) runs in this many worker processes
+POSTPROCESS_WORKERS = int(os.getenv("POSTPROCESS_WORKERS", "2"))
+FFMPEG_BIN = os.getenv("FFMPEG_BIN", "ffmpeg")
+# Looked up once at import rather than scanning PATH on the event loop for every job
+FFMPEG_PATH = shutil.which(FFMPEG_BIN)
+FFPROBE_BIN = os.getenv("FFPROBE_BIN", "ffprobe")
+
 class JobStatus(str, Enum):
     PENDING = "pending"
     PROCESSING = "processing"
     COMPLETED = "completed"
     FAILED = "failed"
 
-class ScriptRequest(BaseModel):
-    script: str
-    clips_per_minute: int = 2
+class JobPriority(str, Enum):
+    LOW = "low"
+    NORMAL = "normal"
+    HIGH = "high"
+
+PRIORITY_RANK = {JobPriority.HIGH: 0, JobPriority.NORMAL: 1, JobPriority.LOW: 2}
+
+class ScriptOptions(BaseModel):
+    clips_per_minute: int = Field(2, gt=0)
     clip_duration: float = 6.5  # 5-8 seconds average
     style: Optional[str] = "cinematic"
     resolution: Optional[str] = "1920x1080"
     fps: Optional[int] = 30
+    max_concurrent_scenes: Optional[int] = None  # Defaults to SCENE_CONCURRENCY
+    priority: JobPriority = JobPriority.NORMAL
+    concatenate: bool = False  # Also stitch the scene clips into one video; implies postprocess_clips
+    postprocess_clips: bool = False  # Transcode each clip to MP4 with a poster frame and checksum
+    words_per_minute: Optional[float] = Field(None, gt=0)  # Narration pace for scene timing; defaults to SCENE_WORDS_PER_MINUTE
+
+class ScriptRequest(ScriptOptions):
+    script: str
     workflow: Optional[Dict] = None  # Custom workflow override
 
 class JobResponse(BaseModel):
@@ -57,7 +215,19 @@ class JobStatusResponse(BaseModel):
     clips_generated: Optional[int] = None
     total_clips: Optional[int] = None
     output_files: Optional[List[str]] = None
+    reused_clips: Optional[List[int]] = None
+    coalesced_clips: Optional[List[int]] = None
+    postprocess: Optional[Dict[str, Any]] = None
     error: Optional[str] = None
+    created_at: Optional[float] = None
+    finished_at: Optional[float] = None
+
+class StatusBatchRequest(BaseModel):
+    job_ids: List[str] = Field(..., max_length=1000)
+
+class JobListResponse(BaseModel):
+    jobs: List[JobStatusResponse]
+    next_cursor: Optional[str] = None
 
 @dataclass
 class VideoJob:
@@ -70,227 +240,2914 @@ class VideoJob:
     fps: int
     status: JobStatus
     workflow: Optional[Dict] = None
+    max_concurrent_scenes: Optional[int] = None
+    priority: JobPriority = JobPriority.NORMAL
+    concatenate: bool = False
+    postprocess_clips: bool = False
+    words_per_minute: Optional[float] = None
     progress: float = 0.0
     clips_generated: int = 0
     total_clips: int = 0
     output_files: List[str] = None
+    # Scene indices served from the result cache instead of being rendered
+    reused_clips: List[int] = field(default_factory=list)
+    # Scene indices that shared another job's identical in-flight prompt
+    coalesced_clips: List[int] = field(default_factory=list)
+    # Timing and results of post-processing stages, keyed by stage name
+    postprocess: Dict[str, Any] = field(default_factory=dict)
     error: Optional[str] = None
+    created_at: float = field(default_factory=time.time)
+    finished_at: Optional[float] = None
 
     def __post_init__(self):
         if self.output_files is None:
             self.output_files = []
 
-jobs_db: Dict[str, VideoJob] = {}
+    def to_dict(self) -> Dict[str, Any]:
+        data = asdict(self)
+        data['status'] = self.status.value
+        return data
 
-def parse_script_to_scenes(script: str, clips_per_minute: int) -> List[Dict[str, Any]]:
-    lines = script.strip().split('\n')
-    non_empty_lines = [line.strip() for line in lines if line.strip()]
-    
-    words_per_minute = 150
-    total_words = sum(len(line.split()) for line in non_empty_lines)
-    duration_minutes = total_words / words_per_minute
-    
-    total_clips = int(duration_minutes * clips_per_minute)
-    if total_clips < 1:
-        total_clips = 1
-    
-    scenes = []
-    lines_per_clip = max(1, len(non_empty_lines) // total_clips)
-    
-    for i in range(0, len(non_empty_lines), lines_per_clip):
-        scene_text = ' '.join(non_empty_lines[i:i+lines_per_clip])
-        scenes.append({
-            'text': scene_text,
-            'index': len(scenes),
-            'total': total_clips
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "VideoJob":
+        known = {f.name for f in fields(cls)}
+        values = {key: value for key, value in data.items() if key in known}
+        values['status'] = JobStatus(values['status'])
+        if 'priority' in values:
+            values['priority'] = JobPriority(values['priority'])
+        return cls(**values)
+
+
+FINISHED_STATUSES = (JobStatus.COMPLETED, JobStatus.FAILED)
+
+
+class JobStore(ABC):
+    """Interface for job persistence.
+
+    Jobs are looked up by id and by status. Callers mutate ``VideoJob`` objects
+    in place and call ``save`` afterwards so durable backends can persist the
+    change; finished jobs are evicted ``JOB_TTL_SECONDS`` after they finish.
+    Listeners added with ``add_listener`` are called on every ``put``/``save``,
+    and those added with ``add_eviction_listener`` after each eviction sweep.
+    """
+
+    def __init__(self):
+        self._listeners: List[Callable[[VideoJob], None]] = []
+        self._eviction_listeners: List[Callable[[List[str]], None]] = []
+
+    def add_listener(self, listener: Callable[[VideoJob], None]) -> None:
+        self._listeners.append(listener)
+
+    def add_eviction_listener(self, listener: Callable[[List[str]], None]) -> None:
+        """Call ``listener`` with the IDs of jobs dropped by TTL eviction."""
+        self._eviction_listeners.append(listener)
+
+    def _notify(self, job: VideoJob) -> None:
+        for listener in self._listeners:
+            listener(job)
+
+    @abstractmethod
+    def get(self, job_id: str) -> Optional[VideoJob]:
+        ...
+
+    @abstractmethod
+    def put(self, job: VideoJob) -> None:
+        ...
+
+    @abstractmethod
+    def save(self, job: VideoJob) -> None:
+        ...
+
+    @abstractmethod
+    def list_by_status(self, status: JobStatus) -> List[VideoJob]:
+        ...
+
+    @abstractmethod
+    def count_by_status(self, status: JobStatus) -> int:
+        ...
+
+    @abstractmethod
+    def list_page(
+        self,
+        status: Optional[JobStatus] = None,
+        created_after: Optional[float] = None,
+        before: Optional[Tuple[float, str]] = None,
+        limit: int = 50
+    ) -> List[VideoJob]:
+        """Newest-first page of jobs created after ``created_after`` and strictly
+        before the ``(created_at, job_id)`` key ``before``."""
+
+    @abstractmethod
+    def evict_expired(self, now: Optional[float] = None) -> List[str]:
+        ...
+
+    @abstractmethod
+    def output_file_lists(self) -> List[List[str]]:
+        """The ``output_files`` of every stored job, so shared files are not deleted under them."""
+
+    async def load(self) -> None:
+        pass
+
+    async def flush(self) -> None:
+        pass
+
+    async def start(self) -> None:
+        await self.load()
+        self._maintenance = asyncio.create_task(self._maintain())
+
+    async def close(self) -> None:
+        maintenance = getattr(self, '_maintenance', None)
+        if maintenance is not None:
+            maintenance.cancel()
+            try:
+                await maintenance
+            except asyncio.CancelledError:
+                pass
+        await self.flush()
+
+    async def _maintain(self) -> None:
+        last_eviction = time.time()
+        while True:
+            await asyncio.sleep(JOB_STORE_FLUSH_SECONDS)
+            try:
+                await self.flush()
+                if time.time() - last_eviction >= JOB_EVICTION_INTERVAL_SECONDS:
+                    last_eviction = time.time()
+                    evicted = self.evict_expired(last_eviction)
+                    if evicted:
+                        logger.info("Evicted expired jobs", {"count": len(evicted)})
+                        for listener in self._eviction_listeners:
+                            listener(evicted)
+            except Exception as maintenance_error:
+                logger.error(f"Job store maintenance failed: {maintenance_error}")
+
+
+class InMemoryJobStore(JobStore):
+    def __init__(self):
+        super().__init__()
+        self._jobs: Dict[str, VideoJob] = {}
+        self._by_status: Dict[JobStatus, Dict[str, VideoJob]] = {status: {} for status in JobStatus}
+        self._indexed_status: Dict[str, JobStatus] = {}
+        # (created_at, job_id) keys sorted ascending, overall and per status, for paging
+        self._created: List[Tuple[float, str]] = []
+        self._created_by_status: Dict[JobStatus, List[Tuple[float, str]]] = {status: [] for status in JobStatus}
+
+    def __len__(self) -> int:
+        return len(self._jobs)
+
+    def get(self, job_id: str) -> Optional[VideoJob]:
+        return self._jobs.get(job_id)
+
+    def put(self, job: VideoJob) -> None:
+        self._jobs[job.job_id] = job
+        self._index(job)
+        self._notify(job)
+
+    def save(self, job: VideoJob) -> None:
+        if self._indexed_status.get(job.job_id) != job.status:
+            self._index(job)
+        self._notify(job)
+
+    def list_by_status(self, status: JobStatus) -> List[VideoJob]:
+        return list(self._by_status[status].values())
+
+    def count_by_status(self, status: JobStatus) -> int:
+        return len(self._by_status[status])
+
+    def list_page(
+        self,
+        status: Optional[JobStatus] = None,
+        created_after: Optional[float] = None,
+        before: Optional[Tuple[float, str]] = None,
+        limit: int = 50
+    ) -> List[VideoJob]:
+        keys = self._created if status is None else self._created_by_status[status]
+        low = bisect.bisect_right(keys, (created_after, '\uffff')) if created_after is not None else 0
+        high = bisect.bisect_left(keys, before) if before is not None else len(keys)
+        return [self._jobs[job_id] for _, job_id in reversed(keys[max(low, high - limit):high])]
+
+    def evict_expired(self, now: Optional[float] = None) -> List[str]:
+        cutoff = (now or time.time()) - JOB_TTL_SECONDS
+        expired = [
+            job.job_id
+            for status in FINISHED_STATUSES
+            for job in self._by_status[status].values()
+            if (job.finished_at or job.created_at) < cutoff
+        ]
+        for job_id in expired:
+            self._remove(job_id)
+        return expired
+
+    def output_file_lists(self) -> List[List[str]]:
+        return [job.output_files for job in self._jobs.values()]
+
+    def _index(self, job: VideoJob) -> None:
+        key = (job.created_at, job.job_id)
+        previous = self._indexed_status.get(job.job_id)
+        if previous is not None:
+            self._by_status[previous].pop(job.job_id, None)
+            _discard_sorted(self._created_by_status[previous], key)
+        else:
+            bisect.insort(self._created, key)
+        self._by_status[job.status][job.job_id] = job
+        bisect.insort(self._created_by_status[job.status], key)
+        self._indexed_status[job.job_id] = job.status
+
+    def _remove(self, job_id: str) -> None:
+        job = self._jobs.pop(job_id, None)
+        status = self._indexed_status.pop(job_id, None)
+        if status is not None:
+            self._by_status[status].pop(job_id, None)
+            if job is not None:
+                key = (job.created_at, job_id)
+                _discard_sorted(self._created_by_status[status], key)
+                _discard_sorted(self._created, key)
+
+
+def _discard_sorted(keys: List[Tuple[float, str]], key: Tuple[float, str]) -> None:
+    position = bisect.bisect_left(keys, key)
+    if position < len(keys) and keys[position] == key:
+        del keys[position]
+
+
+class SQLiteJobStore(InMemoryJobStore):
+    """Durable job store backed by a WAL-mode SQLite database.
+
+    Reads are served from the in-memory index so ``/status`` never touches disk;
+    changes are marked dirty and written in one transaction per flush interval,
+    so per-clip progress updates do not each pay for an fsync.
+    """
+
+    def __init__(self, path: str):
+        super().__init__()
+        self.path = path
+        self._conn: Optional[sqlite3.Connection] = None
+        self._write_lock = threading.Lock()
+        self._dirty: Dict[str, VideoJob] = {}
+        self._deleted: List[str] = []
+
+    def put(self, job: VideoJob) -> None:
+        super().put(job)
+        self._dirty[job.job_id] = job
+
+    def save(self, job: VideoJob) -> None:
+        super().save(job)
+        self._dirty[job.job_id] = job
+
+    def evict_expired(self, now: Optional[float] = None) -> List[str]:
+        expired = super().evict_expired(now)
+        for job_id in expired:
+            self._dirty.pop(job_id, None)
+        self._deleted.extend(expired)
+        return expired
+
+    async def load(self) -> None:
+        rows = await run_fs(self._open)
+        interrupted = 0
+        for row in rows:
+            job = VideoJob.from_dict(json.loads(row))
+            if job.status not in FINISHED_STATUSES:
+                # The coroutine driving this job died with the previous process
+                job.status = JobStatus.FAILED
+                job.error = "Interrupted by API restart"
+                job.finished_at = time.time()
+                self._dirty[job.job_id] = job
+                interrupted += 1
+            super().put(job)
+        self.evict_expired()
+        await self.flush()
+        logger.info("Loaded jobs from SQLite", {"path": self.path, "jobs": len(self), "interrupted": interrupted})
+
+    async def flush(self) -> None:
+        if not (self._dirty or self._deleted) or self._conn is None:
+            return
+        dirty, self._dirty = self._dirty, {}
+        deleted, self._deleted = self._deleted, []
+        # Serialize on the event loop so jobs are not read while being mutated
+        rows = [
+            (job.job_id, job.status.value, job.created_at, job.finished_at, json.dumps(job.to_dict()))
+            for job in dirty.values()
+        ]
+        await run_fs(self._write, rows, deleted)
+
+    async def close(self) -> None:
+        await super().close()
+        if self._conn is not None:
+            with self._write_lock:
+                self._conn.close()
+            self._conn = None
+
+    def _open(self) -> List[str]:
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        with self._conn:
+            self._conn.execute(
+                """CREATE TABLE IF NOT EXISTS jobs (
+                    job_id TEXT PRIMARY KEY,
+                    status TEXT NOT NULL,
+                    created_at REAL NOT NULL,
+                    finished_at REAL,
+                    data TEXT NOT NULL
+                )"""
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs (status, created_at)")
+        return [row[0] for row in self._conn.execute("SELECT data FROM jobs ORDER BY created_at")]
+
+    def _write(self, rows: List[tuple], deleted: List[str]) -> None:
+        with self._write_lock, self._conn:
+            self._conn.executemany("DELETE FROM jobs WHERE job_id = ?", [(job_id,) for job_id in deleted])
+            self._conn.executemany(
+                """INSERT INTO jobs (job_id, status, created_at, finished_at, data)
+                VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT(job_id) DO UPDATE SET
+                    status = excluded.status,
+                    finished_at = excluded.finished_at,
+                    data = excluded.data""",
+                rows
+            )
+
+
+def create_job_store() -> JobStore:
+    if JOB_STORE == "sqlite":
+        return SQLiteJobStore(JOB_STORE_PATH)
+    if JOB_STORE != "memory":
+        raise ValueError(f"Unknown JOB_STORE backend: {JOB_STORE}")
+    return InMemoryJobStore()
+
+
+jobs_db: JobStore = create_job_store()
+
+
+class JobEventHub:
+    """Wakes /status stream subscribers when a job changes.
+
+    Each subscriber holds an ``asyncio.Event`` rather than a queue of messages:
+    a slow client skips intermediate states and reads the latest one, so memory
+    does not grow with the update rate. Per-step sampler progress reported by
+    ComfyUI is kept here too; it is too frequent to write to the job store.
+    """
+
+    def __init__(self):
+        self._subscribers: Dict[str, List[asyncio.Event]] = {}
+        self._steps: Dict[str, Dict[str, Dict[str, Any]]] = {}
+
+    def subscribe(self, job_id: str) -> asyncio.Event:
+        wake = asyncio.Event()
+        self._subscribers.setdefault(job_id, []).append(wake)
+        return wake
+
+    def unsubscribe(self, job_id: str, wake: asyncio.Event) -> None:
+        subscribers = self._subscribers.get(job_id, [])
+        if wake in subscribers:
+            subscribers.remove(wake)
+        if not subscribers:
+            self._subscribers.pop(job_id, None)
+
+    def publish(self, job_id: str) -> None:
+        for wake in self._subscribers.get(job_id, ()):
+            wake.set()
+
+    def step(self, job_id: str, prompt_id: str, node: Optional[str], value: int, maximum: int) -> None:
+        self._steps.setdefault(job_id, {})[prompt_id] = {"node": node, "value": value, "max": maximum}
+        self.publish(job_id)
+
+    def clear_steps(self, job_id: str, prompt_id: str) -> None:
+        steps = self._steps.get(job_id)
+        if steps is not None:
+            steps.pop(prompt_id, None)
+            if not steps:
+                self._steps.pop(job_id, None)
+
+    def steps(self, job_id: str) -> List[Dict[str, Any]]:
+        return [{"prompt_id": prompt_id, **step} for prompt_id, step in self._steps.get(job_id, {}).items()]
+
+
+job_events = JobEventHub()
+jobs_db.add_listener(lambda job: job_events.publish(job.job_id))
+
+class JobTrace:
+    """Timeline spans of one job, see trace_span().
+
+    Traces live in memory next to the job store rather than in the job record,
+    so flushing a job to SQLite never re-serializes thousands of spans.
+    """
+
+    def __init__(self):
+        self.spans: List[Dict[str, Any]] = []
+        self.dropped = 0
+
+
+# Traces of the jobs in jobs_db, dropped when the job is evicted; lost on restart
+# unless exported to TRACE_EXPORT_PATH
+job_traces: Dict[str, JobTrace] = {}
+
+
+def _forget_traces(job_ids: List[str]) -> None:
+    for job_id in job_ids:
+        job_traces.pop(job_id, None)
+
+
+jobs_db.add_eviction_listener(_forget_traces)
+
+# (trace, span id) that new spans are attached to; asyncio tasks inherit it from their creator
+_active_span: ContextVar[Optional[Tuple[JobTrace, str]]] = ContextVar("motion_active_span", default=None)
+
+
+def start_span(name: str, trace: Optional[JobTrace] = None, start: Optional[float] = None, **attributes) -> Optional[Dict[str, Any]]:
+    """Open a span on ``trace`` (or the trace of the active span) as a child of the active span."""
+    active = _active_span.get()
+    if trace is None and active is None:
+        return None
+    parent_id = active[1] if active is not None and (trace is None or active[0] is trace) else None
+    trace = trace or active[0]
+    if len(trace.spans) >= TRACE_MAX_SPANS:
+        trace.dropped += 1
+        return None
+    span = {
+        "span_id": os.urandom(8).hex(),
+        "parent_id": parent_id,
+        "name": name,
+        "start": start if start is not None else time.time(),
+        "end": None,
+        "attributes": attributes,
+    }
+    trace.spans.append(span)
+    return span
+
+
+def end_span(span: Optional[Dict[str, Any]], error: Optional[str] = None, end: Optional[float] = None) -> None:
+    if span is None:
+        return
+    span["end"] = end if end is not None else time.time()
+    if error:
+        span["error"] = error
+
+
+def record_span(name: str, start: float, end: float, **attributes) -> Optional[Dict[str, Any]]:
+    """Add an already finished child span, e.g. one reconstructed from ComfyUI timestamps."""
+    span = start_span(name, start=start, **attributes)
+    end_span(span, end=max(start, end))
+    return span
+
+
+@contextmanager
+def trace_span(name: str, trace: Optional[JobTrace] = None, **attributes):
+    """Time the enclosed block as a span; spans opened inside it become its children."""
+    span = start_span(name, trace=trace, **attributes)
+    token = _active_span.set((trace or _active_span.get()[0], span["span_id"])) if span is not None else None
+    try:
+        yield span
+    except BaseException as e:
+        end_span(span, error=str(e) or type(e).__name__)
+        raise
+    else:
+        end_span(span)
+    finally:
+        if token is not None:
+            _active_span.reset(token)
+
+
+def _trace_id(job_id: str) -> str:
+    return hashlib.sha256(job_id.encode()).hexdigest()[:32]
+
+
+def _otlp_value(value: Any) -> Dict[str, Any]:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+def otlp_trace(job_id: str, trace: JobTrace) -> Dict[str, Any]:
+    """A job's spans as an OTLP/JSON ExportTraceServiceRequest."""
+    trace_id = _trace_id(job_id)
+    spans = []
+    for span in trace.spans:
+        otlp_span = {
+            "traceId": trace_id,
+            "spanId": span["span_id"],
+            "name": span["name"],
+            "kind": 1,
+            "startTimeUnixNano": str(int(span["start"] * 1e9)),
+            "endTimeUnixNano": str(int((span["end"] or span["start"]) * 1e9)),
+            "attributes": [{"key": key, "value": _otlp_value(value)} for key, value in span["attributes"].items()],
+            "status": {"code": 2, "message": span["error"]} if span.get("error") else {"code": 1},
+        }
+        if span["parent_id"]:
+            otlp_span["parentSpanId"] = span["parent_id"]
+        spans.append(otlp_span)
+    return {
+        "resourceSpans": [{
+            "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": "motion-api"}}]},
+            "scopeSpans": [{"scope": {"name": "motion.api_service"}, "spans": spans}],
+        }]
+    }
+
+
+def _append_line(path: str, line: str) -> None:
+    with open(path, 'a', encoding='utf-8') as f:
+        f.write(line + "\n")
+
+
+def _export_line(job_id: str, trace: JobTrace) -> None:
+    _append_line(TRACE_EXPORT_PATH, json.dumps(otlp_trace(job_id, trace), separators=(',', ':')))
+
+
+async def export_trace(job: VideoJob) -> None:
+    trace = job_traces.get(job.job_id)
+    if not TRACE_EXPORT_PATH or trace is None or not trace.spans:
+        return
+    try:
+        # The job is finished, so its spans no longer change while they are encoded off the loop
+        await run_fs(_export_line, job.job_id, trace)
+    except OSError as export_error:
+        logger.warning("Could not export job trace", {"job_id": job.job_id, "error": str(export_error)})
+
+_http_session: Optional[aiohttp.ClientSession] = None
+
+
+def get_http_session() -> aiohttp.ClientSession:
+    """Return the process-wide pooled ComfyUI session.
+
+    The lifespan handler creates it at startup; it is created lazily here too so
+    the job helpers keep working when called outside the application.
+    """
+    global _http_session
+    if _http_session is None or _http_session.closed:
+        connector = aiohttp.TCPConnector(
+            limit=COMFYUI_CONNECTION_LIMIT,
+            limit_per_host=COMFYUI_CONNECTION_LIMIT_PER_HOST,
+            keepalive_timeout=COMFYUI_KEEPALIVE_SECONDS,
+            use_dns_cache=True,
+            ttl_dns_cache=COMFYUI_DNS_CACHE_SECONDS,
+        )
+        _http_session = aiohttp.ClientSession(connector=connector, timeout=AIOHTTP_TIMEOUT)
+    return _http_session
+
+
+async def close_http_session() -> None:
+    global _http_session
+    if _http_session is not None and not _http_session.closed:
+        await _http_session.close()
+    _http_session = None
+
+
+fs_executor = ThreadPoolExecutor(max_workers=FS_WORKERS, thread_name_prefix="motion-fs")
+
+
+async def run_fs(func, *args, **kwargs):
+    """Run a blocking filesystem call on the bounded FS thread pool."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(fs_executor, functools.partial(func, *args, **kwargs))
+
+
+class LoopLagMonitor:
+    """Histogram of event-loop stalls.
+
+    A task sleeps for a fixed interval and records how late it wakes up; the
+    overshoot is how long something held the loop without yielding.
+    """
+
+    def __init__(self, interval: float, buckets: tuple):
+        self.interval = interval
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.samples = 0
+        self.total = 0.0
+        self.max = 0.0
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def close(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def observe(self, lag: float) -> None:
+        self.counts[bisect.bisect_left(self.buckets, lag)] += 1
+        self.samples += 1
+        self.total += lag
+        self.max = max(self.max, lag)
+
+    def snapshot(self) -> Dict[str, Any]:
+        cumulative = 0
+        buckets: Dict[str, int] = {}
+        for bound, count in zip(self.buckets, self.counts):
+            cumulative += count
+            buckets[f"le_{bound}"] = cumulative
+        buckets["le_inf"] = self.samples
+        return {
+            "sample_interval_seconds": self.interval,
+            "samples": self.samples,
+            "mean_lag_seconds": self.total / self.samples if self.samples else None,
+            "max_lag_seconds": self.max,
+            "buckets": buckets,
+        }
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            started = loop.time()
+            await asyncio.sleep(self.interval)
+            self.observe(max(0.0, loop.time() - started - self.interval))
+
+
+loop_lag_monitor = LoopLagMonitor(LOOP_LAG_SAMPLE_SECONDS, LOOP_LAG_BUCKETS)
+
+# Prometheus metrics. Prompt-level series are labelled with the workflow type:
+# "default" for the built-in SDXL scene graph, "custom" for caller-supplied workflows.
+COMFYUI_STAGE_BUCKETS = (0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800, 3600)
+DETECTION_LAG_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2, 5, 10, 30, 60)
+THROUGHPUT_WINDOW_SECONDS = 300
+
+SUBMIT_SECONDS = Histogram(
+    'motion_comfyui_submit_seconds', 'Latency of POST /prompt to ComfyUI', ['workflow_type']
+)
+QUEUE_SECONDS = Histogram(
+    'motion_comfyui_queue_seconds', 'Time a prompt waited in the ComfyUI queue before executing',
+    ['workflow_type'], buckets=COMFYUI_STAGE_BUCKETS
+)
+EXECUTION_SECONDS = Histogram(
+    'motion_comfyui_execution_seconds', 'Time ComfyUI spent executing a prompt',
+    ['workflow_type'], buckets=COMFYUI_STAGE_BUCKETS
+)
+DETECTION_LAG_SECONDS = Histogram(
+    'motion_completion_detection_lag_seconds', 'Delay between ComfyUI finishing a prompt and the API noticing',
+    ['workflow_type'], buckets=DETECTION_LAG_BUCKETS
+)
+COMFYUI_ERRORS = Counter(
+    'motion_comfyui_errors_total', 'Failed prompts per ComfyUI backend',
+    ['backend', 'workflow_type', 'stage']
+)
+PROBE_FAILURES = Counter(
+    'motion_backend_probe_failures_total', 'Failed health probes per ComfyUI backend', ['backend']
+)
+CLIPS_COMPLETED = Counter(
+    'motion_clips_completed_total', 'Clips finished, by where the result came from',
+    ['workflow_type', 'source']
+)
+
+
+class ClipThroughput:
+    """Clip completions per minute over a sliding window."""
+
+    def __init__(self, window: float):
+        self.window = window
+        self._completions: Dict[str, deque] = {}
+
+    def record(self, workflow_type: str) -> None:
+        self._completions.setdefault(workflow_type, deque()).append(time.time())
+
+    def per_minute(self) -> Dict[str, float]:
+        cutoff = time.time() - self.window
+        rates: Dict[str, float] = {}
+        for workflow_type, completions in self._completions.items():
+            while completions and completions[0] < cutoff:
+                completions.popleft()
+            rates[workflow_type] = len(completions) * 60 / self.window
+        return rates
+
+
+clip_throughput = ClipThroughput(THROUGHPUT_WINDOW_SECONDS)
+
+
+def record_clip_completed(workflow_type: str, source: str) -> None:
+    CLIPS_COMPLETED.labels(workflow_type, source).inc()
+    clip_throughput.record(workflow_type)
+
+
+class ServiceStateCollector:
+    """Reports queue depth, job counts, throughput and loop lag at scrape time."""
+
+    def describe(self):
+        # Without this the registry calls collect() at registration, before the scheduler exists
+        return []
+
+    def collect(self):
+        depth = GaugeMetricFamily('motion_job_queue_depth', 'Jobs waiting for a worker')
+        depth.add_metric([], job_scheduler.depth)
+        yield depth
+
+        active = GaugeMetricFamily('motion_job_workers_active', 'Workers currently processing a job')
+        active.add_metric([], job_scheduler.active)
+        yield active
+
+        jobs = GaugeMetricFamily('motion_jobs', 'Jobs in the store by status', labels=['status'])
+        for status in JobStatus:
+            jobs.add_metric([status.value], jobs_db.count_by_status(status))
+        yield jobs
+
+        throughput = GaugeMetricFamily(
+            'motion_clips_per_minute', f'Clips completed per minute over the last {THROUGHPUT_WINDOW_SECONDS}s',
+            labels=['workflow_type']
+        )
+        for workflow_type, rate in clip_throughput.per_minute().items():
+            throughput.add_metric([workflow_type], rate)
+        yield throughput
+
+        backend_queue = GaugeMetricFamily(
+            'motion_backend_load', 'Prompts queued or in flight on each ComfyUI backend', labels=['backend']
+        )
+        for backend in backend_pool.backends:
+            backend_queue.add_metric([backend.name], backend.load)
+        yield backend_queue
+
+        cumulative = 0
+        buckets = []
+        for bound, count in zip(loop_lag_monitor.buckets, loop_lag_monitor.counts):
+            cumulative += count
+            buckets.append((str(bound), cumulative))
+        buckets.append(('+Inf', loop_lag_monitor.samples))
+        lag = HistogramMetricFamily('motion_event_loop_lag_seconds', 'Event-loop stalls')
+        lag.add_metric([], buckets, sum_value=loop_lag_monitor.total)
+        yield lag
+
+
+REGISTRY.register(ServiceStateCollector())
+
+# Scripts end a sentence at terminal punctuation, optionally followed by closing quotes or brackets
+_SENTENCE_END = re.compile(r'[.!?…]["\'”’)\]]*$')
+# Last characters worth running _SENTENCE_END on; most words end in a letter and skip the regex
+_SENTENCE_END_CHARS = frozenset('.!?…"\'”’)]')
+# SRT ("00:00:01,000 --> 00:00:04,000") and WebVTT ("00:01.000 --> 00:04.000 align:start") cue timings
+_CUE_TIMING = re.compile(r'^\s*((?:\d+:)?\d{1,2}:\d{2}[.,]\d{1,3})\s*-->\s*((?:\d+:)?\d{1,2}:\d{2}[.,]\d{1,3})')
+_CUE_MARKUP = re.compile(r'<[^>]*>|\{\\[^}]*\}')
+_VTT_SKIPPED_BLOCKS = ('NOTE', 'STYLE', 'REGION')
+# Enough of an unterminated first line to tell a WEBVTT header or cue timing from prose
+FORMAT_SNIFF_CHARS = 64
+# Scene k ends at a sentence or cue within this fraction of a scene of k * 60 / clips_per_minute,
+# so scenes run half to one and a half target lengths
+SCENE_WINDOW_FRACTION = 0.25
+
+
+def _cue_seconds(timestamp: str) -> float:
+    seconds = 0.0
+    for part in timestamp.replace(',', '.').split(':'):
+        seconds = seconds * 60 + float(part)
+    return seconds
+
+
+class SceneSegmenter:
+    """Split a script into scenes of about ``60 / clips_per_minute`` seconds of narration.
+
+    Text is fed in chunks and ``feed()``/``close()`` return the scenes completed so
+    far, so rendering can start before the whole script has been read. Plain text
+    is timed at ``words_per_minute``; SRT and WebVTT scripts are timed from their
+    cues. Input is consumed a line (or a word) at a time, so time and memory are
+    linear in the script length.
+
+    Scenes are made of units: sentences (or lines) of plain text, and cues.
+    A script of D seconds yields ``round(D / scene_seconds)`` scenes, at least
+    one: scene k ends within a window of SCENE_WINDOW_FRACTION scenes around
+    ``k * scene_seconds``, at the unit in that window whose text hashes lowest,
+    preferring whole sentences and cues over pieces of them. The choice depends
+    on the text rather than its position, so an edit leaves most cuts after it
+    where they were, which the per-scene result cache relies on. A window
+    without a unit end, such as one inside a long silence between cues, falls
+    back to the nearest one. Units longer than a window are split between
+    words, so plain text always has one. A scene is returned once the script
+    runs half a scene past its end, which is when the count is known to
+    include it.
+    """
+
+    def __init__(self, clips_per_minute: int, words_per_minute: Optional[float] = None):
+        self.scene_seconds = 60.0 / clips_per_minute
+        self.seconds_per_word = 60.0 / (words_per_minute or SCENE_WORDS_PER_MINUTE)
+        self._window_seconds = self.scene_seconds * SCENE_WINDOW_FRACTION
+        # Longest run of words kept as one unit when a sentence never ends
+        self._max_sentence_words = max(1, int(self.scene_seconds / self.seconds_per_word))
+        self._format: Optional[str] = None  # "text" or "cues", decided by the first meaningful line
+        self._head: List[str] = []  # lines read before the format was known
+        self._partial = ''  # unterminated last line (cues) or last word (text)
+        self._ready: List[Dict[str, Any]] = []
+        # Plain text
+        self._sentence: List[str] = []
+        self._words_read = 0  # times are computed from it so long scripts do not accumulate rounding
+        # Cues
+        self._cue: Optional[Tuple[float, float]] = None
+        self._cue_lines: List[str] = []
+        self._skipping_block = False
+        # Units since the last cut, as (text, start, end, whole sentence or cue)
+        self._origin: Optional[float] = None
+        self._pending: List[Tuple[str, float, float, bool]] = []
+        # Scenes already cut, waiting until the script is known to be long enough for them
+        self._closed: List[List[Tuple[str, float, float, bool]]] = []
+        self._cuts = 0
+        # Start time from which a unit settles the next scene's end
+        self._cut_after = math.inf
+        self._emitted = 0
+
+    def feed(self, text: str) -> List[Dict[str, Any]]:
+        """Consume the next chunk of the script and return the scenes it completed."""
+        lines = text.split('\n')
+        lines[0] = self._partial + lines[0]
+        self._partial = lines.pop()
+        for line in lines:
+            self._line(line)
+        if self._format is None and len(self._partial) >= FORMAT_SNIFF_CHARS:
+            # A long first line without a break yet: its start already tells cues from prose
+            self._start_format('cues' if self._is_cue_header(self._partial.strip()) else 'text')
+        if self._format == 'text' and self._partial:
+            # Consume all but the last (possibly cut-off) word, so one endless line is not re-buffered per chunk
+            words = self._partial.split()
+            if words and not self._partial[-1].isspace():
+                self._partial = words.pop()
+            else:
+                self._partial = ''
+            self._words_in(words)
+        return self._take()
+
+    def close(self) -> List[Dict[str, Any]]:
+        """Finish the script and return the remaining scenes."""
+        if self._partial:
+            self._line(self._partial)
+            self._partial = ''
+        if self._format is None and self._head:
+            self._start_format('text')
+        if self._format == 'text':
+            self._end_sentence()
+        else:
+            self._end_cue()
+        if self._origin is None:
+            return self._take()
+
+        last = self._pending[-1] if self._pending else self._closed[-1][-1]
+        total = max(1, round((last[2] - self._origin) / self.scene_seconds))
+        # At most one cut is past the count, when the script ended within half a scene of it
+        while self._cuts > total - 1:
+            self._pending = self._closed.pop() + self._pending
+            self._cuts -= 1
+        # Windows the script ended inside
+        while self._cuts < total - 1 and self._cut():
+            pass
+        for units in self._closed:
+            self._emit(units)
+        self._closed = []
+        self._emit(self._pending)
+        self._pending = []
+        return self._take()
+
+    def _take(self) -> List[Dict[str, Any]]:
+        ready, self._ready = self._ready, []
+        return ready
+
+    def _line(self, line: str) -> None:
+        if self._format is None:
+            stripped = line.strip()
+            self._head.append(line)
+            if not stripped or stripped.isdigit():
+                # Blank, or possibly an SRT cue number; the next line decides
+                return
+            self._start_format('cues' if self._is_cue_header(stripped) else 'text')
+            return
+        if self._format == 'text':
+            self._words_in(line.split())
+            self._end_sentence()
+        else:
+            self._cue_line(line.strip())
+
+    @staticmethod
+    def _is_cue_header(line: str) -> bool:
+        return line.startswith('WEBVTT') or _CUE_TIMING.match(line) is not None
+
+    def _start_format(self, kind: str) -> None:
+        self._format = kind
+        head, self._head = self._head, []
+        for line in head:
+            self._line(line)
+
+    # Plain text: sentences timed by word count
+
+    def _words_in(self, words: List[str]) -> None:
+        sentence = self._sentence
+        for word in words:
+            sentence.append(word)
+            if word[-1] in _SENTENCE_END_CHARS and _SENTENCE_END.search(word):
+                self._end_sentence()
+                sentence = self._sentence
+            elif len(sentence) >= self._max_sentence_words:
+                self._end_sentence(whole=False)
+                sentence = self._sentence
+
+    def _end_sentence(self, whole: bool = True) -> None:
+        if not self._sentence:
+            return
+        start = self._words_read * self.seconds_per_word
+        self._words_read += len(self._sentence)
+        sentence, self._sentence = self._sentence, []
+        self._unit(sentence, start, self._words_read * self.seconds_per_word, whole)
+
+    # SRT / WebVTT: one unit per cue, timed by the cue
+
+    def _cue_line(self, line: str) -> None:
+        if not line:
+            self._end_cue()
+            self._skipping_block = False
+            return
+        if self._skipping_block:
+            return
+        timing = _CUE_TIMING.match(line)
+        if timing:
+            self._end_cue()
+            self._cue = (_cue_seconds(timing.group(1)), _cue_seconds(timing.group(2)))
+        elif self._cue is not None:
+            self._cue_lines.append(_CUE_MARKUP.sub('', line))
+        elif line.startswith('WEBVTT') or line.split(' ', 1)[0] in _VTT_SKIPPED_BLOCKS:
+            self._skipping_block = True
+        # Anything else outside a cue is a cue number or identifier
+
+    def _end_cue(self) -> None:
+        if self._cue is None:
+            return
+        words = ' '.join(self._cue_lines).split()
+        start, end = self._cue
+        self._cue = None
+        self._cue_lines = []
+        if words:
+            self._unit(words, start, max(end, start))
+
+    # Scene assembly
+
+    def _unit(self, words: List[str], start: float, end: float, whole: bool = True) -> None:
+        if self._origin is None:
+            self._origin = start
+            self._cut_after = start + self.scene_seconds + self._window_seconds
+        window = 2 * self._window_seconds
+        if end - start <= window or len(words) == 1:
+            self._add((' '.join(words), start, end, whole))
+            return
+        # Longer than a window: split between words into even pieces no longer than one
+        per_word = (end - start) / len(words)
+        pieces = math.ceil(len(words) / max(1, int(window / per_word)))
+        size = math.ceil(len(words) / pieces)
+        for offset in range(0, len(words), size):
+            piece = words[offset:offset + size]
+            piece_start = start + offset * per_word
+            last = offset + size >= len(words)
+            self._add((' '.join(piece), piece_start, piece_start + len(piece) * per_word, whole and last))
+
+    def _add(self, unit: Tuple[str, float, float, bool]) -> None:
+        self._pending.append(unit)
+        # Every unit end in a window that this unit starts after is known
+        while unit[1] >= self._cut_after and self._cut():
+            pass
+        # The count only grows as the script does, so once it includes a cut the scene before it is final
+        while self._closed and round((unit[2] - self._origin) / self.scene_seconds) >= self._emitted + 2:
+            self._emit(self._closed.pop(0))
+
+    def _cut(self) -> bool:
+        """Cut the pending units at the next scene's end; False if no unit end is followed by another."""
+        boundary = self._origin + (self._cuts + 1) * self.scene_seconds
+        best: Optional[tuple] = None
+        position = -1
+        pending = self._pending
+        for i in range(len(pending) - 1):
+            text, _, end, whole = pending[i]
+            # A unit end spans any silence up to the next unit
+            distance = max(0.0, end - boundary, boundary - pending[i + 1][1])
+            if distance <= self._window_seconds:
+                # Deterministic in the unit's text, so the same sentence ends a scene wherever it falls
+                key = (0, not whole, zlib.crc32(text.encode()))
+            else:
+                key = (1, distance, 0)
+            if best is None or key < best:
+                best, position = key, i
+        if best is None:
+            return False
+        self._closed.append(pending[:position + 1])
+        self._pending = pending[position + 1:]
+        self._cuts += 1
+        self._cut_after = boundary + self.scene_seconds + self._window_seconds
+        return True
+
+    def _emit(self, units: List[Tuple[str, float, float, bool]]) -> None:
+        self._ready.append({
+            'text': ' '.join(unit[0] for unit in units),
+            'start': round(units[0][1], 3),
+            'end': round(units[-1][2], 3),
+            'index': self._emitted,
         })
-    
-    return scenes[:total_clips]
+        self._emitted += 1
+
+
+def iter_script_chunks(script: str, chunk_chars: int = SCRIPT_CHUNK_CHARS):
+    for offset in range(0, len(script), chunk_chars):
+        yield script[offset:offset + chunk_chars]
+
+
+def parse_script_to_scenes(
+    script: str, clips_per_minute: int, words_per_minute: Optional[float] = None
+) -> List[Dict[str, Any]]:
+    segmenter = SceneSegmenter(clips_per_minute, words_per_minute)
+    scenes: List[Dict[str, Any]] = []
+    for chunk in iter_script_chunks(script):
+        scenes.extend(segmenter.feed(chunk))
+    scenes.extend(segmenter.close())
+    for scene in scenes:
+        scene['total'] = len(scenes)
+    return scenes
+
+
+async def iter_scenes(
+    chunks: AsyncIterator[str], clips_per_minute: int, words_per_minute: Optional[float] = None
+) -> AsyncIterator[Dict[str, Any]]:
+    """Scenes of a script that arrives in chunks, as soon as each one is complete."""
+    segmenter = SceneSegmenter(clips_per_minute, words_per_minute)
+    async for chunk in chunks:
+        for scene in segmenter.feed(chunk):
+            yield scene
+    for scene in segmenter.close():
+        yield scene
+
+
+async def _script_chunks(script: str) -> AsyncIterator[str]:
+    for chunk in iter_script_chunks(script):
+        yield chunk
+        # Let renders of the first scenes start while a long script is still being segmented
+        await asyncio.sleep(0)
+
+
+class ScriptUploadError(Exception):
+    pass
+
+
+class ScriptUpload:
+    """Hands the script of a ``/generate/stream`` job from the upload to the job.
+
+    The request handler puts text as it is decoded (or, for NDJSON, one scene
+    text per line) and finally closes or fails the upload. The job reads scenes
+    from it concurrently, so the first scenes render while the rest is still
+    being uploaded. Items are buffered until read, so a job that is still queued
+    misses nothing.
+    """
+
+    def __init__(self, scene_lines: bool):
+        self.scene_lines = scene_lines
+        self._items: asyncio.Queue = asyncio.Queue()
+        self._parts: List[str] = []
+
+    def put(self, text: str) -> None:
+        self._parts.append(text)
+        self._items.put_nowait(text)
+
+    def close(self) -> str:
+        """End the upload and return the whole script."""
+        self._items.put_nowait(None)
+        return ('\n' if self.scene_lines else '').join(self._parts)
+
+    def fail(self, error: str) -> None:
+        self._items.put_nowait(ScriptUploadError(error))
+
+    async def _texts(self) -> AsyncIterator[str]:
+        while True:
+            item = await self._items.get()
+            if item is None:
+                return
+            if isinstance(item, ScriptUploadError):
+                raise item
+            yield item
+
+    async def scenes(self, clips_per_minute: int, words_per_minute: Optional[float] = None) -> AsyncIterator[Dict[str, Any]]:
+        if not self.scene_lines:
+            async for scene in iter_scenes(self._texts(), clips_per_minute, words_per_minute):
+                yield scene
+            return
+        index = 0
+        async for text in self._texts():
+            yield {'text': text, 'index': index}
+            index += 1
+
+
+# Uploads of /generate/stream jobs, until the job picks them up
+script_uploads: Dict[str, ScriptUpload] = {}
+
+
+def _output_entries(output: Dict[str, Any]) -> List[Dict[str, Any]]:
+    entries: List[Dict[str, Any]] = []
+    if 'images' in output and isinstance(output['images'], list):
+        entries.extend(output['images'])
+    if 'files' in output and isinstance(output['files'], list):
+        entries.extend(output['files'])
+    if 'videos' in output and isinstance(output['videos'], list):
+        entries.extend(output['videos'])
+    return entries
+
+
+OUTPUT_SUMMARY_KINDS = ('images', 'files', 'videos')
+
+
+def summarize_outputs(outputs: Dict[str, Any]) -> Dict[str, Any]:
+    """Reduce ComfyUI history outputs to filename/subfolder/type per node, for logging."""
+    summary: Dict[str, Any] = {}
+    for node_id, output in outputs.items():
+        node_summary: Dict[str, Any] = {}
+        for kind in OUTPUT_SUMMARY_KINDS:
+            if kind in output:
+                node_summary[kind] = [
+                    {
+                        'filename': entry.get('filename'),
+                        'subfolder': entry.get('subfolder'),
+                        'type': entry.get('type')
+                    }
+                    for entry in output[kind]
+                ]
+        summary[node_id] = node_summary
+    return summary
+
+
+def _output_relative_path(entry: Dict[str, Any]) -> str:
+    filename = entry.get('filename')
+    subfolder = (entry.get('subfolder') or '').strip('/')
+    return f"output/{filename}" if not subfolder else f"output/{subfolder}/{filename}"
+
+
+def _output_path(relative_path: str) -> Path:
+    """Map an ``output/...`` path as reported to clients onto OUTPUT_DIR."""
+    return OUTPUT_DIR / relative_path.split('/', 1)[1]
+
+
+class OutputIndex:
+    """Sorted index of the files under OUTPUT_DIR, keyed by path relative to it.
+
+    Files from ComfyUI ``subfolder``s are keyed as ``subfolder/filename``, so a
+    ``filename_prefix`` lookup (which may itself contain a subfolder) is a bisect
+    over the sorted keys rather than a directory glob. The index is built once at
+    startup and then kept current from filesystem change events; without a
+    watcher it is not trusted and lookups fall back to scanning.
+    """
+
+    def __init__(self, root: Path):
+        self.root = root
+        self.live = False
+        self._paths: List[str] = []
+        self._mtimes: Dict[str, float] = {}
+        self._watch_task: Optional[asyncio.Task] = None
+        self._stop_watching: Optional[asyncio.Event] = None
+        # Changes seen while the initial walk runs, replayed over its result
+        self._buffered: Optional[List[Tuple[str, Optional[float]]]] = None
+
+    def __len__(self) -> int:
+        return len(self._paths)
+
+    def add(self, relative: str, mtime: float) -> None:
+        if relative not in self._mtimes:
+            bisect.insort(self._paths, relative)
+        self._mtimes[relative] = mtime
+
+    def remove(self, relative: str) -> None:
+        if self._mtimes.pop(relative, None) is not None:
+            position = bisect.bisect_left(self._paths, relative)
+            if position < len(self._paths) and self._paths[position] == relative:
+                del self._paths[position]
+
+    def lookup(self, prefix: str, since: float = 0.0) -> List[str]:
+        """Relative paths starting with ``prefix`` modified at or after ``since``."""
+        matches: List[str] = []
+        position = bisect.bisect_left(self._paths, prefix)
+        while position < len(self._paths) and self._paths[position].startswith(prefix):
+            relative = self._paths[position]
+            if self._mtimes[relative] >= since:
+                matches.append(relative)
+            position += 1
+        return matches
+
+    async def start(self) -> None:
+        if awatch is not None:
+            # Watch before the initial walk so files changed during it are not missed. The
+            # walk may list a file the watcher has already seen deleted, so its changes are
+            # held back and applied after the walk's result
+            self._buffered = []
+            self._stop_watching = asyncio.Event()
+            self._watch_task = asyncio.create_task(self._watch())
+        built = await run_fs(self._scan)
+        self._mtimes.update(built)
+        self._paths = sorted(self._mtimes)
+        buffered, self._buffered = self._buffered or [], None
+        for relative, mtime in buffered:
+            self._apply(relative, mtime)
+        self.live = awatch is not None
+        logger.info("Indexed output directory", {"files": len(self._paths), "live": self.live})
+
+    async def close(self) -> None:
+        self.live = False
+        if self._watch_task is not None:
+            # Let the watcher thread notice the stop event instead of abandoning it mid-poll
+            self._stop_watching.set()
+            try:
+                await asyncio.wait_for(self._watch_task, timeout=5)
+            except (asyncio.CancelledError, asyncio.TimeoutError):
+                pass
+            self._watch_task = None
+
+    def _relative(self, path: str) -> Optional[str]:
+        relative = os.path.relpath(path, self.root).replace(os.sep, '/')
+        if relative.startswith('..') or any(part.startswith('.') for part in relative.split('/')):
+            return None
+        return relative
+
+    def _scan(self) -> Dict[str, float]:
+        found: Dict[str, float] = {}
+        for directory, subdirectories, filenames in os.walk(self.root):
+            subdirectories[:] = [name for name in subdirectories if not name.startswith('.')]
+            for filename in filenames:
+                path = os.path.join(directory, filename)
+                relative = self._relative(path)
+                if relative is None:
+                    continue
+                try:
+                    found[relative] = os.stat(path).st_mtime
+                except FileNotFoundError:
+                    continue
+        return found
 
+    def _apply(self, relative: str, mtime: Optional[float]) -> None:
+        if mtime is None:
+            self.remove(relative)
+        else:
+            self.add(relative, mtime)
+
+    def _stat_changes(self, changes: List[tuple]) -> List[tuple]:
+        updates: List[tuple] = []
+        for change, path in changes:
+            relative = self._relative(path)
+            if relative is None:
+                continue
+            if change == Change.deleted:
+                updates.append((relative, None))
+                continue
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                updates.append((relative, None))
+                continue
+            if not os.path.isdir(path):
+                updates.append((relative, stat.st_mtime))
+        return updates
+
+    async def _watch(self) -> None:
+        try:
+            async for changes in awatch(self.root, recursive=True, stop_event=self._stop_watching):
+                for relative, mtime in await run_fs(self._stat_changes, list(changes)):
+                    if self._buffered is not None:
+                        self._buffered.append((relative, mtime))
+                    else:
+                        self._apply(relative, mtime)
+        except asyncio.CancelledError:
+            raise
+        except Exception as watch_error:
+            self.live = False
+            logger.warning("Output directory watcher stopped; falling back to scans", {"error": str(watch_error)})
+
+
+output_index = OutputIndex(OUTPUT_DIR)
+
+
+def _collect_outputs_from_disk(workflow: Optional[Dict[str, Any]], job_start: float) -> List[str]:
+    prefixes: List[str] = []
+    if workflow:
+        for node in workflow.values():
+            inputs = node.get('inputs', {}) if isinstance(node, dict) else {}
+            prefix = inputs.get('filename_prefix')
+            if isinstance(prefix, str) and prefix:
+                prefixes.append(prefix)
+
+    if not prefixes:
+        prefixes.append('motion_api_fast_broll')
+
+    collected: List[str] = []
+    cutoff = job_start - 5
+    for prefix in prefixes:
+        if output_index.live:
+            matches = output_index.lookup(prefix, since=cutoff)
+        else:
+            matches = []
+            for path in OUTPUT_DIR.glob(f"{prefix}*"):
+                try:
+                    mtime = path.stat().st_mtime
+                except FileNotFoundError:
+                    continue
+                if path.is_file() and mtime >= cutoff:
+                    matches.append(path.relative_to(OUTPUT_DIR).as_posix())
+
+        for relative in matches:
+            rel = f"output/{relative}"
+            if rel not in collected:
+                collected.append(rel)
+
+    return sorted(collected)
+
+
+async def collect_outputs_from_disk(workflow: Optional[Dict[str, Any]], job_start: float) -> List[str]:
+    if output_index.live:
+        # Index lookups only; nothing here touches the disk
+        return _collect_outputs_from_disk(workflow, job_start)
+    return await run_fs(_collect_outputs_from_disk, workflow, job_start)
+
+DEFAULT_CHECKPOINT = "SDXL/sd_xl_base_1.0_0.9vae.safetensors"
+
+
+def scene_seed(scene: Dict[str, Any]) -> int:
+    """Sampler seed derived from the scene's text, so a scene renders the same wherever it lands in a script.
+
+    Scene text is already whitespace-normalized by the segmenter.
+    """
+    return int.from_bytes(hashlib.sha256(scene['text'].encode()).digest()[:4], 'big')
+
+
+# The built-in SDXL scene graph, compiled once; create_video_workflow() fills its slots per scene
+DEFAULT_WORKFLOW = WorkflowTemplate(
+    {
+        "1": {
+            "class_type": "CheckpointLoaderSimple",
+            "inputs": {
+                "ckpt_name": DEFAULT_CHECKPOINT
+            }
+        },
+        "2": {
+            "class_type": "CLIPTextEncode",
+            "inputs": {
+                "text": "",
+                "clip": ["1", 1]
+            }
+        },
+        "3": {
+            "class_type": "CLIPTextEncode",
+            "inputs": {
+                "text": "blurry, low quality, distorted, ugly",
+                "clip": ["1", 1]
+            }
+        },
+        "4": {
+            "class_type": "EmptyLatentImage",
+            "inputs": {
+                "width": 512,
+                "height": 512,
+                "batch_size": 1
+            }
+        },
+        "5": {
+            "class_type": "KSampler",
+            "inputs": {
+                "seed": 0,
+                "steps": 20,
+                "cfg": 7.0,
+                "sampler_name": "euler",
+                "scheduler": "normal",
+                "denoise": 1.0,
+                "model": ["1", 0],
+                "positive": ["2", 0],
+                "negative": ["3", 0],
+                "latent_image": ["4", 0]
+            }
+        },
+        "6": {
+            "class_type": "VAEDecode",
+            "inputs": {
+                "samples": ["5", 0],
+                "vae": ["1", 2]
+            }
+        },
+        "7": {
+            "class_type": "SaveAnimatedWEBP",
+            "inputs": {
+                "filename_prefix": "motion_scene",
+                "fps": 8,
+                "lossless": False,
+                "quality": 80,
+                "method": "default",
+                "images": ["6", 0]
+            }
+        }
+    },
+    {
+        "prompt": [("2", "text")],
+        "width": [("4", "width")],
+        "height": [("4", "height")],
+        "length": [("4", "batch_size")],
+        "seed": [("5", "seed")],
+        "fps": [("7", "fps")],
+        "filename_prefix": [("7", "filename_prefix")],
+    },
+    name="default SDXL workflow",
+)
+
+
+def create_video_workflow(scene: Dict[str, Any], style: str, resolution: str, fps: int, duration: float) -> Dict:
+    width, height = map(int, resolution.split('x'))
+    return DEFAULT_WORKFLOW.render(
+        prompt=f"{style} video scene: {scene['text']}",
+        width=width,
+        height=height,
+        length=int(fps * duration),
+        seed=scene_seed(scene),
+        fps=fps,
+        filename_prefix=f"motion_scene_{scene['index']:03d}",
+    )
+
+class ComfyUIEventStream:
+    """Long-lived subscriber to ComfyUI's ``/ws`` event feed.
+
+    Prompts are queued with this stream's ``client_id`` so ComfyUI routes their
+    execution events here. ``executing``/``executed``/``execution_error`` events
+    are dispatched to the future registered for each prompt; the future resolves
+    to ``None`` on success or to an error message on failure.
+    """
+
+    # Terminal events for prompts nobody has registered yet (e.g. fully cached
+    # prompts that finish before the POST /prompt response is processed)
+    MAX_UNCLAIMED = 1024
+
+    def __init__(self, base_url: str):
+        self.base_url = base_url
+        self.client_id = str(uuid.uuid4())
+        self.connected = False
+        self._waiters: Dict[str, asyncio.Future] = {}
+        self._outputs: Dict[str, Dict[str, Any]] = {}
+        self._progress: Dict[str, Callable[[Optional[str], int, int], None]] = {}
+        # (node, arrival time) of each executing event, for per-node trace spans
+        self._timelines: Dict[str, List[Tuple[Optional[str], float]]] = {}
+        self._cached_nodes: Dict[str, List[str]] = {}
+        self._unclaimed: "OrderedDict[str, Optional[str]]" = OrderedDict()
+        self._disconnected: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def ws_url(self) -> str:
+        scheme, rest = self.base_url.split("://", 1)
+        ws_scheme = "wss" if scheme == "https" else "ws"
+        return f"{ws_scheme}://{rest}/ws?clientId={self.client_id}"
+
+    def ensure_started(self) -> None:
+        if self._task is None or self._task.done():
+            self._disconnected = asyncio.Event()
+            self._disconnected.set()
+            self._task = asyncio.create_task(self._run())
+
+    async def close(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        self.connected = False
+
+    def register(
+        self, prompt_id: str, on_progress: Optional[Callable[[Optional[str], int, int], None]] = None
+    ) -> asyncio.Future:
+        """Future for a prompt's completion; ``on_progress(node, value, max)`` receives sampler steps."""
+        future = asyncio.get_running_loop().create_future()
+        if on_progress is not None:
+            self._progress[prompt_id] = on_progress
+        if prompt_id in self._unclaimed:
+            future.set_result(self._unclaimed.pop(prompt_id))
+        else:
+            self._waiters[prompt_id] = future
+        return future
+
+    def discard(self, prompt_id: str) -> None:
+        self._waiters.pop(prompt_id, None)
+        self._outputs.pop(prompt_id, None)
+        self._progress.pop(prompt_id, None)
+        self._timelines.pop(prompt_id, None)
+        self._cached_nodes.pop(prompt_id, None)
+
+    def outputs(self, prompt_id: str) -> Dict[str, Any]:
+        return dict(self._outputs.get(prompt_id, {}))
+
+    def timeline(self, prompt_id: str) -> Tuple[List[Tuple[Optional[str], float]], List[str]]:
+        """Executing events seen for a registered prompt, and the nodes ComfyUI served from its cache."""
+        return list(self._timelines.get(prompt_id, [])), list(self._cached_nodes.get(prompt_id, []))
+
+    async def wait(self, future: asyncio.Future, timeout: float) -> None:
+        """Wait until the future resolves, the timeout expires or the socket drops."""
+        if not self.connected or self._disconnected is None:
+            await asyncio.wait({future}, timeout=timeout)
+            return
+
+        dropped = asyncio.ensure_future(self._disconnected.wait())
+        try:
+            await asyncio.wait({future, dropped}, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            dropped.cancel()
+
+    async def _run(self) -> None:
+        # The socket lives for the whole process, so it gets its own session without
+        # the pooled session's total timeout
+        timeout = aiohttp.ClientTimeout(total=None, sock_connect=10)
+        outage_logged = False
+        while True:
+            try:
+                async with aiohttp.ClientSession(timeout=timeout) as session:
+                    async with session.ws_connect(self.ws_url, heartbeat=WS_HEARTBEAT_SECONDS) as ws:
+                        self.connected = True
+                        self._disconnected.clear()
+                        logger.info("Connected to ComfyUI event stream", {"url": self.ws_url})
+                        async for msg in ws:
+                            if msg.type == aiohttp.WSMsgType.TEXT:
+                                self._dispatch(msg.data)
+                            elif msg.type == aiohttp.WSMsgType.ERROR:
+                                break
+            except asyncio.CancelledError:
+                raise
+            except Exception as stream_error:
+                # Warn once per outage rather than on every reconnect attempt
+                log = logger.warning if self.connected or not outage_logged else logger.debug
+                log(
+                    "ComfyUI event stream unavailable; falling back to history polling",
+                    {"url": self.ws_url, "error": str(stream_error)}
+                )
+                outage_logged = True
+            else:
+                outage_logged = False
+            finally:
+                self.connected = False
+                self._disconnected.set()
+
+            await asyncio.sleep(WS_RECONNECT_DELAY_SECONDS)
+
+    def _dispatch(self, raw: str) -> None:
+        try:
+            message = json.loads(raw)
+        except ValueError:
+            return
+
+        msg_type = message.get('type')
+        data = message.get('data') or {}
+        prompt_id = data.get('prompt_id')
+        if not prompt_id:
+            return
+
+        if msg_type == 'progress':
+            on_progress = self._progress.get(prompt_id)
+            if on_progress is not None:
+                on_progress(data.get('node'), data.get('value', 0), data.get('max', 0))
+        elif msg_type == 'executed':
+            output = data.get('output')
+            if prompt_id in self._waiters and isinstance(output, dict):
+                self._outputs.setdefault(prompt_id, {})[str(data.get('node'))] = output
+        elif msg_type == 'execution_cached':
+            if prompt_id in self._waiters:
+                self._cached_nodes[prompt_id] = [str(node) for node in data.get('nodes') or []]
+        elif msg_type == 'executing':
+            if prompt_id in self._waiters:
+                node = data.get('node')
+                self._timelines.setdefault(prompt_id, []).append((None if node is None else str(node), time.time()))
+            # ComfyUI signals the end of a prompt with an executing event for node None
+            if data.get('node') is None:
+                self._finish(prompt_id, None)
+        elif msg_type == 'execution_success':
+            self._finish(prompt_id, None)
+        elif msg_type == 'execution_error':
+            self._finish(
+                prompt_id,
+                f"{data.get('node_type', 'unknown')} node {data.get('node_id')} failed: "
+                f"{data.get('exception_message', 'unknown error')}"
+            )
+        elif msg_type == 'execution_interrupted':
+            self._finish(prompt_id, "Execution interrupted")
+
+    def _finish(self, prompt_id: str, error: Optional[str]) -> None:
+        future = self._waiters.get(prompt_id)
+        if future is not None:
+            if not future.done():
+                future.set_result(error)
+            return
+
+        # Keep the first terminal event; a trailing "executing: None" must not mask an error
+        if prompt_id not in self._unclaimed:
+            self._unclaimed[prompt_id] = error
+            while len(self._unclaimed) > self.MAX_UNCLAIMED:
+                self._unclaimed.popitem(last=False)
+
+
+# Loader nodes whose inputs decide which weights ComfyUI must hold in memory
+MODEL_LOADER_INPUTS = {
+    'CheckpointLoaderSimple': ('ckpt_name',),
+    'UNETLoader': ('unet_name', 'weight_dtype'),
+    'VAELoader': ('vae_name',),
+    'DualCLIPLoader': ('clip_name1', 'clip_name2', 'type'),
+}
+
+
+def model_fingerprint(workflow: Dict[str, Any]) -> str:
+    """Identify the set of models a workflow loads, independent of node IDs and order."""
+    loaders = sorted(
+        f"{node['class_type']}:" + "|".join(str(node.get('inputs', {}).get(name)) for name in names)
+        for node in workflow.values()
+        if isinstance(node, dict)
+        for names in [MODEL_LOADER_INPUTS.get(node.get('class_type'))]
+        if names
+    )
+    return hashlib.sha1("\n".join(loaders).encode()).hexdigest()[:16]
+
+
+class ComfyUIBackend:
+    """One ComfyUI node: its event stream plus the load and health we track for routing."""
+
+    def __init__(self, name: str, url: str):
+        self.name = name
+        self.url = url.rstrip('/')
+        self.events = ComfyUIEventStream(self.url)
+        self.healthy = True
+        self.consecutive_failures = 0
+        self.last_error: Optional[str] = None
+        self.last_probe: Optional[float] = None
+        # Prompts on the node's queue at the last probe (all clients) and prompts we have in flight
+        self.queue_depth = 0
+        self.in_flight = 0
+        self.vram_free: Optional[int] = None
+        self.vram_total: Optional[int] = None
+        # Model fingerprint of the last prompt sent here; ComfyUI holds these once its queue drains
+        self.loaded_models: Optional[str] = None
+
+    @property
+    def load(self) -> int:
+        return max(self.queue_depth, self.in_flight)
+
+    def record_success(self) -> None:
+        self.consecutive_failures = 0
+        self.last_error = None
+
+    def record_failure(self, error: str) -> None:
+        self.consecutive_failures += 1
+        self.last_error = error
+        if self.healthy and self.consecutive_failures >= COMFYUI_BACKEND_MAX_FAILURES:
+            self.healthy = False
+            logger.warning(
+                "Ejected ComfyUI backend after repeated failures",
+                {"backend": self.name, "failures": self.consecutive_failures, "error": error}
+            )
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "url": self.url,
+            "healthy": self.healthy,
+            "event_stream": "connected" if self.events.connected else "disconnected",
+            "queue_depth": self.queue_depth,
+            "in_flight": self.in_flight,
+            "vram_free": self.vram_free,
+            "vram_total": self.vram_total,
+            "loaded_models": self.loaded_models,
+            "consecutive_failures": self.consecutive_failures,
+            "last_error": self.last_error,
+            "last_probe": self.last_probe,
+        }
+
+
+class BackendPool:
+    """Registry of ComfyUI nodes with load-aware routing and health-based ejection."""
+
+    def __init__(self, backends: List[ComfyUIBackend]):
+        self.backends = backends
+        self.model_swaps = 0
+        self.model_swaps_avoided = 0
+        self._health_task: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        for backend in self.backends:
+            backend.events.ensure_started()
+        if self._health_task is None or self._health_task.done():
+            self._health_task = asyncio.create_task(self._monitor())
+
+    async def close(self) -> None:
+        if self._health_task is not None:
+            self._health_task.cancel()
+            try:
+                await self._health_task
+            except asyncio.CancelledError:
+                pass
+            self._health_task = None
+        for backend in self.backends:
+            await backend.events.close()
+
+    def select(self, fingerprint: Optional[str] = None, exclude: Optional[List[ComfyUIBackend]] = None) -> ComfyUIBackend:
+        """Pick a healthy node for a workflow.
+
+        The least-loaded node wins (more free VRAM breaks ties) unless a node that
+        already holds the workflow's models is within COMFYUI_AFFINITY_SLACK of it.
+        """
+        candidates = [
+            backend for backend in self.backends
+            if backend.healthy and not (exclude and backend in exclude)
+        ]
+        if not candidates:
+            if not self.backends:
+                raise RuntimeError("No ComfyUI backends configured")
+            ejected = sum(1 for backend in self.backends if not backend.healthy)
+            excluded = sum(1 for backend in self.backends if backend.healthy and exclude and backend in exclude)
+            raise RuntimeError(
+                f"No ComfyUI backend available: {ejected} of {len(self.backends)} ejected as unhealthy, "
+                f"{excluded} excluded after failing this workflow"
+            )
+
+        def rank(backend: ComfyUIBackend) -> tuple:
+            return (backend.load, -(backend.vram_free or 0))
+
+        chosen = min(candidates, key=rank)
+        if fingerprint is not None and chosen.loaded_models != fingerprint:
+            affine = [backend for backend in candidates if backend.loaded_models == fingerprint]
+            if affine:
+                best_affine = min(affine, key=rank)
+                if best_affine.load <= chosen.load + COMFYUI_AFFINITY_SLACK:
+                    if chosen.loaded_models is not None:
+                        self.model_swaps_avoided += 1
+                    chosen = best_affine
+
+        if fingerprint is not None:
+            if chosen.loaded_models is not None and chosen.loaded_models != fingerprint:
+                self.model_swaps += 1
+            chosen.loaded_models = fingerprint
+        return chosen
+
+    async def probe(self, backend: ComfyUIBackend) -> bool:
+        session = get_http_session()
+        try:
+            async with session.get(f"{backend.url}/queue", timeout=PROBE_TIMEOUT) as resp:
+                resp.raise_for_status()
+                queue = await resp.json()
+            async with session.get(f"{backend.url}/system_stats", timeout=PROBE_TIMEOUT) as resp:
+                resp.raise_for_status()
+                stats = await resp.json()
+        except Exception as probe_error:
+            backend.record_failure(str(probe_error) or type(probe_error).__name__)
+            PROBE_FAILURES.labels(backend.name).inc()
+            return False
+        finally:
+            backend.last_probe = time.time()
+
+        backend.queue_depth = len(queue.get('queue_running', [])) + len(queue.get('queue_pending', []))
+        devices = stats.get('devices') or []
+        if devices:
+            backend.vram_free = sum(device.get('vram_free', 0) for device in devices)
+            backend.vram_total = sum(device.get('vram_total', 0) for device in devices)
+        backend.record_success()
+        if not backend.healthy:
+            backend.healthy = True
+            logger.info("Re-admitted ComfyUI backend after successful probe", {"backend": backend.name})
+        return True
+
+    async def probe_all(self) -> None:
+        await asyncio.gather(*(self.probe(backend) for backend in self.backends))
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "backends": [backend.snapshot() for backend in self.backends],
+            "affinity": {
+                "model_swaps": self.model_swaps,
+                "model_swaps_avoided": self.model_swaps_avoided,
+            },
+        }
+
+    async def _monitor(self) -> None:
+        while True:
+            await self.probe_all()
+            await asyncio.sleep(COMFYUI_HEALTH_INTERVAL_SECONDS)
+
+
+def _load_backends() -> List[ComfyUIBackend]:
+    entries: List[Any] = []
+    if COMFYUI_BACKENDS_FILE:
+        with open(COMFYUI_BACKENDS_FILE) as f:
+            entries.extend(json.load(f))
+    if COMFYUI_BACKENDS:
+        entries.extend(entry.strip() for entry in COMFYUI_BACKENDS.split(',') if entry.strip())
+    if not entries:
+        entries.append(COMFYUI_URL)
+
+    backends: List[ComfyUIBackend] = []
+    for position, entry in enumerate(entries):
+        if isinstance(entry, dict):
+            url = entry['url']
+            name = entry.get('name') or url
+        else:
+            url = entry
+            name = entry
+        if "://" not in url:
+            url = f"http://{url}"
+        backends.append(ComfyUIBackend(name=name, url=url))
+    return backends
+
+
+backend_pool = BackendPool(_load_backends())
+
+
+async def _fetch_history(session: aiohttp.ClientSession, backend: ComfyUIBackend, prompt_id: str) -> Optional[Dict[str, Any]]:
+    async with session.get(f"{backend.url}/history/{prompt_id}") as resp:
+        if resp.status != 200:
+            return None
+        history = await resp.json()
+        return history.get(prompt_id)
+
+
+async def _wait_for_prompt(
+    session: aiohttp.ClientSession,
+    backend: ComfyUIBackend,
+    prompt_id: str,
+    future: asyncio.Future
+) -> Dict:
+    events = backend.events
+    # Allow overnight batch runs; give ComfyUI up to 10 hours to complete a job
+    max_wait = 36_000
+    start_time = time.time()
+    consecutive_errors = 0
+
+    while time.time() - start_time < max_wait:
+        if not future.done():
+            timeout = WS_RECHECK_SECONDS if events.connected else HISTORY_POLL_INTERVAL_SECONDS
+            await events.wait(future, timeout)
+
+        if future.done():
+            error = future.result()
+            if error:
+                raise RuntimeError(f"ComfyUI execution failed for prompt {prompt_id}: {error}")
+            try:
+                entry = await _fetch_history(session, backend, prompt_id)
+            except Exception as fetch_error:
+                logger.warning(
+                    "Failed to fetch ComfyUI history after completion",
+                    {"prompt_id": prompt_id, "backend": backend.name, "error": str(fetch_error)}
+                )
+                entry = None
+            if entry is not None:
+                return entry
+            return {"outputs": events.outputs(prompt_id), "status": {"completed": True}}
+
+        # The socket is down (or an event may have been missed): poll history
+        try:
+            async with session.get(f"{backend.url}/history/{prompt_id}") as resp:
+                if resp.status == 200:
+                    history = await resp.json()
+                    if prompt_id in history:
+                        return history[prompt_id]
+                    consecutive_errors = 0
+                elif resp.status == 404:
+                    consecutive_errors += 1
+                else:
+                    consecutive_errors += 1
+                    logger.warning(
+                        "Unexpected status while polling ComfyUI history",
+                        {"prompt_id": prompt_id, "backend": backend.name, "status": resp.status}
+                    )
+        except Exception as poll_error:
+            consecutive_errors += 1
+            logger.warning(
+                "Error while polling ComfyUI history",
+                {"prompt_id": prompt_id, "backend": backend.name, "error": str(poll_error)}
+            )
+
+        if consecutive_errors >= 90:
+            raise TimeoutError(
+                f"Exceeded {consecutive_errors} consecutive polling errors for prompt {prompt_id}"
+            )
+
+    raise TimeoutError(f"Workflow execution timed out after {max_wait} seconds")
+
+
+async def _submit_prompt(session: aiohttp.ClientSession, backend: ComfyUIBackend, workflow: Dict) -> str:
+    payload = {
+        "prompt": workflow,
+        # Route execution events to the node's shared event stream rather than per job
+        "client_id": backend.events.client_id
+    }
+
+    async with session.post(f"{backend.url}/prompt", json=payload) as resp:
+        if resp.status != 200:
+            text = await resp.text()
+            if resp.status >= 500:
+                backend.record_failure(f"HTTP {resp.status}")
+            raise Exception(f"Failed to queue prompt: {text}")
+
+        result = await resp.json()
+        backend.record_success()
+        return result.get('prompt_id')
+
+
+async def _cancel_prompt(session: aiohttp.ClientSession, backend: ComfyUIBackend, prompt_id: str) -> None:
+    """Take an abandoned prompt off its node: delete it if queued, interrupt it if running."""
+    try:
+        async with session.post(f"{backend.url}/queue", json={"delete": [prompt_id]}, timeout=PROBE_TIMEOUT) as resp:
+            resp.raise_for_status()
+        async with session.get(f"{backend.url}/queue", timeout=PROBE_TIMEOUT) as resp:
+            resp.raise_for_status()
+            queue = await resp.json()
+        # Only interrupt when it is our prompt running: older ComfyUI builds ignore the
+        # prompt_id and interrupt whatever is executing
+        if any(len(item) > 1 and item[1] == prompt_id for item in queue.get('queue_running', [])):
+            async with session.post(f"{backend.url}/interrupt", json={"prompt_id": prompt_id}, timeout=PROBE_TIMEOUT) as resp:
+                resp.raise_for_status()
+        logger.info("Cancelled ComfyUI prompt", {"prompt_id": prompt_id, "backend": backend.name})
+    except Exception as cancel_error:
+        logger.warning(
+            "Failed to cancel ComfyUI prompt",
+            {"prompt_id": prompt_id, "backend": backend.name, "error": str(cancel_error)}
+        )
+
+
+async def _retract_submission(session: aiohttp.ClientSession, backend: ComfyUIBackend, submit: asyncio.Future) -> None:
+    """Cancel a prompt whose submission was abandoned mid-request, once the node has answered."""
+    try:
+        prompt_id = await submit
+    except Exception:
+        return
+    await _cancel_prompt(session, backend, prompt_id)
+
+
+def _history_timestamps(entry: Dict[str, Any]) -> Dict[str, float]:
+    """Epoch seconds of ComfyUI's execution_* status messages for a prompt."""
+    timestamps: Dict[str, float] = {}
+    for message in (entry.get('status') or {}).get('messages') or []:
+        if isinstance(message, list) and len(message) == 2 and isinstance(message[1], dict):
+            timestamp = message[1].get('timestamp')
+            if isinstance(timestamp, (int, float)):
+                timestamps.setdefault(message[0], timestamp / 1000)
+    return timestamps
+
+
+def _record_prompt_spans(
+    workflow: Dict[str, Any],
+    entry: Dict[str, Any],
+    timeline: List[Tuple[Optional[str], float]],
+    cached_nodes: List[str],
+    submitted_at: float
+) -> None:
+    """Reconstruct queued/executing/per-node spans for a finished prompt.
+
+    Execution start and end come from ComfyUI's history timestamps when present,
+    otherwise from when the event stream delivered them.
+    """
+    detected_at = time.time()
+    timestamps = _history_timestamps(entry)
+    started = timestamps.get('execution_start', timeline[0][1] if timeline else None)
+    finished = timestamps.get('execution_success', timeline[-1][1] if timeline else detected_at)
+    if started is None:
+        return
+
+    record_span("queued", submitted_at, started)
+    executing = start_span("executing", start=started, cached_nodes=len(cached_nodes))
+    if executing is None:
+        return
+    token = _active_span.set((_active_span.get()[0], executing["span_id"]))
+    try:
+        for (node, node_started), (_, node_finished) in zip(timeline, timeline[1:] + [(None, finished)]):
+            if node is not None:
+                class_type = (workflow.get(node) or {}).get('class_type', 'unknown')
+                record_span(f"node {class_type}", node_started, node_finished, node=node, class_type=class_type)
+    finally:
+        _active_span.reset(token)
+    end_span(executing, end=max(started, finished))
+
+
+def _observe_prompt_timing(entry: Dict[str, Any], submitted_at: float, workflow_type: str) -> None:
+    detected_at = time.time()
+    timestamps = _history_timestamps(entry)
+    started = timestamps.get('execution_start')
+    finished = timestamps.get('execution_success')
+    # Queue time and detection lag compare ComfyUI's clock with ours, so clamp skew at zero
+    if started is not None:
+        QUEUE_SECONDS.labels(workflow_type).observe(max(0.0, started - submitted_at))
+    if started is not None and finished is not None:
+        EXECUTION_SECONDS.labels(workflow_type).observe(max(0.0, finished - started))
+    if finished is not None:
+        DETECTION_LAG_SECONDS.labels(workflow_type).observe(max(0.0, detected_at - finished))
+
+
+async def execute_workflow(workflow: Dict, job_id: str, workflow_type: str = "default") -> Dict:
+    try:
+        session = get_http_session()
+        fingerprint = model_fingerprint(workflow)
+        tried: List[ComfyUIBackend] = []
+
+        # Connection-level failures move the prompt to the next least-loaded node
+        while True:
+            backend = backend_pool.select(fingerprint, exclude=tried)
+            backend.events.ensure_started()
+            # Count the prompt against the node before the first await so concurrent
+            # selections see it
+            backend.in_flight += 1
+            submit_started = time.perf_counter()
+            submit = asyncio.ensure_future(_submit_prompt(session, backend, workflow))
+            try:
+                with trace_span("submit", backend=backend.name):
+                    # Shielded: the node may queue the prompt even if we stop waiting for the answer
+                    prompt_id = await asyncio.shield(submit)
+                SUBMIT_SECONDS.labels(workflow_type).observe(time.perf_counter() - submit_started)
+                break
+            except aiohttp.ClientConnectionError as connect_error:
+                backend.in_flight -= 1
+                backend.record_failure(str(connect_error))
+                COMFYUI_ERRORS.labels(backend.name, workflow_type, "connect").inc()
+                tried.append(backend)
+                logger.warning(
+                    "Could not reach ComfyUI backend, trying another",
+                    {"job_id": job_id, "backend": backend.name, "error": str(connect_error)}
+                )
+            except BaseException as submit_error:
+                backend.in_flight -= 1
+                if isinstance(submit_error, Exception):
+                    COMFYUI_ERRORS.labels(backend.name, workflow_type, "submit").inc()
+                elif isinstance(submit_error, asyncio.CancelledError):
+                    await _retract_submission(session, backend, submit)
+                raise
+
+        submitted_at = time.time()
+        logger.info("Queued ComfyUI prompt", {"job_id": job_id, "prompt_id": prompt_id, "backend": backend.name})
+        future = backend.events.register(prompt_id, functools.partial(job_events.step, job_id, prompt_id))
+        try:
+            entry = await _wait_for_prompt(session, backend, prompt_id, future)
+            _observe_prompt_timing(entry, submitted_at, workflow_type)
+            _record_prompt_spans(workflow, entry, *backend.events.timeline(prompt_id), submitted_at)
+            return entry
+        except asyncio.CancelledError:
+            # Nobody waits for this prompt any more; free the GPU it would hold
+            await _cancel_prompt(session, backend, prompt_id)
+            raise
+        except Exception:
+            COMFYUI_ERRORS.labels(backend.name, workflow_type, "execution").inc()
+            raise
+        finally:
+            backend.in_flight -= 1
+            backend.events.discard(prompt_id)
+            job_events.clear_steps(job_id, prompt_id)
+        
+    except Exception as e:
+        logger.error(f"Workflow execution error: {str(e)}")
+        raise
+
+
+# Inputs that only name output files; they do not change what gets rendered
+NON_CONTENT_INPUTS = frozenset({'filename_prefix'})
+
+
+def _is_link(value: Any, workflow: Dict[str, Any]) -> bool:
+    return (
+        isinstance(value, list) and len(value) == 2
+        and isinstance(value[1], int) and str(value[0]) in workflow
+    )
+
+
+def workflow_hash(workflow: Dict[str, Any]) -> str:
+    """Canonical content hash of a prompt graph.
+
+    Each node is hashed from its class_type, its sorted inputs and the hashes of
+    the nodes it links to, so the result does not depend on node IDs, key order
+    or output filename prefixes.
+    """
+    digests: Dict[str, str] = {}
+
+    def node_digest(node_id: str, visiting: frozenset) -> str:
+        if node_id in digests:
+            return digests[node_id]
+        if node_id in visiting:
+            raise ValueError(f"Workflow graph has a cycle through node {node_id}")
+        node = workflow[node_id]
+        inputs = {}
+        for name, value in sorted((node.get('inputs') or {}).items()):
+            if name in NON_CONTENT_INPUTS:
+                continue
+            if _is_link(value, workflow):
+                value = ["@link", node_digest(str(value[0]), visiting | {node_id}), value[1]]
+            inputs[name] = value
+        canonical = json.dumps([node.get('class_type'), inputs], sort_keys=True, separators=(',', ':'))
+        digests[node_id] = hashlib.sha256(canonical.encode()).hexdigest()
+        return digests[node_id]
+
+    node_digests = sorted(
+        node_digest(str(node_id), frozenset())
+        for node_id, node in workflow.items()
+        if isinstance(node, dict)
+    )
+    return hashlib.sha256("\n".join(node_digests).encode()).hexdigest()
+
+
+def _result_files(result: Dict[str, Any]) -> List[str]:
+    files: List[str] = []
+    for output in (result.get('outputs') or {}).values():
+        for entry in _output_entries(output):
+            if entry.get('filename'):
+                path = _output_relative_path(entry)
+                if path not in files:
+                    files.append(path)
+    return files
+
+
+class ResultCache:
+    """LRU index of ComfyUI results stored in OUTPUT_DIR, keyed by workflow hash.
+
+    Entries hold the ComfyUI history result and the output files it names. A hit
+    is only served while all of those files still exist. Changes are appended to
+    a journal next to the artifacts so the index survives restarts; the journal
+    is compacted into a snapshot once it is mostly superseded records. Eviction
+    keeps the index within RESULT_CACHE_MAX_ENTRIES and RESULT_CACHE_MAX_BYTES
+    of artifacts, counting the MP4s and posters derived from them. With
+    ``delete_evicted`` set, evicted files are deleted once no job returned by
+    ``in_use`` lists them any more.
+    """
+
+    def __init__(
+        self,
+        index_path: Path,
+        max_entries: int,
+        max_bytes: int,
+        delete_evicted: bool,
+        in_use: Callable[[], List[List[str]]] = list
+    ):
+        self.index_path = index_path
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.delete_evicted = delete_evicted
+        self.in_use = in_use
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        # How many entries name each file, so evicted files other entries still use are kept
+        self._file_refs: Dict[str, int] = {}
+        # Files derived from a cached file, and their total size, keyed by that file
+        self._derived: Dict[str, Tuple[List[str], int]] = {}
+        # Evicted files waiting until no job lists them before they are deleted
+        self._orphans: set = set()
+        self._sweeper: Optional[asyncio.Task] = None
+        self._resweep = False
+        # Journal records not yet written, and how many records the journal holds
+        self._pending: List[Tuple[str, str, Any]] = []
+        self._journal_records = 0
+        self._writer: Optional[asyncio.Task] = None
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    async def get(self, key: str) -> Optional[Dict[str, Any]]:
+        entry = self._entries.get(key)
+        if entry is not None and not await run_fs(_all_files_exist, entry['files']):
+            # Artifacts were removed behind our back
+            if self._entries.get(key) is entry:
+                self._log('drop', key)
+                self._discard(self._release(self._drop(key)['files']))
+            entry = None
+        if entry is None:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        entry['last_used'] = time.time()
+        self._log('touch', key, entry['last_used'])
+        self.hits += 1
+        return entry['result']
+
+    async def put(self, key: str, result: Dict[str, Any]) -> None:
+        files = _result_files(result)
+        if not files:
+            return
+        try:
+            size = await run_fs(_total_size, files)
+        except FileNotFoundError:
+            # Outputs are not on this API's volume; nothing we could serve later
+            return
+
+        replaced = self._drop(key)['files'] if key in self._entries else []
+        entry = {
+            "result": {"outputs": result.get('outputs'), "status": result.get('status')},
+            "files": files,
+            "size": size,
+            "last_used": time.time(),
+        }
+        self._add(key, entry)
+        self._log('put', key, entry)
+        self._discard(self._release(replaced) + self._evict())
+
+    async def add_derived(self, source: str, paths: List[str]) -> None:
+        """Count files post-processing derived from a cached file against the size bound.
+
+        They are evicted, and deleted, together with that file.
+        """
+        if source not in self._file_refs:
+            return
+        try:
+            size = await run_fs(_total_size, paths)
+        except FileNotFoundError:
+            return
+        if source not in self._file_refs:
+            return
+        _, previous_size = self._derived.get(source, ((), 0))
+        self._derived[source] = (paths, size)
+        self.total_bytes += size - previous_size
+        self._log('derive', source, [paths, size])
+        self._discard(self._evict())
+
+    def sweep(self) -> None:
+        """Delete evicted files that no job lists any more, in the background."""
+        self._resweep = True
+        if self._sweeper is None and self._orphans:
+            self._sweeper = asyncio.ensure_future(self._delete_orphans())
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "bytes": self.total_bytes,
+            "max_entries": self.max_entries,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / lookups if lookups else None,
+            "evictions": self.evictions,
+            "awaiting_deletion": len(self._orphans),
+        }
+
+    async def load(self) -> None:
+        try:
+            entries, derived, orphans, records = await run_fs(self._read_journal)
+        except OSError as load_error:
+            logger.warning("Ignoring unreadable result cache index", {"path": str(self.index_path), "error": str(load_error)})
+            return
+        self._journal_records = records
+        for key, entry in entries.items():
+            self._add(key, entry)
+        for source, (paths, size) in derived.items():
+            if source in self._file_refs:
+                self._derived[source] = (paths, size)
+                self.total_bytes += size
+        self._orphans.update(orphans)
+        self._discard(self._evict())
+        self.sweep()
+        await self.close()
+
+    async def close(self) -> None:
+        """Wait until pending deletions are done and every change so far is in the journal."""
+        while self._sweeper is not None or self._writer is not None:
+            await asyncio.shield(self._sweeper or self._writer)
+
+    def _log(self, op: str, key: str, value: Any = None) -> None:
+        self._pending.append((op, key, value))
+        if self._writer is None:
+            self._writer = asyncio.ensure_future(self._write_pending())
+
+    async def _write_pending(self) -> None:
+        # One writer drains the records queued by any number of cache operations,
+        # so a burst of clips becomes a few appends rather than one write each
+        try:
+            while self._pending:
+                # Once most records are superseded, rewrite the journal as one put per entry
+                compact = self._journal_records > 2 * len(self._entries) + 1000
+                if compact:
+                    records = [('put', key, entry) for key, entry in self._entries.items()]
+                    records.extend(('derive', source, list(derived)) for source, derived in self._derived.items())
+                    records.extend(('orphan', path, True) for path in self._orphans)
+                else:
+                    records = self._pending
+                self._pending = []
+                try:
+                    await run_fs(self._write_snapshot if compact else self._append_records, records)
+                except OSError as save_error:
+                    logger.warning("Failed to persist result cache index", {"path": str(self.index_path), "error": str(save_error)})
+                    continue
+                self._journal_records = len(records) if compact else self._journal_records + len(records)
+        finally:
+            self._writer = None
+
+    @staticmethod
+    def _encode(records: List[Tuple[str, str, Any]]) -> str:
+        return ''.join(json.dumps([op, key, value]) + '\n' for op, key, value in records)
+
+    def _append_records(self, records: List[Tuple[str, str, Any]]) -> None:
+        with open(self.index_path, 'a') as journal:
+            journal.write(self._encode(records))
+
+    def _write_snapshot(self, records: List[Tuple[str, str, Any]]) -> None:
+        tmp_path = self.index_path.with_suffix('.tmp')
+        tmp_path.write_text(self._encode(records))
+        os.replace(tmp_path, self.index_path)
+
+    def _read_journal(self) -> Tuple["OrderedDict[str, Dict[str, Any]]", Dict[str, Tuple[List[str], int]], List[str], int]:
+        entries: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        derived: Dict[str, Tuple[List[str], int]] = {}
+        orphans: Dict[str, bool] = {}
+        records = 0
+        try:
+            journal = open(self.index_path)
+        except FileNotFoundError:
+            return entries, derived, [], records
+        with journal:
+            for line in journal:
+                try:
+                    op, key, value = json.loads(line)
+                except ValueError:
+                    # A record cut short by a crash; later ones are still intact
+                    continue
+                records += 1
+                if op == 'put':
+                    entries.pop(key, None)
+                    entries[key] = value
+                elif op == 'touch' and key in entries:
+                    entries.move_to_end(key)
+                    entries[key]['last_used'] = value
+                elif op == 'drop':
+                    entries.pop(key, None)
+                elif op == 'derive':
+                    derived[key] = tuple(value)
+                elif op == 'orphan':
+                    orphans[key] = value
+        return entries, derived, [path for path, waiting in orphans.items() if waiting], records
+
+    def _evict(self) -> List[str]:
+        """Drop least-recently-used entries over the limits; returns the files they leave unused."""
+        released: List[str] = []
+        while self._entries and (len(self._entries) > self.max_entries or self.total_bytes > self.max_bytes):
+            key = next(iter(self._entries))
+            self._log('drop', key)
+            released.extend(self._release(self._drop(key)['files']))
+            self.evictions += 1
+        return released
+
+    def _release(self, paths: List[str]) -> List[str]:
+        """Of ``paths``, those no entry names any more, followed by the files derived from them."""
+        released: List[str] = []
+        for path in paths:
+            if path in self._file_refs:
+                continue
+            released.append(path)
+            derived_paths, derived_size = self._derived.pop(path, ((), 0))
+            self.total_bytes -= derived_size
+            released.extend(derived_paths)
+        return released
+
+    def _discard(self, paths: List[str]) -> None:
+        if not self.delete_evicted or not paths:
+            return
+        for path in paths:
+            self._orphans.add(path)
+            self._log('orphan', path, True)
+        self.sweep()
+
+    async def _delete_orphans(self) -> None:
+        try:
+            while self._resweep:
+                self._resweep = False
+                candidates = [path for path in self._orphans if path not in self._file_refs]
+                if not candidates:
+                    continue
+                # Snapshot the jobs' file lists here; the worker thread only reads them
+                deleted = await run_fs(_unlink_unused, candidates, self.in_use())
+                for path in deleted:
+                    self._orphans.discard(path)
+                    self._log('orphan', path, False)
+        except OSError as delete_error:
+            logger.warning("Failed to delete evicted cache files", {"error": str(delete_error)})
+        finally:
+            self._sweeper = None
+
+    def _add(self, key: str, entry: Dict[str, Any]) -> None:
+        self._entries[key] = entry
+        self.total_bytes += entry.get('size', 0)
+        for path in entry['files']:
+            self._file_refs[path] = self._file_refs.get(path, 0) + 1
+            self._orphans.discard(path)
+
+    def _drop(self, key: str) -> Dict[str, Any]:
+        entry = self._entries.pop(key)
+        self.total_bytes -= entry.get('size', 0)
+        for path in entry['files']:
+            if self._file_refs[path] == 1:
+                del self._file_refs[path]
+            else:
+                self._file_refs[path] -= 1
+        return entry
+
+
+def _all_files_exist(paths: List[str]) -> bool:
+    return all(_output_path(path).is_file() for path in paths)
+
+
+def _total_size(paths: List[str]) -> int:
+    return sum(_output_path(path).stat().st_size for path in paths)
+
+
+def _unlink_unused(paths: List[str], in_use: List[List[str]]) -> List[str]:
+    """Delete the files no list in ``in_use`` names; returns them."""
+    unused = set(paths)
+    for files in in_use:
+        unused.difference_update(files)
+    for path in unused:
+        try:
+            _output_path(path).unlink()
+        except FileNotFoundError:
+            pass
+    return list(unused)
+
+
+result_cache = ResultCache(
+    OUTPUT_DIR / ".result_cache.jsonl",
+    max_entries=RESULT_CACHE_MAX_ENTRIES,
+    max_bytes=RESULT_CACHE_MAX_BYTES,
+    delete_evicted=RESULT_CACHE_DELETE_EVICTED,
+    in_use=jobs_db.output_file_lists,
+)
+# Evicted files a job still listed can go once that job expires
+jobs_db.add_eviction_listener(lambda job_ids: result_cache.sweep())
+
+
+def scene_cache_key(scene: Dict[str, Any], job: VideoJob, workflow: Dict[str, Any]) -> str:
+    """Cache key for a default-workflow scene, from the inputs that decide what it renders.
+
+    The scene's position is not part of it: inserting or deleting text only
+    re-keys the scenes whose own text changed.
+    """
+    key = json.dumps(
+        {
+            "text": scene['text'],
+            "style": job.style,
+            "resolution": job.resolution,
+            "fps": job.fps,
+            "duration": job.clip_duration,
+            "seed": scene_seed(scene),
+            "models": model_fingerprint(workflow),
+        },
+        sort_keys=True
+    )
+    return "scene:" + hashlib.sha256(key.encode()).hexdigest()
+
+
+class _Flight:
+    """One ComfyUI execution shared by every job that submitted the same graph.
+
+    Its spans go to a trace of its own and are copied into each waiting job's
+    trace, so no job owns the execution. Once no job waits for it, it is cancelled,
+    which takes its prompt off the ComfyUI node (see execute_workflow).
+    """
+
+    def __init__(self, key: str, workflow: Dict[str, Any], job_id: str, workflow_type: str):
+        self.key = key
+        self.trace = JobTrace()
+        self.waiters = 0
+        self.task = asyncio.ensure_future(self._execute(workflow, job_id, workflow_type))
+        _inflight_workflows[key] = self
+        self.task.add_done_callback(lambda _: self._retire())
+
+    async def _execute(self, workflow: Dict[str, Any], job_id: str, workflow_type: str) -> Dict[str, Any]:
+        # The task runs in a copy of the submitting job's context; detach it from that job's trace
+        _active_span.set((self.trace, None))
+        return await execute_workflow(workflow, job_id, workflow_type)
+
+    async def wait(self) -> Dict[str, Any]:
+        self.waiters += 1
+        try:
+            # Shielded so a cancelled job does not cancel the prompt for other jobs sharing it
+            return await asyncio.shield(self.task)
+        finally:
+            self.waiters -= 1
+            if self.task.done():
+                _adopt_spans(self.trace.spans)
+            elif self.waiters == 0:
+                # Retired right away so a later identical submission starts a new flight
+                self._retire()
+                self.task.cancel()
+                # The last waiter leaves only once the prompt is deleted or interrupted, so
+                # a cancelled job never leaves GPU work behind
+                await asyncio.wait([self.task])
+
+    def _retire(self) -> None:
+        if _inflight_workflows.get(self.key) is self:
+            del _inflight_workflows[self.key]
+
+
+def _adopt_spans(spans: List[Dict[str, Any]]) -> None:
+    """Copy spans recorded elsewhere under the active span, with fresh span IDs."""
+    active = _active_span.get()
+    if active is None:
+        return
+    trace, parent_id = active
+    span_ids: Dict[str, str] = {}
+    for span in spans:
+        if len(trace.spans) >= TRACE_MAX_SPANS:
+            trace.dropped += 1
+            continue
+        span_ids[span["span_id"]] = os.urandom(8).hex()
+        trace.spans.append({
+            **span,
+            "span_id": span_ids[span["span_id"]],
+            "parent_id": span_ids.get(span["parent_id"], parent_id),
+        })
+
+
+# Prompts currently executing, keyed by canonical workflow hash, so identical
+# concurrent submissions share one ComfyUI execution
+_inflight_workflows: Dict[str, _Flight] = {}
+
+
+async def run_workflow(workflow: Dict[str, Any], job: VideoJob, cache_key: Optional[str] = None) -> Tuple[Dict, str]:
+    """Execute a workflow for a job, avoiding duplicate GPU work.
+
+    Repeats are served from the result cache (``cache_key`` defaults to the
+    canonical workflow hash) and identical workflows already executing are
+    joined rather than submitted again. Returns the ComfyUI result and where it
+    came from: ``"rendered"``, ``"cache"`` or ``"coalesced"``.
+    """
+    graph_key = workflow_hash(workflow)
+    key = cache_key or graph_key
+    workflow_type = "custom" if job.workflow else "default"
+    if RESULT_CACHE_ENABLED:
+        cached = await result_cache.get(key)
+        if cached is not None:
+            logger.info("Result cache hit", {"job_id": job.job_id, "cache_key": key})
+            record_clip_completed(workflow_type, "cache")
+            return cached, "cache"
+
+    flight = _inflight_workflows.get(graph_key)
+    if flight is None:
+        source = "rendered"
+        flight = _Flight(graph_key, workflow, job.job_id, workflow_type)
+    else:
+        source = "coalesced"
+        logger.info("Joined in-flight identical workflow", {"job_id": job.job_id, "workflow_hash": graph_key})
+
+    result = await flight.wait()
+    record_clip_completed(workflow_type, source)
+    if RESULT_CACHE_ENABLED:
+        await result_cache.put(key, result)
+    return result, source
+
+
+async def _gather_or_cancel(coros: Union[List[Any], AsyncIterator[Any]]) -> List[Any]:
+    """Run coroutines concurrently; if one fails, cancel the rest and re-raise.
+
+    From an async iterator, each coroutine starts as soon as it is produced.
+    """
+    tasks: List[asyncio.Future] = []
+    failed: List[asyncio.Future] = []
+
+    def _watch(task: asyncio.Future) -> None:
+        if not task.cancelled() and task.exception() is not None:
+            failed.append(task)
+
+    try:
+        if hasattr(coros, '__aiter__'):
+            async for coro in coros:
+                task = asyncio.ensure_future(coro)
+                task.add_done_callback(_watch)
+                tasks.append(task)
+                if failed:
+                    await failed[0]
+        else:
+            tasks.extend(asyncio.ensure_future(coro) for coro in coros)
+        return await asyncio.gather(*tasks)
+    except BaseException:
+        if hasattr(coros, 'aclose'):
+            await coros.aclose()
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        raise
+
+VIDEO_SUFFIXES = ('.mp4', '.webm', '.mov', '.mkv')
+# Streams must agree on all of these for the concat demuxer to join them without re-encoding
+CONCAT_STREAM_FIELDS = (
+    'codec_type', 'codec_name', 'profile', 'width', 'height', 'pix_fmt',
+    'r_frame_rate', 'time_base', 'sample_rate', 'channels'
+)
+
+_postprocess_executor: Optional[ProcessPoolExecutor] = None
+
+
+def get_postprocess_executor() -> ProcessPoolExecutor:
+    global _postprocess_executor
+    if _postprocess_executor is None:
+        # spawn, not fork: the API process has live threads (FS pool, file watcher)
+        _postprocess_executor = ProcessPoolExecutor(
+            max_workers=max(1, POSTPROCESS_WORKERS),
+            mp_context=multiprocessing.get_context("spawn")
+        )
+    return _postprocess_executor
+
+
+async def close_postprocess_executor():
+    global _postprocess_executor
+    if _postprocess_executor is not None:
+        executor, _postprocess_executor = _postprocess_executor, None
+        await run_fs(executor.shutdown, wait=True, cancel_futures=True)
+
+
+async def run_postprocess(func, *args, **kwargs):
+    """Run CPU-heavy post-processing in the worker process pool."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_postprocess_executor(), functools.partial(func, *args, **kwargs))
+
+
+def _stream_signature(path: str) -> Optional[List[Dict[str, Any]]]:
+    try:
+        completed = subprocess.run(
+            [FFPROBE_BIN, '-v', 'error', '-show_entries', 'stream=' + ','.join(CONCAT_STREAM_FIELDS), '-of', 'json', path],
+            capture_output=True, text=True, check=True
+        )
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    streams = json.loads(completed.stdout).get('streams', [])
+    return [{key: stream.get(key) for key in CONCAT_STREAM_FIELDS} for stream in streams]
+
+
+def _run_ffmpeg(args: List[str]) -> None:
+    completed = subprocess.run([FFMPEG_BIN, '-y', '-v', 'error', *args], capture_output=True, text=True)
+    if completed.returncode != 0:
+        raise RuntimeError(f"ffmpeg exited with {completed.returncode}: {completed.stderr.strip()[-500:]}")
+
+
+def concatenate_clips(sources: List[str], destination: str, width: int, height: int, fps: int) -> Dict[str, Any]:
+    """Join clips end to end into destination. Runs in a post-processing worker.
+
+    Clips with identical stream parameters are joined with the concat demuxer and
+    stream copy. Anything else is scaled to width x height at fps and re-encoded
+    (video only; scene clips carry no audio).
+    """
+    started = time.perf_counter()
+    signatures = [_stream_signature(source) for source in sources]
+    stream_copy = signatures[0] is not None and all(signature == signatures[0] for signature in signatures)
+    probed = time.perf_counter()
+
+    target = Path(destination)
+    # Dot-prefixed so the output index ignores the file until it is complete
+    partial = target.with_name(f".{target.name}")
+    container_args = ['-movflags', '+faststart'] if target.suffix == '.mp4' else []
+    if stream_copy:
+        listing = target.with_name(f".{target.stem}.txt")
+        listing.write_text(''.join("file '{}'\n".format(source.replace("'", "'\\''")) for source in sources))
+        try:
+            _run_ffmpeg(['-f', 'concat', '-safe', '0', '-i', str(listing), '-c', 'copy', *container_args, str(partial)])
+        finally:
+            listing.unlink(missing_ok=True)
+    else:
+        width, height = width - width % 2, height - height % 2
+        inputs: List[str] = []
+        graph: List[str] = []
+        for i, source in enumerate(sources):
+            inputs += ['-i', source]
+            graph.append(
+                f"[{i}:v]scale={width}:{height}:force_original_aspect_ratio=decrease,"
+                f"pad={width}:{height}:(ow-iw)/2:(oh-ih)/2,setsar=1,fps={fps},format=yuv420p[v{i}]"
+            )
+        graph.append(''.join(f"[v{i}]" for i in range(len(sources))) + f"concat=n={len(sources)}:v=1:a=0[v]")
+        if target.suffix == '.webm':
+            codec_args = ['-c:v', 'libvpx-vp9', '-b:v', '0', '-crf', '32']
+        else:
+            codec_args = ['-c:v', 'libx264', '-preset', 'veryfast', '-crf', '18']
+        _run_ffmpeg([*inputs, '-filter_complex', ';'.join(graph), '-map', '[v]', *codec_args, *container_args, str(partial)])
+    os.replace(partial, target)
+    finished = time.perf_counter()
+
+    return {
+        "mode": "copy" if stream_copy else "reencode",
+        "clips": len(sources),
+        "bytes": target.stat().st_size,
+        "probe_seconds": round(probed - started, 3),
+        "ffmpeg_seconds": round(finished - probed, 3)
+    }
+
+
+async def concatenate_job_outputs(job: VideoJob, scene_outputs: Dict[int, List[str]]) -> None:
+    """Stitch one video per scene, in scene order, into one video listed in output_files.
+
+    Raises when a scene has no video (it rendered none, or its transcode failed) or
+    ffmpeg fails, so a job never publishes a stitched video with scenes missing.
+    """
+    clips: List[str] = []
+    missing: List[int] = []
+    for index in range(job.total_clips):
+        videos = [path for path in scene_outputs.get(index, []) if Path(path).suffix.lower() in VIDEO_SUFFIXES]
+        if videos:
+            clips.append(videos[0])
+        else:
+            missing.append(index)
+    if missing:
+        error = f"Cannot concatenate: no video clip for scene indices {missing}"
+    elif FFMPEG_PATH is None:
+        error = f"Cannot concatenate: {FFMPEG_BIN} not found"
+    else:
+        error = None
+    if error is not None:
+        job.postprocess['concatenate'] = {"error": error}
+        raise RuntimeError(error)
+
+    suffixes = {Path(path).suffix.lower() for path in clips}
+    suffix = suffixes.pop() if len(suffixes) == 1 else '.mp4'
+    relative_path = f"output/motion_{job.job_id}{suffix}"
+    width, height = map(int, job.resolution.split('x'))
+
+    started = time.perf_counter()
+    try:
+        stats = await run_postprocess(
+            concatenate_clips,
+            [os.path.abspath(_output_path(path)) for path in clips],
+            os.path.abspath(_output_path(relative_path)),
+            width, height, job.fps
+        )
+    except Exception as e:
+        job.postprocess['concatenate'] = {"error": str(e)}
+        raise RuntimeError(f"Concatenation failed: {e}") from e
+
+    # Includes time spent waiting for a free worker process
+    stats['seconds'] = round(time.perf_counter() - started, 3)
+    stats['file'] = relative_path
+    job.postprocess['concatenate'] = stats
+    job.output_files.append(relative_path)
+    output_index.add(relative_path.split('/', 1)[1], time.time())
+    logger.info("Concatenated scene clips", {"job_id": job.job_id, **stats})
+
+
+# Clip formats the per-clip pipeline handles; animated images are transcoded to MP4
+ANIMATED_IMAGE_SUFFIXES = ('.webp', '.gif')
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+def _sha256_file(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _is_newer(path: str, mtime: float) -> bool:
+    try:
+        return os.stat(path).st_mtime >= mtime
+    except FileNotFoundError:
+        return False
+
+
+def _transcode_animation(source: str, destination: str, poster: str, fps: int) -> int:
+    """Pipe an animated WebP/GIF's frames through ffmpeg into an H.264 MP4; returns the frame count."""
+    if Image is None:
+        raise RuntimeError("Pillow is required to transcode animated images")
+    with Image.open(source) as image:
+        width, height = image.size
+        frame_ms = image.info.get('duration') or 0
+        rate = round(1000 / frame_ms, 3) if frame_ms else fps
+        process = subprocess.Popen(
+            [
+                FFMPEG_BIN, '-y', '-v', 'error',
+                '-f', 'rawvideo', '-pix_fmt', 'rgb24', '-s', f'{width}x{height}', '-r', str(rate), '-i', '-',
+                '-vf', 'pad=ceil(iw/2)*2:ceil(ih/2)*2', '-c:v', 'libx264', '-pix_fmt', 'yuv420p',
+                '-movflags', '+faststart', destination
+            ],
+            stdin=subprocess.PIPE, stderr=subprocess.PIPE
+        )
+        frames = 0
+        try:
+            for frame in ImageSequence.Iterator(image):
+                rgb = frame.convert('RGB')
+                if frames == 0:
+                    rgb.save(poster, 'JPEG', quality=90)
+                process.stdin.write(rgb.tobytes())
+                frames += 1
+        except BrokenPipeError:
+            pass
+        _, stderr = process.communicate()
+    if process.returncode != 0:
+        raise RuntimeError(f"ffmpeg exited with {process.returncode}: {stderr.decode(errors='replace').strip()[-500:]}")
+    return frames
+
+
+def postprocess_clip(source: str, mp4: Optional[str], poster: str, fps: int) -> Dict[str, Any]:
+    """Checksum a clip, write its poster frame and, for animated images, an MP4 copy.
+
+    Runs in a post-processing worker. Outputs are written under dot-prefixed names
+    and renamed into place so the output index never sees partial files; the names
+    are unique per call, since jobs sharing a cached clip may process it at once.
+    """
+    started = time.perf_counter()
+    result: Dict[str, Any] = {"sha256": _sha256_file(source)}
+    source_mtime = os.stat(source).st_mtime
+    if all(_is_newer(path, source_mtime) for path in (mp4, poster) if path):
+        # A cached clip whose derived files were already produced by an earlier job
+        if mp4:
+            result["mp4_sha256"] = _sha256_file(mp4)
+        result["reused"] = True
+        result["seconds"] = round(time.perf_counter() - started, 3)
+        return result
+
+    token = os.urandom(6).hex()
+    poster_path = Path(poster)
+    partial_poster = poster_path.with_name(f".{token}.{poster_path.name}")
+    partial_mp4 = None
+    try:
+        if mp4:
+            mp4_path = Path(mp4)
+            partial_mp4 = mp4_path.with_name(f".{token}.{mp4_path.name}")
+            result["frames"] = _transcode_animation(source, str(partial_mp4), str(partial_poster), fps)
+            os.replace(partial_mp4, mp4_path)
+            result["mp4_sha256"] = _sha256_file(mp4)
+        else:
+            _run_ffmpeg(['-i', source, '-frames:v', '1', '-q:v', '2', '-f', 'image2', str(partial_poster)])
+        os.replace(partial_poster, poster_path)
+    finally:
+        for partial in (partial_mp4, partial_poster):
+            if partial is not None:
+                partial.unlink(missing_ok=True)
+    result["seconds"] = round(time.perf_counter() - started, 3)
+    return result
 
-def _collect_outputs_from_disk(workflow: Optional[Dict[str, Any]], job_start: float) -> List[str]:
-    prefixes: List[str] = []
-    if workflow:
-        for node in workflow.values():
-            inputs = node.get('inputs', {}) if isinstance(node, dict) else {}
-            prefix = inputs.get('filename_prefix')
-            if isinstance(prefix, str) and prefix:
-                prefixes.append(prefix)
 
-    if not prefixes:
-        prefixes.append('motion_api_fast_broll')
+class ClipPipeline:
+    """Post-processes each clip on the worker pool as soon as it is recorded.
 
-    collected: List[str] = []
-    cutoff = job_start - 5
-    for prefix in prefixes:
-        for path in OUTPUT_DIR.glob(f"{prefix}*"):
-            try:
-                mtime = path.stat().st_mtime
-            except FileNotFoundError:
-                continue
-            if path.is_file() and mtime >= cutoff:
-                rel = f"output/{path.name}"
-                if rel not in collected:
-                    collected.append(rel)
+    Earlier clips are transcoded while later scenes are still rendering, so only
+    the last clip's post-processing is added to the job's wall time. Derived files
+    are appended to the list the clip was recorded in, then on_update is called.
+    """
 
-    return sorted(collected)
+    def __init__(self, job: VideoJob, on_update):
+        self.job = job
+        self.on_update = on_update
+        self._tasks: List[asyncio.Task] = []
+        self._results: List[Dict[str, Any]] = []
 
-DEFAULT_CHECKPOINT = "SDXL/sd_xl_base_1.0_0.9vae.safetensors"
+    def submit(self, index: int, relative_path: str, recorded: List[str]) -> None:
+        suffix = Path(relative_path).suffix.lower()
+        if suffix in ANIMATED_IMAGE_SUFFIXES or suffix in VIDEO_SUFFIXES:
+            self._tasks.append(asyncio.ensure_future(self._process(index, relative_path, recorded)))
 
+    async def _process(self, index: int, relative_path: str, recorded: List[str]) -> None:
+        stem = relative_path.rsplit('.', 1)[0]
+        mp4 = f"{stem}.mp4" if Path(relative_path).suffix.lower() in ANIMATED_IMAGE_SUFFIXES else None
+        poster = f"{stem}.poster.jpg"
+        entry: Dict[str, Any] = {"index": index, "clip": relative_path}
+        try:
+            with trace_span("postprocess_clip", clip=relative_path):
+                stats = await run_postprocess(
+                    postprocess_clip,
+                    os.path.abspath(_output_path(relative_path)),
+                    os.path.abspath(_output_path(mp4)) if mp4 else None,
+                    os.path.abspath(_output_path(poster)),
+                    self.job.fps
+                )
+        except Exception as e:
+            logger.error(f"Job {self.job.job_id}: post-processing {relative_path} failed: {e}")
+            entry["error"] = str(e)
+            self._results.append(entry)
+            return
 
-def create_video_workflow(scene: Dict[str, Any], style: str, resolution: str, fps: int, duration: float) -> Dict:
-    width, height = map(int, resolution.split('x'))
-    total_frames = int(fps * duration)
-    
-    workflow = {
-        "1": {
-            "class_type": "CheckpointLoaderSimple",
-            "inputs": {
-                "ckpt_name": DEFAULT_CHECKPOINT
-            }
-        },
-        "2": {
-            "class_type": "CLIPTextEncode",
-            "inputs": {
-                "text": f"{style} video scene: {scene['text']}",
-                "clip": ["1", 1]
-            }
-        },
-        "3": {
-            "class_type": "CLIPTextEncode",
-            "inputs": {
-                "text": "blurry, low quality, distorted, ugly",
-                "clip": ["1", 1]
-            }
-        },
-        "4": {
-            "class_type": "EmptyLatentImage",
-            "inputs": {
-                "width": width,
-                "height": height,
-                "batch_size": total_frames
-            }
-        },
-        "5": {
-            "class_type": "KSampler",
-            "inputs": {
-                "seed": scene['index'] * 1000,
-                "steps": 20,
-                "cfg": 7.0,
-                "sampler_name": "euler",
-                "scheduler": "normal",
-                "denoise": 1.0,
-                "model": ["1", 0],
-                "positive": ["2", 0],
-                "negative": ["3", 0],
-                "latent_image": ["4", 0]
-            }
-        },
-        "6": {
-            "class_type": "VAEDecode",
-            "inputs": {
-                "samples": ["5", 0],
-                "vae": ["1", 2]
-            }
-        },
-        "7": {
-            "class_type": "SaveAnimatedWEBP",
-            "inputs": {
-                "filename_prefix": f"motion_scene_{scene['index']:03d}",
-                "fps": fps,
-                "lossless": False,
-                "quality": 80,
-                "method": "default",
-                "images": ["6", 0]
-            }
-        }
-    }
-    
-    return workflow
+        derived = [path for path in (mp4, poster) if path]
+        for path in derived:
+            if path not in recorded:
+                recorded.append(path)
+            output_index.add(path.split('/', 1)[1], time.time())
+        if RESULT_CACHE_ENABLED:
+            await result_cache.add_derived(relative_path, derived)
+        entry.update(stats, mp4=mp4, poster=poster)
+        self._results.append(entry)
+        self.on_update()
 
-async def execute_workflow(workflow: Dict, job_id: str) -> Dict:
-    try:
-        prompt_id = str(uuid.uuid4())
-        
-        payload = {
-            "prompt": workflow,
-            "client_id": job_id
+    async def drain(self) -> None:
+        """Wait for outstanding clips once rendering is done and record the stage's stats."""
+        started = time.perf_counter()
+        await asyncio.gather(*self._tasks)
+        results = sorted(self._results, key=lambda entry: entry["index"])
+        self.job.postprocess['clips'] = results
+        self.job.postprocess['pipeline'] = {
+            "clips": len(results),
+            "worker_seconds": round(sum(entry.get("seconds", 0.0) for entry in results), 3),
+            # Post-processing that could not be hidden behind rendering
+            "tail_seconds": round(time.perf_counter() - started, 3)
         }
-        
-        async with aiohttp.ClientSession(timeout=AIOHTTP_TIMEOUT) as session:
-            async with session.post(f"{COMFYUI_URL}/prompt", json=payload) as resp:
-                if resp.status != 200:
-                    text = await resp.text()
-                    raise Exception(f"Failed to queue prompt: {text}")
-                
-                result = await resp.json()
-                prompt_id = result.get('prompt_id')
-            
-            # Allow overnight batch runs; give ComfyUI up to 10 hours to complete a job
-            max_wait = 36_000
-            start_time = time.time()
-            consecutive_errors = 0
-            
-            while time.time() - start_time < max_wait:
-                try:
-                    async with session.get(f"{COMFYUI_URL}/history/{prompt_id}") as resp:
-                        if resp.status == 200:
-                            history = await resp.json()
-                            if prompt_id in history:
-                                return history[prompt_id]
-                            consecutive_errors = 0
-                        elif resp.status == 404:
-                            consecutive_errors += 1
-                        else:
-                            consecutive_errors += 1
-                            logger.warning(
-                                "Unexpected status while polling ComfyUI history",
-                                {"prompt_id": prompt_id, "status": resp.status}
-                            )
-                except Exception as poll_error:
-                    consecutive_errors += 1
-                    logger.warning(
-                        "Error while polling ComfyUI history",
-                        {"prompt_id": prompt_id, "error": str(poll_error)}
-                    )
-
-                if consecutive_errors >= 90:
-                    raise TimeoutError(
-                        f"Exceeded {consecutive_errors} consecutive polling errors for prompt {prompt_id}"
-                    )
 
-                await asyncio.sleep(2)
+    def cancel(self) -> None:
+        for task in self._tasks:
+            task.cancel()
 
-        raise TimeoutError(f"Workflow execution timed out after {max_wait} seconds")
-        
-    except Exception as e:
-        logger.error(f"Workflow execution error: {str(e)}")
-        raise
 
 async def process_video_job(job: VideoJob):
+    pipeline: Optional[ClipPipeline] = None
+    trace = job_traces[job.job_id] = JobTrace()
+    root = start_span("job", trace=trace, workflow_type="custom" if job.workflow else "default", priority=job.priority.value)
+    token = _active_span.set((trace, root["span_id"])) if root is not None else None
     try:
         job_start = time.time()
         job.status = JobStatus.PROCESSING
+        jobs_db.save(job)
 
-        def _record_outputs(output: Dict[str, Any]) -> None:
-            entries: List[Dict[str, Any]] = []
-            if 'images' in output and isinstance(output['images'], list):
-                entries.extend(output['images'])
-            if 'files' in output and isinstance(output['files'], list):
-                entries.extend(output['files'])
-            if 'videos' in output and isinstance(output['videos'], list):
-                entries.extend(output['videos'])
-
-            for entry in entries:
+        def _record_outputs(output: Dict[str, Any], recorded: List[str], index: int = 0) -> None:
+            for entry in _output_entries(output):
                 filename = entry.get('filename')
                 if not filename:
                     continue
 
-                subfolder = entry.get('subfolder', '').strip('/')
-                relative_path = f"output/{filename}" if not subfolder else f"output/{subfolder}/{filename}"
+                subfolder = (entry.get('subfolder') or '').strip('/')
+                relative_path = _output_relative_path(entry)
 
-                if relative_path not in job.output_files:
-                    job.output_files.append(relative_path)
+                if relative_path not in recorded:
+                    recorded.append(relative_path)
+                    output_index.add(relative_path.split('/', 1)[1], time.time())
                     logger.info(
                         "Recorded workflow output",
                         {
@@ -300,50 +3157,32 @@ async def process_video_job(job: VideoJob):
                             "type": entry.get('type')
                         }
                     )
+                    if pipeline is not None:
+                        pipeline.submit(index, relative_path, recorded)
 
         # If custom workflow provided, use it directly
         if job.workflow:
             job.total_clips = 1
-            result = await execute_workflow(job.workflow, job.job_id)
+            jobs_db.save(job)
+            if job.postprocess_clips:
+                pipeline = ClipPipeline(job, lambda: jobs_db.save(job))
+            with trace_span("run_workflow") as span:
+                result, source = await run_workflow(job.workflow, job)
+                if span is not None:
+                    span["attributes"]["source"] = source
+            if source == "cache":
+                job.reused_clips.append(0)
+            elif source == "coalesced":
+                job.coalesced_clips.append(0)
 
             outputs = result.get('outputs')
             if outputs:
-                summary: Dict[str, Any] = {}
-                for node_id, output in outputs.items():
-                    node_summary: Dict[str, Any] = {}
-                    if 'images' in output:
-                        node_summary['images'] = [
-                            {
-                                'filename': img.get('filename'),
-                                'subfolder': img.get('subfolder'),
-                                'type': img.get('type')
-                            }
-                            for img in output['images']
-                        ]
-                    if 'files' in output:
-                        node_summary['files'] = [
-                            {
-                                'filename': f.get('filename'),
-                                'subfolder': f.get('subfolder'),
-                                'type': f.get('type')
-                            }
-                            for f in output['files']
-                        ]
-                    if 'videos' in output:
-                        node_summary['videos'] = [
-                            {
-                                'filename': v.get('filename'),
-                                'subfolder': v.get('subfolder'),
-                                'type': v.get('type')
-                            }
-                            for v in output['videos']
-                        ]
-                    summary[node_id] = node_summary
-
+                summary = summarize_outputs(outputs)
                 logger.info("Workflow outputs summary", {"job_id": job.job_id, "outputs": summary})
 
-                for output in result['outputs'].values():
-                    _record_outputs(output)
+                with trace_span("record_outputs"):
+                    for output in result['outputs'].values():
+                        _record_outputs(output, job.output_files)
             else:
                 logger.warn(
                     "Workflow returned no outputs",
@@ -354,79 +3193,386 @@ async def process_video_job(job: VideoJob):
                 )
 
             if not job.output_files:
-                collected = _collect_outputs_from_disk(job.workflow, job_start)
+                with trace_span("fallback_scan"):
+                    collected = await collect_outputs_from_disk(job.workflow, job_start)
                 if collected:
                     job.output_files.extend(collected)
                     logger.info('Collected fallback outputs from disk', {"job_id": job.job_id, "files": collected})
+                    if pipeline is not None:
+                        for relative_path in collected:
+                            pipeline.submit(0, relative_path, job.output_files)
+
+            if pipeline is not None:
+                with trace_span("postprocess_wait"):
+                    await pipeline.drain()
 
             job.clips_generated = 1
             job.progress = 100.0
+            jobs_db.save(job)
         else:
             # Use default workflow generation
-            scenes = parse_script_to_scenes(job.script, job.clips_per_minute)
-            job.total_clips = len(scenes)
-            
-            for i, scene in enumerate(scenes):
-                workflow = create_video_workflow(
-                    scene=scene,
-                    style=job.style,
-                    resolution=job.resolution,
-                    fps=job.fps,
-                    duration=job.clip_duration
-                )
-                
-                result = await execute_workflow(workflow, job.job_id)
+            concurrency = max(1, job.max_concurrent_scenes or SCENE_CONCURRENCY)
+            window = asyncio.Semaphore(concurrency)
+            scene_outputs: Dict[int, List[str]] = {}
 
+            def _publish_outputs() -> None:
+                # Clips finish in any order; output_files stays in scene order
+                job.output_files = [path for index in sorted(scene_outputs) for path in scene_outputs[index]]
+                jobs_db.save(job)
+
+            if job.postprocess_clips:
+                pipeline = ClipPipeline(job, _publish_outputs)
+
+            async def render_scene(scene: Dict[str, Any]) -> None:
+                with trace_span("scene", index=scene['index']):
+                    await _render_scene(scene)
+
+            async def _render_scene(scene: Dict[str, Any]) -> None:
+                with trace_span("build_workflow"):
+                    workflow = create_video_workflow(
+                        scene=scene,
+                        style=job.style,
+                        resolution=job.resolution,
+                        fps=job.fps,
+                        duration=job.clip_duration
+                    )
+
+                async with window:
+                    with trace_span("run_workflow") as span:
+                        result, source = await run_workflow(workflow, job, scene_cache_key(scene, job, workflow))
+                        if span is not None:
+                            span["attributes"]["source"] = source
+
+                recorded: List[str] = []
                 if result.get('outputs'):
-                    for output in result['outputs'].values():
-                        _record_outputs(output)
-                
-                job.clips_generated = i + 1
-                job.progress = (i + 1) / len(scenes) * 100
-                
-                logger.info(f"Job {job.job_id}: Completed clip {i+1}/{len(scenes)}")
+                    with trace_span("record_outputs"):
+                        for output in result['outputs'].values():
+                            _record_outputs(output, recorded, scene['index'])
+
+                scene_outputs[scene['index']] = recorded
+                if source == "cache":
+                    job.reused_clips = sorted(job.reused_clips + [scene['index']])
+                elif source == "coalesced":
+                    job.coalesced_clips = sorted(job.coalesced_clips + [scene['index']])
+                job.clips_generated = len(scene_outputs)
+                job.progress = job.clips_generated / job.total_clips * 100
+                _publish_outputs()
+
+                logger.info(
+                    f"Job {job.job_id}: Completed clip {scene['index'] + 1}/{job.total_clips} "
+                    f"({job.clips_generated}/{job.total_clips} done)"
+                )
+
+            async def scene_renders():
+                # Scenes start rendering as the segmenter produces them; total_clips
+                # grows with them and is final once the script is exhausted
+                upload = script_uploads.pop(job.job_id, None)
+                if upload is not None:
+                    scenes = upload.scenes(job.clips_per_minute, job.words_per_minute)
+                else:
+                    scenes = iter_scenes(_script_chunks(job.script), job.clips_per_minute, job.words_per_minute)
+                parse = start_span("parse")
+                try:
+                    async for scene in scenes:
+                        job.total_clips = scene['index'] + 1
+                        jobs_db.save(job)
+                        yield render_scene(scene)
+                finally:
+                    if parse is not None:
+                        parse["attributes"]["scenes"] = job.total_clips
+                    end_span(parse)
+
+            await _gather_or_cancel(scene_renders())
+
+            if pipeline is not None:
+                with trace_span("postprocess_wait"):
+                    await pipeline.drain()
+            if job.concatenate:
+                with trace_span("concatenate"):
+                    await concatenate_job_outputs(job, scene_outputs)
         
         job.status = JobStatus.COMPLETED
         job.progress = 100.0
+        job.finished_at = time.time()
+        jobs_db.save(job)
         
     except Exception as e:
+        if pipeline is not None:
+            pipeline.cancel()
         logger.error(f"Job {job.job_id} failed: {str(e)}")
         job.status = JobStatus.FAILED
         job.error = str(e)
+        job.finished_at = time.time()
+        jobs_db.save(job)
+    finally:
+        if root is not None:
+            end_span(root, error=job.error)
+            _active_span.reset(token)
+        await export_trace(job)
 
-@app.post("/generate", response_model=JobResponse)
-async def generate_video(request: ScriptRequest, background_tasks: BackgroundTasks):
-    job_id = str(uuid.uuid4())
-    
-    job = VideoJob(
-        job_id=job_id,
-        script=request.script,
-        clips_per_minute=request.clips_per_minute,
-        clip_duration=request.clip_duration,
-        style=request.style,
-        resolution=request.resolution,
-        fps=request.fps,
-        workflow=request.workflow,
+class QueueFullError(Exception):
+    def __init__(self, retry_after: int):
+        super().__init__("Job queue is full")
+        self.retry_after = retry_after
+
+
+class JobScheduler:
+    """Bounded priority queue of jobs drained by a fixed pool of worker tasks.
+
+    Higher-priority jobs are dequeued first, FIFO within a priority. Wait-time
+    estimates use moving averages of measured job durations.
+    """
+
+    SMOOTHING = 0.2
+
+    def __init__(self, workers: int, max_depth: int):
+        self.workers = max(1, workers)
+        self.max_depth = max_depth
+        self.active = 0
+        self._queue: asyncio.PriorityQueue = asyncio.PriorityQueue()
+        self._sequence = itertools.count()
+        self._depth_by_priority: Dict[JobPriority, int] = {priority: 0 for priority in JobPriority}
+        self._avg_job_seconds: Optional[float] = None
+        self._avg_wait_seconds: Optional[float] = None
+        self._tasks: List[asyncio.Task] = []
+
+    @property
+    def depth(self) -> int:
+        return self._queue.qsize()
+
+    def start(self) -> None:
+        if not self._tasks:
+            self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def close(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def submit(self, job: VideoJob) -> None:
+        if self.depth >= self.max_depth:
+            raise QueueFullError(self.retry_after())
+        self._queue.put_nowait((PRIORITY_RANK[job.priority], next(self._sequence), time.time(), job))
+        self._depth_by_priority[job.priority] += 1
+
+    def estimated_wait(self, priority: JobPriority) -> float:
+        """Seconds until a job submitted now at this priority would start."""
+        ahead = sum(
+            depth for queued, depth in self._depth_by_priority.items()
+            if PRIORITY_RANK[queued] <= PRIORITY_RANK[priority]
+        )
+        if self.active < self.workers and ahead == 0:
+            return 0.0
+        job_seconds = self._avg_job_seconds or DEFAULT_JOB_SECONDS_ESTIMATE
+        return (ahead + 1) * job_seconds / self.workers
+
+    def retry_after(self) -> int:
+        job_seconds = self._avg_job_seconds or DEFAULT_JOB_SECONDS_ESTIMATE
+        return max(1, int(job_seconds / self.workers))
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "depth": self.depth,
+            "max_depth": self.max_depth,
+            "workers": self.workers,
+            "active": self.active,
+            "depth_by_priority": {priority.value: depth for priority, depth in self._depth_by_priority.items()},
+            "avg_job_seconds": self._avg_job_seconds,
+            "avg_wait_seconds": self._avg_wait_seconds,
+            "estimated_wait_seconds": {priority.value: self.estimated_wait(priority) for priority in JobPriority},
+        }
+
+    def _smooth(self, average: Optional[float], sample: float) -> float:
+        return sample if average is None else average + self.SMOOTHING * (sample - average)
+
+    async def _worker(self) -> None:
+        while True:
+            _, _, enqueued_at, job = await self._queue.get()
+            self._depth_by_priority[job.priority] -= 1
+            started = time.time()
+            self._avg_wait_seconds = self._smooth(self._avg_wait_seconds, started - enqueued_at)
+            self.active += 1
+            try:
+                await process_video_job(job)
+            except Exception as worker_error:
+                logger.error(f"Job {job.job_id} crashed its worker: {worker_error}")
+            finally:
+                self.active -= 1
+                self._avg_job_seconds = self._smooth(self._avg_job_seconds, time.time() - started)
+                self._queue.task_done()
+
+
+job_scheduler = JobScheduler(JOB_WORKERS, JOB_QUEUE_MAX_DEPTH)
+
+def _new_job(options: ScriptOptions, script: str, workflow: Optional[Dict] = None) -> VideoJob:
+    return VideoJob(
+        job_id=str(uuid.uuid4()),
+        script=script,
+        clips_per_minute=options.clips_per_minute,
+        clip_duration=options.clip_duration,
+        style=options.style,
+        resolution=options.resolution,
+        fps=options.fps,
+        workflow=workflow,
+        max_concurrent_scenes=options.max_concurrent_scenes,
+        priority=options.priority,
+        concatenate=options.concatenate,
+        # The default workflow saves animated WebP, which only becomes joinable video once transcoded
+        postprocess_clips=options.postprocess_clips or options.concatenate,
+        words_per_minute=options.words_per_minute,
         status=JobStatus.PENDING
     )
-    
-    jobs_db[job_id] = job
-    
-    background_tasks.add_task(process_video_job, job)
+
+
+def _enqueue(job: VideoJob) -> float:
+    """Admit a job to the scheduler and store it; returns the estimated wait in seconds."""
+    estimated_wait = job_scheduler.estimated_wait(job.priority)
+    try:
+        job_scheduler.submit(job)
+    except QueueFullError as full:
+        raise HTTPException(
+            status_code=429,
+            detail="Job queue is full, retry later",
+            headers={"Retry-After": str(full.retry_after)}
+        )
+
+    jobs_db.put(job)
+    return estimated_wait
+
+
+@app.post("/generate", response_model=JobResponse)
+async def generate_video(request: ScriptRequest):
+    job = _new_job(request, request.script, request.workflow)
+    estimated_wait = _enqueue(job)
     
     return JobResponse(
-        job_id=job_id,
+        job_id=job.job_id,
         status=JobStatus.PENDING,
-        message=f"Job queued. Will generate {request.clips_per_minute} clips per minute of script."
+        message=(
+            f"Job queued. Will generate {request.clips_per_minute} clips per minute of script. "
+            f"Estimated wait: {int(estimated_wait)}s."
+        )
     )
 
-@app.get("/status/{job_id}", response_model=JobStatusResponse)
-async def get_job_status(job_id: str):
-    if job_id not in jobs_db:
-        raise HTTPException(status_code=404, detail="Job not found")
-    
-    job = jobs_db[job_id]
-    
+
+NDJSON_CONTENT_TYPES = ("application/x-ndjson", "application/ndjson", "application/jsonl")
+
+
+def _scene_line(line: str, number: int) -> Optional[str]:
+    """Scene text of one NDJSON line: a JSON string or an object with a "text" field."""
+    if not line.strip():
+        return None
+    try:
+        value = json.loads(line)
+    except ValueError:
+        raise ScriptUploadError(f"Line {number} is not valid JSON")
+    if isinstance(value, dict):
+        value = value.get('text')
+    if not isinstance(value, str):
+        raise ScriptUploadError(f'Line {number} must be a JSON string or an object with a "text" string')
+    return value.strip() or None
+
+
+async def _read_script_upload(request: Request, upload: ScriptUpload) -> str:
+    """Decode the request body into ``upload`` as it arrives; returns the whole script."""
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    pending = ""
+    lines = 0
+    async for chunk in request.stream():
+        text = decoder.decode(chunk)
+        if not upload.scene_lines:
+            if text:
+                upload.put(text)
+            continue
+        *complete, pending = (pending + text).split("\n")
+        for line in complete:
+            lines += 1
+            scene = _scene_line(line, lines)
+            if scene is not None:
+                upload.put(scene)
+    text = decoder.decode(b"", final=True)
+    if upload.scene_lines:
+        scene = _scene_line(pending + text, lines + 1)
+        if scene is not None:
+            upload.put(scene)
+    elif text:
+        upload.put(text)
+    return upload.close()
+
+
+class UploadResponse(StreamingResponse):
+    """Streaming response sent while its request body is still being read.
+
+    StreamingResponse watches for client disconnects by reading ``receive``,
+    which would swallow the body chunks the response's own iterator consumes;
+    here the iterator reads the body and sees a disconnect as ClientDisconnect.
+    """
+
+    async def __call__(self, scope, receive, send) -> None:
+        await self.stream_response(send)
+        if self.background is not None:
+            await self.background()
+
+
+def _response_line(job_id: str, status: JobStatus, message: str) -> str:
+    return JobResponse(job_id=job_id, status=status, message=message).model_dump_json() + "\n"
+
+
+@app.post("/generate/stream")
+async def generate_video_stream(request: Request):
+    """Submit a script as it is uploaded, as chunked text/plain or as NDJSON with one scene per line.
+
+    Job options (as for /generate) are query parameters. The job is queued
+    before the body is read and renders scenes as their text arrives. The
+    response is NDJSON sent during the upload: a ``JobResponse`` line with the
+    job_id right away (also in the ``X-Job-Id`` and ``Location`` headers), and
+    a last one when the upload is complete or has failed.
+    """
+    try:
+        options = ScriptOptions.model_validate(dict(request.query_params))
+    except ValidationError as invalid:
+        raise RequestValidationError(invalid.errors())
+
+    content_type = request.headers.get("content-type", "text/plain").split(";", 1)[0].strip().lower()
+    upload = ScriptUpload(scene_lines=content_type in NDJSON_CONTENT_TYPES)
+    job = _new_job(options, "")
+    estimated_wait = _enqueue(job)
+    script_uploads[job.job_id] = upload
+
+    async def body():
+        finished = False
+        try:
+            yield _response_line(
+                job.job_id, job.status,
+                f"Job queued; scenes are rendered as the script arrives. Estimated wait: {int(estimated_wait)}s."
+            )
+            try:
+                job.script = await _read_script_upload(request, upload)
+            except (ScriptUploadError, UnicodeDecodeError, ClientDisconnect) as failed:
+                error = "Script upload was interrupted" if isinstance(failed, ClientDisconnect) else f"Invalid script upload: {failed}"
+                upload.fail(error)
+                finished = True
+                yield _response_line(job.job_id, JobStatus.FAILED, error)
+                return
+            finished = True
+            jobs_db.save(job)
+            yield _response_line(
+                job.job_id, job.status,
+                f"Script received ({len(job.script)} characters); scenes were queued as they arrived."
+            )
+        finally:
+            if not finished:
+                # The response was abandoned mid-upload; don't leave the job waiting for more text
+                upload.fail("Script upload was interrupted")
+
+    return UploadResponse(
+        body(),
+        media_type="application/x-ndjson",
+        headers={"x-job-id": job.job_id, "location": f"/status/{job.job_id}"}
+    )
+
+def _status_response(job: VideoJob) -> JobStatusResponse:
     return JobStatusResponse(
         job_id=job.job_id,
         status=job.status,
@@ -434,34 +3580,466 @@ async def get_job_status(job_id: str):
         clips_generated=job.clips_generated,
         total_clips=job.total_clips,
         output_files=job.output_files,
-        error=job.error
+        reused_clips=job.reused_clips,
+        coalesced_clips=job.coalesced_clips,
+        postprocess=job.postprocess,
+        error=job.error,
+        created_at=job.created_at,
+        finished_at=job.finished_at
+    )
+
+@app.get("/status/{job_id}", response_model=JobStatusResponse)
+async def get_job_status(job_id: str):
+    job = jobs_db.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+
+    return _status_response(job)
+
+@app.get("/jobs/{job_id}/trace")
+async def get_job_trace(job_id: str, format: str = "timeline"):
+    """A job's spans, as a timeline with offsets from job start or as OTLP/JSON (``format=otlp``)."""
+    job = jobs_db.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    if format not in ("timeline", "otlp"):
+        raise HTTPException(status_code=400, detail="format must be 'timeline' or 'otlp'")
+    # Queued jobs have no trace yet; traces recorded before a restart are gone
+    trace = job_traces.get(job_id) or JobTrace()
+    if format == "otlp":
+        return otlp_trace(job_id, trace)
+
+    origin = min((span["start"] for span in trace.spans), default=job.created_at)
+    spans = [
+        {
+            **span,
+            "offset_seconds": round(span["start"] - origin, 6),
+            "duration_seconds": round(span["end"] - span["start"], 6) if span["end"] is not None else None,
+        }
+        for span in sorted(trace.spans, key=lambda span: span["start"])
+    ]
+    return {"job_id": job.job_id, "trace_id": _trace_id(job.job_id), "dropped_spans": trace.dropped, "spans": spans}
+
+@app.post("/status/batch")
+async def get_job_statuses(request: StatusBatchRequest):
+    """Status of many jobs in one call; unknown or evicted IDs are listed under ``missing``."""
+    statuses: List[JobStatusResponse] = []
+    missing: List[str] = []
+    for job_id in request.job_ids:
+        job = jobs_db.get(job_id)
+        if job is None:
+            missing.append(job_id)
+        else:
+            statuses.append(_status_response(job))
+    return {"jobs": statuses, "missing": missing}
+
+JOBS_PAGE_MAX = 500
+
+def _encode_cursor(job: VideoJob) -> str:
+    return base64.urlsafe_b64encode(json.dumps([job.created_at, job.job_id]).encode()).decode()
+
+def _decode_cursor(cursor: str) -> Tuple[float, str]:
+    try:
+        created_at, job_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return float(created_at), str(job_id)
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+@app.get("/jobs", response_model=JobListResponse)
+async def list_jobs(
+    status: Optional[JobStatus] = None,
+    created_after: Optional[float] = None,
+    created_before: Optional[float] = None,
+    cursor: Optional[str] = None,
+    limit: int = 50
+):
+    """Jobs newest first, optionally filtered by status and creation time (Unix seconds).
+
+    Pass ``next_cursor`` back as ``cursor`` for the following page; pages come
+    from the job store's sorted index, so each costs O(log n + limit).
+    """
+    limit = max(1, min(limit, JOBS_PAGE_MAX))
+    before = _decode_cursor(cursor) if cursor else None
+    if created_before is not None and (before is None or (created_before, '') < before):
+        before = (created_before, '')
+
+    page = jobs_db.list_page(status=status, created_after=created_after, before=before, limit=limit + 1)
+    next_cursor = _encode_cursor(page[limit - 1]) if len(page) > limit else None
+    return JobListResponse(jobs=[_status_response(job) for job in page[:limit]], next_cursor=next_cursor)
+
+def _stream_payload(job: VideoJob, new_output_files: List[str]) -> Dict[str, Any]:
+    steps = job_events.steps(job.job_id)
+    progress = job.progress
+    if job.status == JobStatus.PROCESSING and job.total_clips:
+        # Count the sampler steps of clips still rendering as partial clips
+        partial = sum(step["value"] / step["max"] for step in steps if step["max"])
+        progress = min(100.0, max(progress, (job.clips_generated + partial) / job.total_clips * 100))
+    return {
+        "type": "status",
+        "job_id": job.job_id,
+        "status": job.status.value,
+        "progress": round(progress, 2),
+        "clips_generated": job.clips_generated,
+        "total_clips": job.total_clips,
+        "new_output_files": new_output_files,
+        "steps": steps,
+        "error": job.error
+    }
+
+async def _status_updates(job_id: str):
+    """Yield a job's status each time it changes, or ``None`` after
+    STATUS_STREAM_KEEPALIVE_SECONDS without a change. Ends once the job finishes."""
+    wake = job_events.subscribe(job_id)
+    sent: set = set()
+    try:
+        while True:
+            wake.clear()
+            job = jobs_db.get(job_id)
+            if job is None:
+                return
+            new_output_files = [path for path in job.output_files if path not in sent]
+            sent.update(new_output_files)
+            yield _stream_payload(job, new_output_files)
+            if job.status in FINISHED_STATUSES:
+                return
+
+            # Sampler steps can arrive many times a second; send at most one update per interval
+            await asyncio.sleep(STATUS_STREAM_INTERVAL_SECONDS)
+            while not wake.is_set():
+                try:
+                    await asyncio.wait_for(wake.wait(), timeout=STATUS_STREAM_KEEPALIVE_SECONDS)
+                except asyncio.TimeoutError:
+                    yield None
+    finally:
+        job_events.unsubscribe(job_id, wake)
+
+@app.get("/status/{job_id}/stream")
+async def stream_job_status(job_id: str, request: Request):
+    """Server-Sent Events feed of a job's progress and newly recorded output files."""
+    if jobs_db.get(job_id) is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+
+    async def events():
+        async for payload in _status_updates(job_id):
+            if await request.is_disconnected():
+                return
+            if payload is None:
+                yield ": keepalive\n\n"
+            else:
+                yield f"event: status\ndata: {json.dumps(payload)}\n\n"
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"cache-control": "no-cache", "x-accel-buffering": "no"}
+    )
+
+@app.websocket("/status/{job_id}/ws")
+async def job_status_socket(websocket: WebSocket, job_id: str):
+    """WebSocket variant of /status/{job_id}/stream; sends the same JSON messages."""
+    await websocket.accept()
+    if jobs_db.get(job_id) is None:
+        await websocket.close(code=4404, reason="Job not found")
+        return
+
+    try:
+        async for payload in _status_updates(job_id):
+            # Keepalives also surface a client that went away while the job was idle
+            await websocket.send_json(payload or {"type": "keepalive"})
+        await websocket.close()
+    except WebSocketDisconnect:
+        pass
+
+@app.get("/queue")
+async def queue_status():
+    return job_scheduler.snapshot()
+
+@app.get("/metrics")
+async def metrics():
+    """Prometheus exposition of queue, job, ComfyUI stage and event-loop metrics."""
+    return Response(generate_latest(REGISTRY), media_type=CONTENT_TYPE_LATEST)
+
+@app.get("/diagnostics/event-loop")
+async def event_loop_diagnostics():
+    return loop_lag_monitor.snapshot()
+
+@app.get("/cache")
+async def cache_status():
+    return result_cache.stats()
+
+DOWNLOAD_CHUNK_SIZE = 256 * 1024
+RANGE_PATTERN = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+
+class RangeFileResponse(Response):
+    """Serves a byte range of a file, using zero-copy send when the ASGI server offers it.
+
+    Servers that implement the ``http.response.zerocopysend`` extension get the
+    file descriptor and send it with sendfile; otherwise the range is streamed in
+    chunks read on the filesystem thread pool.
+    """
+
+    def __init__(self, path: Path, start: int, length: int, status_code: int, headers: Dict[str, str], media_type: str):
+        self.path = path
+        self.start = start
+        self.length = length
+        self.status_code = status_code
+        self.media_type = media_type
+        self.background = None
+        self.body = b""
+        self.init_headers(headers)
+        # init_headers sizes Content-Length from the (empty) body
+        self.raw_headers = [
+            (name, value) for name, value in self.raw_headers if name != b"content-length"
+        ] + [(b"content-length", str(length).encode("latin-1"))]
+
+    async def __call__(self, scope, receive, send) -> None:
+        await send({"type": "http.response.start", "status": self.status_code, "headers": self.raw_headers})
+        if scope["method"] == "HEAD" or self.length == 0:
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+            return
+
+        handle = await run_fs(open, self.path, "rb")
+        try:
+            if "http.response.zerocopysend" in scope.get("extensions", {}):
+                await send({
+                    "type": "http.response.zerocopysend",
+                    "file": handle,
+                    "offset": self.start,
+                    "count": self.length,
+                    "more_body": False,
+                })
+                return
+
+            await run_fs(handle.seek, self.start)
+            remaining = self.length
+            while remaining > 0:
+                chunk = await run_fs(handle.read, min(DOWNLOAD_CHUNK_SIZE, remaining))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+                await send({"type": "http.response.body", "body": chunk, "more_body": remaining > 0})
+            if remaining > 0:
+                # File shrank underneath us; terminate the response
+                await send({"type": "http.response.body", "body": b"", "more_body": False})
+        finally:
+            await run_fs(handle.close)
+
+
+def _resolve_download(job: VideoJob, filename: str) -> Optional[Path]:
+    """Find one of the job's recorded files by its path relative to OUTPUT_DIR.
+
+    Only ``output_files`` are served, which include derived files such as
+    transcoded clips, posters and the concatenated video; other jobs' files and
+    anything else under OUTPUT_DIR are not.
+    """
+    name = filename[len("output/"):] if filename.startswith("output/") else filename
+    for relative_path in job.output_files:
+        if relative_path.split('/', 1)[1] == name:
+            return _output_path(relative_path)
+    return None
+
+
+def _opaque_tag(tag: str) -> str:
+    tag = tag.strip()
+    return tag[2:] if tag.startswith('W/') else tag
+
+
+def _etag_matches(header: str, etag: str) -> bool:
+    # If-None-Match uses the weak comparison of RFC 9110 section 8.8.3.2
+    etag = _opaque_tag(etag)
+    return any(tag == "*" or _opaque_tag(tag) == etag for tag in header.split(','))
+
+
+def _not_modified_since(header: Optional[str], mtime: float) -> bool:
+    if not header:
+        return False
+    try:
+        return int(mtime) <= parsedate_to_datetime(header).timestamp()
+    except (TypeError, ValueError):
+        return False
+
+
+# Formats that are already compressed; deflating them again only burns CPU
+STORED_SUFFIXES = frozenset({'.mp4', '.webm', '.mov', '.mkv', '.webp', '.gif', '.png', '.jpg', '.jpeg', '.zip'})
+TAR_BLOCK_SIZE = 512
+
+
+class _ChunkSink(io.RawIOBase):
+    """Write-only, non-seekable buffer that archive writers stream into and we drain."""
+
+    def __init__(self):
+        self._chunks: List[bytes] = []
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def _iter_zip(files: List[Tuple[Path, str]]):
+    sink = _ChunkSink()
+    # A non-seekable sink makes zipfile write data descriptors instead of seeking back
+    with zipfile.ZipFile(sink, mode='w', allowZip64=True) as archive:
+        for path, arcname in files:
+            info = zipfile.ZipInfo.from_file(path, arcname)
+            info.compress_type = zipfile.ZIP_STORED if path.suffix.lower() in STORED_SUFFIXES else zipfile.ZIP_DEFLATED
+            with open(path, 'rb') as source, archive.open(info, 'w', force_zip64=info.file_size >= zipfile.ZIP64_LIMIT) as entry:
+                while True:
+                    chunk = source.read(DOWNLOAD_CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    entry.write(chunk)
+                    data = sink.drain()
+                    if data:
+                        yield data
+            yield sink.drain()
+    yield sink.drain()
+
+
+def _iter_tar(files: List[Tuple[Path, str]]):
+    for path, arcname in files:
+        with open(path, 'rb') as source:
+            file_stat = os.fstat(source.fileno())
+            info = tarfile.TarInfo(arcname)
+            info.size = file_stat.st_size
+            info.mtime = int(file_stat.st_mtime)
+            info.mode = 0o644
+            yield info.tobuf(format=tarfile.PAX_FORMAT)
+            remaining = info.size
+            while remaining > 0:
+                chunk = source.read(min(DOWNLOAD_CHUNK_SIZE, remaining))
+                if not chunk:
+                    # Truncated underneath us; pad so the archive stays well-formed
+                    chunk = b"\0" * min(DOWNLOAD_CHUNK_SIZE, remaining)
+                remaining -= len(chunk)
+                yield chunk
+            padding = -info.size % TAR_BLOCK_SIZE
+            if padding:
+                yield b"\0" * padding
+    yield b"\0" * (TAR_BLOCK_SIZE * 2)
+
+
+def _existing_outputs(output_files: List[str]) -> List[Tuple[Path, str]]:
+    """Files to bundle with their archive names, each name once so extractors never see duplicates."""
+    files: List[Tuple[Path, str]] = []
+    for arcname in dict.fromkeys(relative_path.split('/', 1)[1] for relative_path in output_files):
+        path = OUTPUT_DIR / arcname
+        if path.is_file():
+            files.append((path, arcname))
+    return files
+
+
+@app.get("/download/{job_id}/bundle")
+async def download_bundle(job_id: str, format: str = "zip"):
+    """Stream all of a job's output files as one ZIP or tar archive, built on the fly."""
+    job = jobs_db.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    if format not in ("zip", "tar"):
+        raise HTTPException(status_code=400, detail="format must be 'zip' or 'tar'")
+
+    files = await run_fs(_existing_outputs, list(job.output_files))
+    if not files:
+        raise HTTPException(status_code=404, detail="Job has no output files")
+
+    if format == "zip":
+        body, media_type = _iter_zip(files), "application/zip"
+    else:
+        body, media_type = _iter_tar(files), "application/x-tar"
+    return StreamingResponse(
+        body,
+        media_type=media_type,
+        headers={"content-disposition": f'attachment; filename="{job_id}.{format}"'}
     )
 
-@app.get("/download/{job_id}/{filename}")
-async def download_output(job_id: str, filename: str):
-    if job_id not in jobs_db:
+@app.api_route("/download/{job_id}/{filename:path}", methods=["GET", "HEAD"])
+async def download_output(job_id: str, filename: str, request: Request):
+    job = jobs_db.get(job_id)
+    if job is None:
         raise HTTPException(status_code=404, detail="Job not found")
     
-    file_path = OUTPUT_DIR / filename
-    if not file_path.exists():
+    file_path = _resolve_download(job, filename)
+    try:
+        file_stat = await run_fs(os.stat, file_path) if file_path is not None else None
+    except FileNotFoundError:
+        file_stat = None
+    if file_stat is None or not stat.S_ISREG(file_stat.st_mode):
         raise HTTPException(status_code=404, detail="File not found")
-    
-    return FileResponse(file_path)
+
+    size = file_stat.st_size
+    etag = f'"{file_stat.st_ino:x}-{size:x}-{file_stat.st_mtime_ns:x}"'
+    headers = {
+        "accept-ranges": "bytes",
+        "etag": etag,
+        "last-modified": formatdate(file_stat.st_mtime, usegmt=True),
+    }
+
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        if _etag_matches(if_none_match, etag):
+            return Response(status_code=304, headers=headers)
+    elif _not_modified_since(request.headers.get("if-modified-since"), file_stat.st_mtime):
+        return Response(status_code=304, headers=headers)
+
+    media_type = mimetypes.guess_type(file_path.name)[0] or "application/octet-stream"
+    start, length, status_code = 0, size, 200
+
+    range_header = request.headers.get("range")
+    if_range = request.headers.get("if-range")
+    if range_header and if_range is not None:
+        # Only honour the range if the client's copy is still current
+        if if_range.startswith('"') or if_range.startswith('W/'):
+            if if_range != etag:
+                range_header = None
+        elif not _not_modified_since(if_range, file_stat.st_mtime):
+            range_header = None
+
+    if range_header:
+        match = RANGE_PATTERN.match(range_header.strip())
+        first, last = (match.group(1), match.group(2)) if match else ("", "")
+        if first and last and int(last) < int(first):
+            first = last = ""
+        # Multi-range requests are answered with the whole file, which RFC 9110 allows; invalid
+        # ranges such as bytes=5-3 are ignored the same way rather than rejected
+        if first or last:
+            if first:
+                start = int(first)
+                end = min(int(last), size - 1) if last else size - 1
+            else:
+                start = max(0, size - int(last))
+                end = size - 1
+            if start >= size:
+                headers["content-range"] = f"bytes */{size}"
+                return Response(status_code=416, headers=headers)
+            length = end - start + 1
+            status_code = 206
+            headers["content-range"] = f"bytes {start}-{end}/{size}"
+
+    return RangeFileResponse(file_path, start, length, status_code, headers, media_type)
 
 @app.get("/health")
 async def health_check():
-    try:
-        async with aiohttp.ClientSession(timeout=AIOHTTP_TIMEOUT) as session:
-            async with session.get(f"{COMFYUI_URL}/system_stats") as resp:
-                comfyui_healthy = resp.status == 200
-    except:
-        comfyui_healthy = False
+    await backend_pool.probe_all()
+    comfyui_healthy = any(backend.healthy for backend in backend_pool.backends)
     
     return {
         "status": "healthy" if comfyui_healthy else "degraded",
-        "comfyui": "connected" if comfyui_healthy else "disconnected"
+        "comfyui": "connected" if comfyui_healthy else "disconnected",
+        "backends": {backend.name: "healthy" if backend.healthy else "ejected" for backend in backend_pool.backends}
     }
 
+@app.get("/backends")
+async def list_backends():
+    return backend_pool.snapshot()
+
 @app.get("/")
 async def root():
     return {
@@ -469,8 +4047,20 @@ async def root():
         "version": "1.0.0",
         "endpoints": {
             "POST /generate": "Submit a script for video generation",
+            "POST /generate/stream": "Submit a script as it is uploaded (chunked text or NDJSON scene lines)",
             "GET /status/{job_id}": "Check job status",
+            "POST /status/batch": "Status of many jobs in one call",
+            "GET /jobs": "List jobs by status and creation time, newest first",
+            "GET /jobs/{job_id}/trace": "Timeline of spans showing where a job's time went",
+            "GET /status/{job_id}/stream": "Server-Sent Events feed of job progress",
+            "WS /status/{job_id}/ws": "WebSocket feed of job progress",
             "GET /download/{job_id}/{filename}": "Download generated video",
+            "GET /download/{job_id}/bundle": "Download all of a job's outputs as one zip or tar archive",
+            "GET /queue": "Job queue depth and wait-time estimates",
+            "GET /backends": "ComfyUI node pool load and health",
+            "GET /cache": "Result cache size and hit/miss counters",
+            "GET /diagnostics/event-loop": "Histogram of event-loop stalls",
+            "GET /metrics": "Prometheus metrics",
             "GET /health": "Service health check"
         }
     }
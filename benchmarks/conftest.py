@@ -0,0 +1,119 @@
+"""
+Fixtures for the hot-path micro-benchmarks.
+
+CPU time is measured by pytest-benchmark; compare runs with its own
+--benchmark-save / --benchmark-compare options. Peak allocations are measured
+once per benchmark with tracemalloc and checked against
+benchmarks/baselines/allocations.json (per Python minor version, since
+allocation sizes change between interpreters). Refresh that file with
+--update-allocation-baselines after an intended change.
+"""
+
+import json
+import sys
+import tracemalloc
+from pathlib import Path
+
+import pytest
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+WORKFLOWS_DIR = REPO_ROOT / 'workflows'
+ALLOCATION_BASELINES = Path(__file__).resolve().parent / 'baselines' / 'allocations.json'
+PYTHON_VERSION = f"{sys.version_info.major}.{sys.version_info.minor}"
+
+for path in (REPO_ROOT, REPO_ROOT / 'scripts'):
+    if str(path) not in sys.path:
+        sys.path.insert(0, str(path))
+
+def pytest_addoption(parser):
+    group = parser.getgroup('allocations')
+    group.addoption(
+        '--update-allocation-baselines',
+        action='store_true',
+        help='Write measured peak allocations to benchmarks/baselines/allocations.json',
+    )
+    group.addoption(
+        '--allocation-tolerance',
+        type=float,
+        default=0.10,
+        help='Allowed growth of peak allocations over the baseline (fraction, default 0.10)',
+    )
+
+
+@pytest.fixture(scope='session')
+def api_service():
+    import api_service
+    return api_service
+
+
+@pytest.fixture(scope='session')
+def comfyui_client():
+    from run_workflow import ComfyUIClient
+    return ComfyUIClient()
+
+
+@pytest.fixture(scope='session')
+def workflow_text():
+    """Raw JSON of a file in workflows/, read once per session."""
+    cache = {}
+
+    def _read(name: str) -> str:
+        if name not in cache:
+            cache[name] = (WORKFLOWS_DIR / name).read_text()
+        return cache[name]
+
+    return _read
+
+
+@pytest.fixture(scope='session')
+def workflow_template(comfyui_client):
+    """Template of a file in workflows/, compiled the way scripts/run_workflow.py does."""
+    def _load(name: str):
+        return comfyui_client.load_template(WORKFLOWS_DIR / name)
+
+    return _load
+
+
+@pytest.fixture(scope='session')
+def allocation_baselines(request):
+    baselines = json.loads(ALLOCATION_BASELINES.read_text()) if ALLOCATION_BASELINES.exists() else {}
+    measured = {}
+    yield baselines.get(PYTHON_VERSION, {}), measured
+    if request.config.getoption('--update-allocation-baselines') and measured:
+        baselines.setdefault(PYTHON_VERSION, {}).update(measured)
+        ALLOCATION_BASELINES.parent.mkdir(parents=True, exist_ok=True)
+        ALLOCATION_BASELINES.write_text(json.dumps(baselines, indent=2, sort_keys=True) + '\n')
+
+
+@pytest.fixture
+def peak_allocations(request, benchmark, allocation_baselines):
+    """Measure the tracemalloc peak of one call and check it against the baseline.
+
+    The peak is attached to the benchmark as ``extra_info['peak_bytes']`` so it
+    lands in saved pytest-benchmark runs next to the timings.
+    """
+    baselines, measured = allocation_baselines
+    name = request.node.name
+    tolerance = request.config.getoption('--allocation-tolerance')
+    update = request.config.getoption('--update-allocation-baselines')
+
+    def _measure(func, *args, **kwargs) -> int:
+        func(*args, **kwargs)  # warm caches and lazy imports outside the measurement
+        tracemalloc.start()
+        try:
+            tracemalloc.reset_peak()
+            func(*args, **kwargs)
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+
+        benchmark.extra_info['peak_bytes'] = peak
+        measured[name] = peak
+        baseline = baselines.get(name)
+        if baseline is not None and not update:
+            assert peak <= baseline * (1 + tolerance), (
+                f"peak allocations {peak} bytes exceed baseline {baseline} bytes by more than {tolerance:.0%}"
+            )
+        return peak
+
+    return _measure
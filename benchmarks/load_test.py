@@ -0,0 +1,357 @@
+#!/usr/bin/env python3
+"""
+Load test for the API service.
+
+Drives POST /generate and GET /status/{job_id} from N concurrent clients and
+prints a JSON report: throughput, latency percentiles, event-loop lag (from
+/diagnostics/event-loop), API memory and the git commit, so runs can be
+compared across commits.
+
+With --spawn (no GPU needed) the mock ComfyUI server and the API are started
+in a temporary directory and torn down afterwards; otherwise an already running
+API at --api-url is tested.
+
+Usage:
+    python benchmarks/load_test.py --spawn --clients 20 --jobs 200
+    python benchmarks/load_test.py --spawn --latency-dist lognormal --latency-mean 0.5 --latency-stddev 0.2
+    python benchmarks/load_test.py --api-url http://localhost:9000 --api-pid 1234 --duration 120
+"""
+
+import argparse
+import asyncio
+import itertools
+import json
+import math
+import os
+import platform
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import aiohttp
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+FINISHED = ('completed', 'failed')
+SCRIPT_SENTENCE = "A lone rider crosses the red desert at dawn as dust rises behind the horse.\n"
+
+
+def percentile(values, fraction):
+    """Nearest-rank percentile; None for no samples."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(fraction * len(ordered)) - 1)]
+
+
+def summarize(values):
+    if not values:
+        return {'count': 0}
+    return {
+        'count': len(values),
+        'mean': sum(values) / len(values),
+        'p50': percentile(values, 0.50),
+        'p90': percentile(values, 0.90),
+        'p99': percentile(values, 0.99),
+        'max': max(values),
+    }
+
+
+def rss_bytes(pid):
+    """Resident set size of a process from /proc, or None where that is unavailable."""
+    try:
+        with open(f'/proc/{pid}/status') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) * 1024
+    except (OSError, ValueError):
+        pass
+    return None
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', 'HEAD'], cwd=REPO_ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def lag_delta(before, after):
+    """Event-loop lag over the run, from two cumulative /diagnostics/event-loop snapshots."""
+    samples = after['samples'] - before['samples']
+    if samples <= 0:
+        return {'samples': 0}
+    buckets = {key: after['buckets'][key] - before['buckets'].get(key, 0) for key in after['buckets']}
+
+    def quantile(fraction):
+        rank = fraction * samples
+        for key, count in buckets.items():
+            if count >= rank:
+                return None if key == 'le_inf' else float(key[3:])
+        return None
+
+    total_before = (before['mean_lag_seconds'] or 0) * before['samples']
+    total_after = (after['mean_lag_seconds'] or 0) * after['samples']
+    return {
+        'samples': samples,
+        'mean_seconds': (total_after - total_before) / samples,
+        'p50_upper_bound_seconds': quantile(0.50),
+        'p99_upper_bound_seconds': quantile(0.99),
+        'max_seconds_since_start': after['max_lag_seconds'],
+        'buckets': buckets,
+    }
+
+
+class Stack:
+    """Mock ComfyUI plus API service running in a scratch directory."""
+
+    def __init__(self, args):
+        self.args = args
+        self.workdir = tempfile.TemporaryDirectory(prefix='motion-load-')
+        self.comfy_port = free_port()
+        self.api_port = free_port()
+        self.processes = []
+        self.api = None
+
+    @property
+    def api_url(self):
+        return f'http://127.0.0.1:{self.api_port}'
+
+    def start(self):
+        args = self.args
+        mock = [
+            sys.executable, str(REPO_ROOT / 'scripts' / 'mock_comfyui.py'),
+            '--port', str(self.comfy_port),
+            '--latency-dist', args.latency_dist,
+            '--latency-mean', str(args.latency_mean),
+            '--latency-stddev', str(args.latency_stddev),
+            '--failure-rate', str(args.failure_rate),
+            '--gpus', str(args.gpus),
+            '--output-bytes', str(args.output_bytes),
+            '--seed', str(args.seed),
+        ]
+        env = {
+            **os.environ,
+            'COMFYUI_HOST': '127.0.0.1',
+            'COMFYUI_PORT': str(self.comfy_port),
+            'API_PORT': str(self.api_port),
+            'JOB_QUEUE_MAX_DEPTH': str(args.queue_depth),
+        }
+        logs = open(Path(self.workdir.name) / 'stack.log', 'w')
+        self.processes.append(subprocess.Popen(mock, cwd=self.workdir.name, stdout=logs, stderr=subprocess.STDOUT))
+        self.api = subprocess.Popen(
+            [sys.executable, str(REPO_ROOT / 'api_service.py')],
+            cwd=self.workdir.name, env=env, stdout=logs, stderr=subprocess.STDOUT
+        )
+        self.processes.append(self.api)
+
+    def stop(self):
+        for process in reversed(self.processes):
+            process.terminate()
+        for process in self.processes:
+            try:
+                process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+        self.workdir.cleanup()
+
+
+class LoadTest:
+    def __init__(self, args, api_url, api_pid):
+        self.args = args
+        self.api_url = api_url.rstrip('/')
+        self.api_pid = api_pid
+        self.generate_latency = []
+        self.status_latency = []
+        self.job_seconds = []
+        self.counts = {'submitted': 0, 'completed': 0, 'failed': 0, 'rejected': 0, 'errors': 0, 'clips': 0}
+        self.rss_samples = []
+        self._next_job = 0
+        self._job_numbers = itertools.count()
+
+    def script(self, job_number):
+        words_per_sentence = len(SCRIPT_SENTENCE.split())
+        sentences = max(1, self.args.script_words // words_per_sentence)
+        # Numbering every line keeps each scene unique, so the result cache does not short-circuit the run
+        return ''.join(f"Take {job_number}, shot {shot}. {SCRIPT_SENTENCE}" for shot in range(sentences))
+
+    def claim_job(self, deadline):
+        if self.args.duration:
+            return time.monotonic() < deadline
+        if self._next_job >= self.args.jobs:
+            return False
+        self._next_job += 1
+        return True
+
+    async def submit(self, session, body):
+        """POST /generate, waiting out 429s; returns the job id or None on error."""
+        while True:
+            started = time.perf_counter()
+            try:
+                async with session.post(f'{self.api_url}/generate', json=body) as resp:
+                    self.generate_latency.append(time.perf_counter() - started)
+                    if resp.status == 429:
+                        self.counts['rejected'] += 1
+                        await asyncio.sleep(float(resp.headers.get('Retry-After', '1')))
+                        continue
+                    resp.raise_for_status()
+                    return (await resp.json())['job_id']
+            except aiohttp.ClientError:
+                self.counts['errors'] += 1
+                return None
+
+    async def client(self, session, deadline):
+        while self.claim_job(deadline):
+            body = {
+                'script': self.script(next(self._job_numbers)),
+                'clips_per_minute': self.args.clips_per_minute,
+                'resolution': '512x512',
+                'fps': 8,
+            }
+            started = time.perf_counter()
+            job_id = await self.submit(session, body)
+            if job_id is None:
+                continue
+            self.counts['submitted'] += 1
+
+            while True:
+                await asyncio.sleep(self.args.poll_interval)
+                polled = time.perf_counter()
+                try:
+                    async with session.get(f'{self.api_url}/status/{job_id}') as resp:
+                        status = await resp.json()
+                except aiohttp.ClientError:
+                    self.counts['errors'] += 1
+                    continue
+                self.status_latency.append(time.perf_counter() - polled)
+                if status['status'] in FINISHED:
+                    self.job_seconds.append(time.perf_counter() - started)
+                    self.counts[status['status']] += 1
+                    self.counts['clips'] += status.get('clips_generated') or 0
+                    break
+
+    async def sample_memory(self):
+        while True:
+            rss = rss_bytes(self.api_pid) if self.api_pid else None
+            if rss is not None:
+                self.rss_samples.append(rss)
+            await asyncio.sleep(0.5)
+
+    async def get_json(self, session, path):
+        async with session.get(f'{self.api_url}{path}') as resp:
+            resp.raise_for_status()
+            return await resp.json()
+
+    async def wait_ready(self, session, timeout=60):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            try:
+                async with session.get(f'{self.api_url}/health') as resp:
+                    if resp.status == 200:
+                        return
+            except aiohttp.ClientError:
+                pass
+            await asyncio.sleep(0.25)
+        raise RuntimeError(f'API at {self.api_url} did not become ready within {timeout}s')
+
+    async def run(self):
+        connector = aiohttp.TCPConnector(limit=self.args.clients * 2)
+        timeout = aiohttp.ClientTimeout(total=60)
+        async with aiohttp.ClientSession(connector=connector, timeout=timeout) as session:
+            await self.wait_ready(session)
+            lag_before = await self.get_json(session, '/diagnostics/event-loop')
+            memory = asyncio.create_task(self.sample_memory())
+
+            started = time.perf_counter()
+            deadline = time.monotonic() + (self.args.duration or 0)
+            await asyncio.gather(*(self.client(session, deadline) for _ in range(self.args.clients)))
+            elapsed = time.perf_counter() - started
+
+            memory.cancel()
+            lag_after = await self.get_json(session, '/diagnostics/event-loop')
+
+        finished = self.counts['completed'] + self.counts['failed']
+        return {
+            'commit': git_commit(),
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+            'python': platform.python_version(),
+            'config': {
+                key: getattr(self.args, key)
+                for key in (
+                    'clients', 'jobs', 'duration', 'script_words', 'clips_per_minute', 'poll_interval',
+                    'latency_dist', 'latency_mean', 'latency_stddev', 'failure_rate', 'gpus', 'seed', 'spawn'
+                )
+            },
+            'elapsed_seconds': elapsed,
+            'counts': self.counts,
+            'throughput': {
+                'jobs_per_second': finished / elapsed if elapsed else None,
+                'clips_per_second': self.counts['clips'] / elapsed if elapsed else None,
+            },
+            'latency_seconds': {
+                'generate': summarize(self.generate_latency),
+                'status': summarize(self.status_latency),
+                'job': summarize(self.job_seconds),
+            },
+            'event_loop_lag': lag_delta(lag_before, lag_after),
+            'memory': {
+                'rss_start_bytes': self.rss_samples[0] if self.rss_samples else None,
+                'rss_peak_bytes': max(self.rss_samples) if self.rss_samples else None,
+                'rss_end_bytes': self.rss_samples[-1] if self.rss_samples else None,
+            },
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Load test the motion API service')
+    parser.add_argument('--api-url', default='http://localhost:9000', help='API to test (ignored with --spawn)')
+    parser.add_argument('--api-pid', type=int, help='PID of the API process, for memory sampling')
+    parser.add_argument('--spawn', action='store_true', help='Start the mock ComfyUI server and the API locally')
+    parser.add_argument('--clients', type=int, default=10, help='Concurrent clients')
+    parser.add_argument('--jobs', type=int, default=100, help='Jobs to run in total')
+    parser.add_argument('--duration', type=float, default=0, help='Run for this many seconds instead of --jobs')
+    parser.add_argument('--script-words', type=int, default=300, help='Words per generated script')
+    parser.add_argument('--clips-per-minute', type=int, default=2, help='clips_per_minute sent with each job')
+    parser.add_argument('--poll-interval', type=float, default=0.2, help='Seconds between /status polls')
+    parser.add_argument('--queue-depth', type=int, default=1000, help='JOB_QUEUE_MAX_DEPTH for a spawned API')
+    # Mock ComfyUI settings, used with --spawn
+    parser.add_argument('--latency-dist', default='fixed',
+                        choices=['fixed', 'uniform', 'normal', 'lognormal', 'exponential'])
+    parser.add_argument('--latency-mean', type=float, default=0.05, help='Mean prompt execution time')
+    parser.add_argument('--latency-stddev', type=float, default=0.0)
+    parser.add_argument('--failure-rate', type=float, default=0.0)
+    parser.add_argument('--gpus', type=int, default=4, help='Prompts the mock executes concurrently')
+    parser.add_argument('--output-bytes', type=int, default=4096)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help='Also write the JSON report to this file')
+    args = parser.parse_args()
+
+    stack = Stack(args) if args.spawn else None
+    if stack is not None:
+        stack.start()
+    try:
+        api_url = stack.api_url if stack else args.api_url
+        api_pid = stack.api.pid if stack else args.api_pid
+        report = asyncio.run(LoadTest(args, api_url, api_pid).run())
+    finally:
+        if stack is not None:
+            stack.stop()
+
+    text = json.dumps(report, indent=2)
+    print(text)
+    if args.output:
+        Path(args.output).write_text(text + '\n')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,152 @@
+"""
+Micro-benchmarks for the pure-Python code that runs on every job.
+
+    pip install -r benchmarks/requirements-bench.txt
+    python -m pytest benchmarks/test_hot_paths.py
+"""
+
+import copy
+import json
+import random
+
+import pytest
+
+pytest.importorskip('pytest_benchmark')
+
+VOCABULARY = (
+    "the a rider desert dawn city neon rain light shadow river mountain storm "
+    "slowly quietly across under above through camera pans zooms toward away "
+    "crowd market train station bridge window door forest fire ocean wave sky "
+    "stars cloud engine smoke glass mirror street alley rooftop child old woman "
+    "man dog bird horse car boat lantern"
+).split()
+
+
+def make_script(words: int, words_per_line: int, seed: int = 0) -> str:
+    """Deterministic script of ``words`` words; sentences of 8-20 words, lines of about ``words_per_line``."""
+    rng = random.Random(seed)
+    lines = []
+    line = []
+    sentence = 0
+    target = rng.randint(8, 20)
+    for _ in range(words):
+        word = rng.choice(VOCABULARY)
+        if sentence == 0:
+            word = word.capitalize()
+        sentence += 1
+        if sentence == target:
+            word += '.'
+            sentence = 0
+            target = rng.randint(8, 20)
+        line.append(word)
+        if words_per_line and len(line) >= words_per_line and sentence == 0:
+            lines.append(' '.join(line))
+            line = []
+    if line:
+        lines.append(' '.join(line))
+    return '\n'.join(lines)
+
+
+SCRIPTS = {
+    # 10k words in short lines, the shape most scripts arrive in
+    '10k_lines': make_script(10_000, words_per_line=40),
+    # 10k words in a single paragraph
+    '10k_paragraph': make_script(10_000, words_per_line=0),
+}
+
+GRAPHS = [
+    'hunyuan_text_to_video.json',
+    'img2img_gogentic_01.json',
+    'hunyuan_safe_settings_api.json',
+]
+
+# API-format prompt graphs; the editor-format files above have no inputs for
+# prepare_workflow to fill and cannot be compiled into templates
+API_GRAPHS = [
+    'hunyuan_safe_settings_api.json',
+    'hunyuan_mp4_output.json',
+    'simple_test.json',
+]
+
+
+def history_outputs(nodes: int = 8, frames: int = 64):
+    """ComfyUI history ``outputs`` for a custom workflow saving a frame batch per node."""
+    return {
+        str(node): {
+            'images': [
+                {'filename': f'ComfyUI_{node:02d}_{frame:05d}_.png', 'subfolder': 'motion', 'type': 'output'}
+                for frame in range(frames)
+            ],
+            'videos': [
+                {'filename': f'ComfyUI_{node:02d}_.mp4', 'subfolder': 'motion', 'type': 'output'}
+            ],
+        }
+        for node in range(nodes)
+    }
+
+
+@pytest.mark.parametrize('shape', sorted(SCRIPTS))
+def test_parse_script_to_scenes(benchmark, peak_allocations, api_service, shape):
+    script = SCRIPTS[shape]
+    peak_allocations(api_service.parse_script_to_scenes, script, 4)
+    scenes = benchmark(api_service.parse_script_to_scenes, script, 4)
+    assert scenes
+
+
+def test_create_video_workflow(benchmark, peak_allocations, api_service):
+    scene = {'text': SCRIPTS['10k_lines'][:400], 'index': 3, 'total': 40}
+    args = (scene, 'cinematic', '1024x576', 8, 3.0)
+    peak_allocations(api_service.create_video_workflow, *args)
+    workflow = benchmark(api_service.create_video_workflow, *args)
+    assert workflow
+
+
+@pytest.mark.parametrize('name', GRAPHS)
+def test_load_workflow(benchmark, peak_allocations, workflow_text, name):
+    text = workflow_text(name)
+    peak_allocations(json.loads, text)
+    assert benchmark(json.loads, text)
+
+
+@pytest.mark.parametrize('name', API_GRAPHS)
+def test_prepare_workflow(benchmark, peak_allocations, comfyui_client, workflow_text, name):
+    graph = json.loads(workflow_text(name))
+    prompt = 'A lone rider crosses the red desert at dawn'
+
+    # prepare_workflow mutates its argument, so every round gets a fresh copy; the copy
+    # is not timed but does count towards the allocation peak
+    peak_allocations(lambda: comfyui_client.prepare_workflow(copy.deepcopy(graph), prompt))
+    benchmark.pedantic(
+        comfyui_client.prepare_workflow,
+        setup=lambda: ((copy.deepcopy(graph), prompt), {}),
+        rounds=200,
+    )
+
+
+def template_values(template):
+    """Per-scene values for the slots ``template`` has."""
+    values = {'prompt': 'A lone rider crosses the red desert at dawn', 'seed': 7, 'filename_prefix': 'motion_scene_003'}
+    return {slot: value for slot, value in values.items() if template.slots.get(slot)}
+
+
+@pytest.mark.parametrize('name', API_GRAPHS)
+def test_render_template(benchmark, peak_allocations, workflow_template, name):
+    template = workflow_template(name)
+    values = template_values(template)
+    peak_allocations(template.render, **values)
+    assert benchmark(template.render, **values)
+
+
+@pytest.mark.parametrize('name', API_GRAPHS)
+def test_render_template_json(benchmark, peak_allocations, workflow_template, name):
+    template = workflow_template(name)
+    values = template_values(template)
+    peak_allocations(template.render_json, **values)
+    assert benchmark(template.render_json, **values)
+
+
+def test_summarize_outputs(benchmark, peak_allocations, api_service):
+    outputs = history_outputs()
+    peak_allocations(api_service.summarize_outputs, outputs)
+    summary = benchmark(api_service.summarize_outputs, outputs)
+    assert len(summary) == len(outputs)
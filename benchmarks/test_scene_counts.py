@@ -0,0 +1,36 @@
+"""
+Scene counts of parse_script_to_scenes: exactly round(minutes * clips_per_minute).
+
+    python -m pytest benchmarks/test_scene_counts.py
+"""
+
+import random
+
+import pytest
+
+from test_hot_paths import make_script
+
+
+@pytest.mark.parametrize('seed', range(200))
+def test_scene_count_is_exact(api_service, seed):
+    rng = random.Random(seed)
+    words = rng.randint(1, 4000)
+    clips_per_minute = rng.choice([1, 2, 3, 4, 6, 10])
+    words_per_minute = rng.choice([120, 150, 180])
+    script = make_script(words, words_per_line=rng.choice([0, 12, 40]), seed=seed)
+    scenes = api_service.parse_script_to_scenes(script, clips_per_minute, words_per_minute)
+    assert len(scenes) == max(1, round(words / words_per_minute * clips_per_minute))
+    assert ' '.join(scene['text'] for scene in scenes).split() == script.split()
+    assert [scene['index'] for scene in scenes] == list(range(len(scenes)))
+
+
+@pytest.mark.parametrize('clips_per_minute', [1, 2, 4, 6])
+def test_scene_count_is_independent_of_chunking(api_service, clips_per_minute):
+    script = make_script(3000, words_per_line=40, seed=clips_per_minute)
+    whole = api_service.parse_script_to_scenes(script, clips_per_minute)
+    segmenter = api_service.SceneSegmenter(clips_per_minute)
+    scenes = []
+    for offset in range(0, len(script), 97):
+        scenes.extend(segmenter.feed(script[offset:offset + 97]))
+    scenes.extend(segmenter.close())
+    assert [scene['text'] for scene in scenes] == [scene['text'] for scene in whole]
@@ -0,0 +1,365 @@
+#!/usr/bin/env python3
+"""
+Stand-in ComfyUI server for load testing the API without a GPU.
+
+Implements the parts of the ComfyUI HTTP/WebSocket API that api_service uses:
+POST /prompt, GET /history[/{prompt_id}], GET/POST /queue, POST /interrupt,
+GET /system_stats and GET /ws. Prompts execute --gpus at a time (one by default, like a single
+GPU) after a sampled delay, emit the same WebSocket events ComfyUI does and
+write output files for every node with a ``filename_prefix`` input.
+
+Usage:
+    python scripts/mock_comfyui.py --port 9188
+    python scripts/mock_comfyui.py --latency-dist lognormal --latency-mean 2 --latency-stddev 0.5
+    python scripts/mock_comfyui.py --failure-rate 0.05 --submit-failure-rate 0.01 --emit none
+"""
+
+import argparse
+import asyncio
+import json
+import math
+import random
+import time
+import uuid
+from pathlib import Path
+
+from aiohttp import web
+
+# Output node class -> (history output key, file extension)
+OUTPUT_FORMATS = {
+    'SaveAnimatedWEBP': ('images', 'webp'),
+    'SaveAnimatedPNG': ('images', 'png'),
+    'SaveImage': ('images', 'png'),
+    'VHS_VideoCombine': ('gifs', 'mp4'),
+    'SaveVideo': ('images', 'mp4'),
+}
+SAMPLER_CLASSES = {'KSampler', 'KSamplerAdvanced', 'SamplerCustom', 'SamplerCustomAdvanced'}
+
+
+class LatencyModel:
+    """Samples execution times in seconds from a configurable distribution."""
+
+    def __init__(self, dist, mean, stddev, minimum, maximum, rng):
+        self.dist = dist
+        self.mean = mean
+        self.stddev = stddev
+        self.minimum = minimum
+        self.maximum = maximum
+        self.rng = rng
+
+    def sample(self):
+        if self.dist == 'fixed':
+            value = self.mean
+        elif self.dist == 'uniform':
+            value = self.rng.uniform(self.mean - self.stddev, self.mean + self.stddev)
+        elif self.dist == 'normal':
+            value = self.rng.gauss(self.mean, self.stddev)
+        elif self.dist == 'exponential':
+            value = self.rng.expovariate(1 / self.mean) if self.mean > 0 else 0.0
+        else:
+            # Parameterised by the mean and stddev of the samples, not of the underlying normal
+            variance = math.log(1 + (self.stddev / self.mean) ** 2) if self.mean > 0 else 0.0
+            value = self.rng.lognormvariate(math.log(self.mean) - variance / 2, math.sqrt(variance)) if self.mean > 0 else 0.0
+        return min(self.maximum, max(self.minimum, value))
+
+
+class MockComfyUI:
+    def __init__(self, args):
+        self.args = args
+        self.rng = random.Random(args.seed)
+        self.latency = LatencyModel(
+            args.latency_dist, args.latency_mean, args.latency_stddev,
+            args.latency_min, args.latency_max, self.rng
+        )
+        self.output_dir = Path(args.output_dir)
+        self.clients = {}
+        self.history = {}
+        self.pending = []
+        self.running = []
+        self.interrupted = set()
+        self.queue = asyncio.Queue()
+        self.counters = {}
+        self.number = 0
+        self.stats = {
+            'prompts': 0, 'rejected': 0, 'completed': 0, 'failed': 0,
+            'deleted': 0, 'interrupted': 0, 'history_requests': 0,
+        }
+
+    # --- HTTP handlers -------------------------------------------------
+
+    async def post_prompt(self, request):
+        body = await request.json()
+        prompt = body.get('prompt')
+        if not isinstance(prompt, dict) or not prompt:
+            return web.json_response(
+                {'error': {'type': 'invalid_prompt', 'message': 'No prompt provided'}, 'node_errors': {}},
+                status=400
+            )
+        if self.rng.random() < self.args.submit_failure_rate:
+            self.stats['rejected'] += 1
+            return web.json_response({'error': {'type': 'server_error', 'message': 'Injected failure'}}, status=500)
+
+        prompt_id = str(uuid.uuid4())
+        self.number += 1
+        item = [self.number, prompt_id, prompt, {'client_id': body.get('client_id')}, []]
+        self.pending.append(item)
+        self.stats['prompts'] += 1
+        await self.queue.put(item)
+        await self.broadcast_status()
+        return web.json_response({'prompt_id': prompt_id, 'number': self.number, 'node_errors': {}})
+
+    async def get_history(self, request):
+        self.stats['history_requests'] += 1
+        prompt_id = request.match_info.get('prompt_id')
+        if prompt_id is None:
+            return web.json_response(self.history)
+        entry = self.history.get(prompt_id)
+        return web.json_response({prompt_id: entry} if entry is not None else {})
+
+    async def get_queue(self, request):
+        return web.json_response({'queue_running': self.running, 'queue_pending': self.pending})
+
+    async def post_queue(self, request):
+        body = await request.json()
+        if body.get('clear'):
+            deleted = [item[1] for item in self.pending]
+        else:
+            deleted = body.get('delete') or []
+        for item in [item for item in self.pending if item[1] in deleted]:
+            # The worker skips items that are no longer pending
+            self.pending.remove(item)
+            self.stats['deleted'] += 1
+        await self.broadcast_status()
+        return web.Response(status=200)
+
+    async def post_interrupt(self, request):
+        body = await request.json() if request.can_read_body else {}
+        prompt_id = body.get('prompt_id')
+        # Like ComfyUI, no prompt_id interrupts whatever is executing
+        self.interrupted.update(item[1] for item in self.running if prompt_id in (None, item[1]))
+        return web.Response(status=200)
+
+    async def get_system_stats(self, request):
+        return web.json_response({
+            'system': {'os': 'mock', 'python_version': '', 'embedded_python': False},
+            'devices': [{
+                'name': 'mock-gpu',
+                'type': 'cuda',
+                'index': 0,
+                'vram_total': self.args.vram_total,
+                'vram_free': self.args.vram_total // 2,
+                'torch_vram_total': 0,
+                'torch_vram_free': 0,
+            }],
+        })
+
+    async def get_stats(self, request):
+        return web.json_response({**self.stats, 'queue_remaining': len(self.pending) + len(self.running)})
+
+    async def websocket(self, request):
+        ws = web.WebSocketResponse(heartbeat=30)
+        await ws.prepare(request)
+        client_id = request.query.get('clientId') or str(uuid.uuid4())
+        self.clients[client_id] = ws
+        try:
+            await self.send(client_id, 'status', self.status_payload(), sid=client_id)
+            async for _ in ws:
+                pass
+        finally:
+            if self.clients.get(client_id) is ws:
+                del self.clients[client_id]
+        return ws
+
+    # --- Execution -----------------------------------------------------
+
+    def status_payload(self):
+        return {'status': {'exec_info': {'queue_remaining': len(self.pending) + len(self.running)}}}
+
+    async def send(self, client_id, event_type, data, sid=None):
+        ws = self.clients.get(client_id)
+        if ws is None or ws.closed:
+            return
+        message = {'type': event_type, 'data': data}
+        if sid is not None:
+            message['data']['sid'] = sid
+        try:
+            await ws.send_str(json.dumps(message))
+        except ConnectionError:
+            pass
+
+    async def broadcast_status(self):
+        for client_id in list(self.clients):
+            await self.send(client_id, 'status', self.status_payload())
+
+    async def worker(self):
+        while True:
+            item = await self.queue.get()
+            if item not in self.pending:
+                continue
+            self.pending.remove(item)
+            self.running.append(item)
+            try:
+                await self.execute(item)
+            finally:
+                self.running.remove(item)
+                self.interrupted.discard(item[1])
+                await self.broadcast_status()
+
+    async def execute(self, item):
+        _, prompt_id, prompt, extra, _ = item
+        client_id = extra.get('client_id')
+        messages = []
+
+        def mark(event):
+            timestamp = int(time.time() * 1000)
+            messages.append([event, {'prompt_id': prompt_id, 'timestamp': timestamp}])
+            return timestamp
+
+        mark('execution_start')
+        await self.send(client_id, 'execution_start', {'prompt_id': prompt_id, 'timestamp': messages[-1][1]['timestamp']})
+        await self.send(client_id, 'execution_cached', {'nodes': [], 'prompt_id': prompt_id})
+
+        duration = self.latency.sample()
+        samplers = [node_id for node_id, node in prompt.items() if node.get('class_type') in SAMPLER_CLASSES]
+        fail_node = None
+        if self.rng.random() < self.args.failure_rate:
+            fail_node = samplers[0] if samplers else next(iter(prompt))
+
+        outputs = {}
+        for node_id, node in prompt.items():
+            class_type = node.get('class_type', 'unknown')
+            await self.send(client_id, 'executing', {'node': node_id, 'display_node': node_id, 'prompt_id': prompt_id})
+
+            if node_id == fail_node:
+                await asyncio.sleep(duration / 2)
+                error = {
+                    'prompt_id': prompt_id,
+                    'node_id': node_id,
+                    'node_type': class_type,
+                    'exception_message': 'Injected failure',
+                    'exception_type': 'RuntimeError',
+                    'traceback': [],
+                    'timestamp': mark('execution_error'),
+                }
+                messages[-1][1].update(error)
+                self.history[prompt_id] = {
+                    'prompt': item[:4], 'outputs': {},
+                    'status': {'status_str': 'error', 'completed': False, 'messages': messages},
+                }
+                self.stats['failed'] += 1
+                await self.send(client_id, 'execution_error', error)
+                return
+
+            if node_id in samplers or (not samplers and node_id == next(iter(prompt))):
+                # The whole sampled duration is spent in the sampler(s), reported step by step
+                share = duration / max(1, len(samplers))
+                steps = self.args.progress_steps
+                for step in range(1, steps + 1):
+                    await asyncio.sleep(share / steps)
+                    if prompt_id in self.interrupted:
+                        interrupted = {
+                            'prompt_id': prompt_id, 'node_id': node_id, 'node_type': class_type,
+                            'executed': [], 'timestamp': mark('execution_interrupted'),
+                        }
+                        self.history[prompt_id] = {
+                            'prompt': item[:4], 'outputs': {},
+                            'status': {'status_str': 'error', 'completed': False, 'messages': messages},
+                        }
+                        self.stats['interrupted'] += 1
+                        await self.send(client_id, 'execution_interrupted', interrupted)
+                        return
+                    await self.send(client_id, 'progress', {'value': step, 'max': steps, 'prompt_id': prompt_id, 'node': node_id})
+
+            prefix = node.get('inputs', {}).get('filename_prefix')
+            if isinstance(prefix, str):
+                output = await self.emit_output(class_type, prefix)
+                if output:
+                    outputs[node_id] = output
+                    await self.send(client_id, 'executed', {'node': node_id, 'display_node': node_id, 'output': output, 'prompt_id': prompt_id})
+
+        mark('execution_success')
+        self.history[prompt_id] = {
+            'prompt': item[:4], 'outputs': outputs,
+            'status': {'status_str': 'success', 'completed': True, 'messages': messages},
+        }
+        self.stats['completed'] += 1
+        await self.send(client_id, 'execution_success', {'prompt_id': prompt_id, 'timestamp': messages[-1][1]['timestamp']})
+        await self.send(client_id, 'executing', {'node': None, 'prompt_id': prompt_id})
+
+    async def emit_output(self, class_type, prefix):
+        if self.args.emit == 'none':
+            return {}
+        key, extension = OUTPUT_FORMATS.get(class_type, ('images', 'png'))
+        subfolder, _, name = prefix.rpartition('/')
+        counter = self.counters.get(prefix, 0) + 1
+        self.counters[prefix] = counter
+        filename = f"{name}_{counter:05d}_.{extension}"
+        path = self.output_dir / subfolder / filename
+        size = self.args.output_bytes
+        await asyncio.get_running_loop().run_in_executor(None, write_file, path, size)
+        return {key: [{'filename': filename, 'subfolder': subfolder, 'type': 'output'}]}
+
+    def app(self):
+        app = web.Application(client_max_size=64 * 1024 ** 2)
+        app.add_routes([
+            web.post('/prompt', self.post_prompt),
+            web.get('/history', self.get_history),
+            web.get('/history/{prompt_id}', self.get_history),
+            web.get('/queue', self.get_queue),
+            web.post('/queue', self.post_queue),
+            web.post('/interrupt', self.post_interrupt),
+            web.get('/system_stats', self.get_system_stats),
+            web.get('/mock/stats', self.get_stats),
+            web.get('/ws', self.websocket),
+        ])
+
+        async def start_workers(app):
+            app['workers'] = [asyncio.create_task(self.worker()) for _ in range(self.args.gpus)]
+
+        async def stop_workers(app):
+            for task in app['workers']:
+                task.cancel()
+
+        app.on_startup.append(start_workers)
+        app.on_cleanup.append(stop_workers)
+        return app
+
+
+def write_file(path, size):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, 'wb') as f:
+        f.write(b'\0' * size)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Mock ComfyUI server for GPU-less load tests')
+    parser.add_argument('--host', default='127.0.0.1', help='Interface to listen on')
+    parser.add_argument('--port', type=int, default=9188, help='Port to listen on')
+    parser.add_argument('--latency-dist', choices=['fixed', 'uniform', 'normal', 'lognormal', 'exponential'],
+                        default='fixed', help='Distribution of per-prompt execution time')
+    parser.add_argument('--latency-mean', type=float, default=1.0, help='Mean execution time in seconds')
+    parser.add_argument('--latency-stddev', type=float, default=0.0,
+                        help='Standard deviation (half-width for uniform) in seconds')
+    parser.add_argument('--latency-min', type=float, default=0.0, help='Lower clamp for sampled times')
+    parser.add_argument('--latency-max', type=float, default=3600.0, help='Upper clamp for sampled times')
+    parser.add_argument('--failure-rate', type=float, default=0.0,
+                        help='Probability that a prompt fails with an execution_error')
+    parser.add_argument('--submit-failure-rate', type=float, default=0.0,
+                        help='Probability that POST /prompt answers HTTP 500')
+    parser.add_argument('--gpus', type=int, default=1, help='Prompts executed concurrently')
+    parser.add_argument('--progress-steps', type=int, default=20, help='Sampler progress events per prompt')
+    parser.add_argument('--emit', choices=['file', 'none'], default='file',
+                        help='Write output files for save nodes, or report no outputs')
+    parser.add_argument('--output-dir', default='./output', help='Directory output files are written to')
+    parser.add_argument('--output-bytes', type=int, default=64 * 1024, help='Size of each emitted file')
+    parser.add_argument('--vram-total', type=int, default=24 * 1024 ** 3, help='VRAM reported by /system_stats')
+    parser.add_argument('--seed', type=int, default=0, help='Random seed, for repeatable runs')
+    args = parser.parse_args()
+
+    print(f"🧪 Mock ComfyUI on http://{args.host}:{args.port} "
+          f"({args.latency_dist} latency, mean {args.latency_mean}s, failure rate {args.failure_rate})")
+    web.run_app(MockComfyUI(args).app(), host=args.host, port=args.port, print=None)
+
+
+if __name__ == '__main__':
+    main()
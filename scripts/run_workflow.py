@@ -6,6 +6,7 @@ Usage:
     python scripts/run_workflow.py workflows/hunyuan_safe_settings_api.json
     python scripts/run_workflow.py workflows/hunyuan_safe_settings_api.json --prompt "A beautiful sunset"
     python scripts/run_workflow.py workflows/hunyuan_safe_settings_api.json --monitor
+    python scripts/run_workflow.py workflows/hunyuan_mp4_output.json --seed 7 --width 640 --height 368 --length 33
 """
 
 import json
@@ -16,6 +17,9 @@ import argparse
 import requests
 from pathlib import Path
 
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from workflow_template import UI_ONLY_CLASS_TYPES, WorkflowTemplateError, load_template
+
 
 class ComfyUIClient:
     def __init__(self, host="localhost", port=9188):
@@ -26,14 +30,9 @@ class ComfyUIClient:
         with open(workflow_path, 'r') as f:
             return json.load(f)
     
-    def prepare_workflow(self, workflow, text_prompt=None):
-        """Prepare workflow with proper model paths and optional text prompt."""
-        # Remove UI-only nodes
-        for node_id in list(workflow.keys()):
-            if isinstance(workflow[node_id], dict):
-                if workflow[node_id].get('class_type') == 'Note':
-                    del workflow[node_id]
-        
+    @staticmethod
+    def prepare_graph(workflow):
+        """Pin model paths and fill in required inputs of a parsed workflow (in place)."""
         # Update model paths based on what's available
         for node_id, node_data in workflow.items():
             if not isinstance(node_data, dict):
@@ -63,11 +62,12 @@ class ComfyUIClient:
                 node_data['inputs']['clip_name2'] = 'llava_llama3_fp8_scaled.safetensors'
                 node_data['inputs']['type'] = 'hunyuan_video'
             
-            # Text prompt
-            elif class_type == 'CLIPTextEncode' and text_prompt:
+            # Text prompt - a template slot, so it must exist even before a prompt is given
+            elif class_type == 'CLIPTextEncode':
                 if 'inputs' not in node_data:
                     node_data['inputs'] = {}
-                node_data['inputs']['text'] = text_prompt
+                if 'text' not in node_data['inputs']:
+                    node_data['inputs']['text'] = ''
             
             # Save nodes - ensure they have required inputs
             elif class_type == 'SaveAnimatedWEBP':
@@ -98,12 +98,42 @@ class ComfyUIClient:
                     node_data['inputs']['batch_size'] = 1
         
         return workflow
+
+    def load_template(self, workflow_path):
+        """Compile a workflow file into a template, reused until the file changes."""
+        return load_template(workflow_path, prepare=self.prepare_graph)
+
+    def prepare_workflow(self, workflow, text_prompt=None):
+        """Prepare workflow with proper model paths and optional text prompt."""
+        # Remove UI-only nodes
+        for node_id in list(workflow.keys()):
+            if isinstance(workflow[node_id], dict):
+                if workflow[node_id].get('class_type') in UI_ONLY_CLASS_TYPES:
+                    del workflow[node_id]
+        
+        self.prepare_graph(workflow)
+        
+        if text_prompt:
+            for node_data in workflow.values():
+                if isinstance(node_data, dict) and node_data.get('class_type') == 'CLIPTextEncode':
+                    node_data['inputs']['text'] = text_prompt
+        
+        return workflow
     
     def submit_workflow(self, workflow):
-        """Submit workflow to ComfyUI API."""
+        """Submit workflow to ComfyUI API (a dict, or JSON from WorkflowTemplate.render_json)."""
+        client_id = str(uuid.uuid4())
+        if isinstance(workflow, str):
+            # Already serialized: splice it into the request body instead of re-encoding
+            body = f'{{"prompt": {workflow}, "client_id": {json.dumps(client_id)}}}'
+            response = requests.post(
+                f"{self.base_url}/prompt", data=body.encode(), headers={'Content-Type': 'application/json'}
+            )
+            return response.json()
+        
         api_request = {
             'prompt': workflow,
-            'client_id': str(uuid.uuid4())
+            'client_id': client_id
         }
         
         response = requests.post(f"{self.base_url}/prompt", json=api_request)
@@ -168,6 +198,11 @@ def main():
     parser = argparse.ArgumentParser(description='Run ComfyUI workflows headless')
     parser.add_argument('workflow', help='Path to workflow JSON file')
     parser.add_argument('--prompt', help='Text prompt to use')
+    parser.add_argument('--seed', type=int, help='Sampler seed')
+    parser.add_argument('--width', type=int, help='Output width')
+    parser.add_argument('--height', type=int, help='Output height')
+    parser.add_argument('--length', type=int, help='Frames to generate')
+    parser.add_argument('--filename-prefix', help='Output filename prefix')
     parser.add_argument('--monitor', action='store_true', help='Monitor generation progress')
     parser.add_argument('--host', default='localhost', help='ComfyUI host')
     parser.add_argument('--port', type=int, default=9188, help='ComfyUI port')
@@ -183,10 +218,22 @@ def main():
     # Initialize client
     client = ComfyUIClient(args.host, args.port)
     
-    # Load and prepare workflow
+    # Load and prepare workflow (compiled once per file version, then only the slots are filled)
     print(f"📄 Loading workflow: {workflow_path}")
-    workflow = client.load_workflow(workflow_path)
-    workflow = client.prepare_workflow(workflow, args.prompt)
+    try:
+        template = client.load_template(workflow_path)
+    except WorkflowTemplateError as error:
+        print(f"❌ {error}")
+        sys.exit(1)
+    slot_values = {
+        'prompt': args.prompt,
+        'seed': args.seed,
+        'width': args.width,
+        'height': args.height,
+        'length': args.length,
+        'filename_prefix': args.filename_prefix,
+    }
+    workflow = template.render_json(**{slot: value for slot, value in slot_values.items() if value is not None})
     
     if args.prompt:
         print(f"📝 Using prompt: {args.prompt}")
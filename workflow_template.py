@@ -0,0 +1,229 @@
+"""
+Compiled ComfyUI workflow templates.
+
+A template is an API-format prompt graph that is validated and serialized once,
+with named parameter slots (prompt text, seed, width/height, length,
+filename_prefix, ...) bound to node inputs. Rendering a scene only fills those
+slots: ``render()`` copies just the nodes that hold a slot and shares the rest
+with the template, and ``render_json()`` joins pre-serialized JSON fragments
+around the encoded slot values. Templates loaded from files are cached until
+the file's mtime or size changes.
+"""
+
+import json
+import os
+import re
+import threading
+from typing import Any, Callable, Dict, List, Optional, Tuple, Union
+
+# Slot name -> (node class_types, input name) pairs it fills when discovered in a
+# graph; None matches any class_type. Only literal inputs are bound, never links.
+STANDARD_SLOTS: Dict[str, Tuple[Tuple[Optional[Tuple[str, ...]], str], ...]] = {
+    'prompt': ((('CLIPTextEncode',), 'text'),),
+    'seed': ((None, 'seed'), (None, 'noise_seed')),
+    'width': ((None, 'width'),),
+    'height': ((None, 'height'),),
+    'length': (
+        (('EmptyHunyuanLatentVideo', 'EmptyLTXVLatentVideo', 'EmptyMochiLatentVideo'), 'length'),
+        (('EmptyLatentImage',), 'batch_size'),
+    ),
+    'fps': ((None, 'fps'), (None, 'frame_rate')),
+    'filename_prefix': ((None, 'filename_prefix'),),
+}
+
+# Nodes that only exist in the editor and are rejected by /prompt
+UI_ONLY_CLASS_TYPES = ('Note', 'MarkdownNote')
+
+# Stand-in for a slot input while the graph is serialized; json.dumps escapes it to \u0000slot\u0000<n>
+_SLOT_MARK = '\x00slot\x00'
+_SLOT_PATTERN = re.compile(r'"\\u0000slot\\u0000(\d+)"')
+
+
+class WorkflowTemplateError(ValueError):
+    pass
+
+
+def _is_link(value: Any) -> bool:
+    # API-format links are [source_node_id, output_index]
+    return isinstance(value, list) and len(value) == 2 and isinstance(value[0], str) and isinstance(value[1], int)
+
+
+def discover_slots(graph: Dict[str, Any], rules=STANDARD_SLOTS) -> Dict[str, List[Tuple[str, str]]]:
+    """Bind each slot in ``rules`` to the matching literal node inputs of ``graph``."""
+    slots: Dict[str, List[Tuple[str, str]]] = {name: [] for name in rules}
+    for node_id, node in graph.items():
+        if not isinstance(node, dict) or not isinstance(node.get('inputs'), dict):
+            continue
+        inputs = node['inputs']
+        for name, targets in rules.items():
+            for class_types, input_name in targets:
+                if class_types is not None and node.get('class_type') not in class_types:
+                    continue
+                if input_name in inputs and not _is_link(inputs[input_name]):
+                    slots[name].append((str(node_id), input_name))
+    return slots
+
+
+class WorkflowTemplate:
+    """An API-format prompt graph with parameter slots, compiled once.
+
+    ``slots`` maps a slot name to the ``(node_id, input_name)`` pairs it fills;
+    the inputs must exist in the graph and hold literal values. Slots left out
+    of a render keep the graph's own values. Rendered workflows share unchanged
+    nodes with the template, so treat them as read-only.
+    """
+
+    def __init__(self, graph: Dict[str, Any], slots: Dict[str, List[Tuple[str, str]]], name: str = "workflow"):
+        self.name = name
+        self.graph = graph
+        self.slots = {slot: [(str(node_id), input_name) for node_id, input_name in targets] for slot, targets in slots.items()}
+        self._validate()
+
+        # node_id -> [(input_name, slot)], for copy-on-write rendering
+        self._node_slots: Dict[str, List[Tuple[str, str]]] = {}
+        for slot, targets in self.slots.items():
+            for node_id, input_name in targets:
+                self._node_slots.setdefault(node_id, []).append((input_name, slot))
+
+        self._slotted_nodes = [(node_id, graph[node_id], node_slots) for node_id, node_slots in self._node_slots.items()]
+
+        # The graph serialized once with a numbered marker in every bound input;
+        # render_json() joins the literal fragments around the encoded values.
+        # Each marker resolves to (slot, the input's own value as JSON).
+        bindings: List[Tuple[str, str]] = []
+        marked = dict(graph)
+        for node_id, node_slots in self._node_slots.items():
+            inputs = dict(graph[node_id]['inputs'])
+            for input_name, slot in node_slots:
+                inputs[input_name] = f"{_SLOT_MARK}{len(bindings)}"
+                bindings.append((slot, json.dumps(graph[node_id]['inputs'][input_name])))
+            marked[node_id] = {**graph[node_id], 'inputs': inputs}
+        parts = _SLOT_PATTERN.split(json.dumps(marked))
+        self._fragments: List[str] = parts[0::2]
+        self._fragment_slots: List[Tuple[str, str]] = [bindings[int(number)] for number in parts[1::2]]
+
+    def _validate(self) -> None:
+        if not isinstance(self.graph, dict) or not self.graph:
+            raise WorkflowTemplateError(f"{self.name}: expected a non-empty API-format prompt graph")
+        if 'nodes' in self.graph and 'links' in self.graph:
+            raise WorkflowTemplateError(
+                f"{self.name}: this is an editor (UI) workflow; export it with 'Save (API Format)'"
+            )
+        for node_id, node in self.graph.items():
+            if not isinstance(node, dict) or not isinstance(node.get('class_type'), str):
+                raise WorkflowTemplateError(f"{self.name}: node {node_id} has no class_type")
+            inputs = node.get('inputs', {})
+            if not isinstance(inputs, dict):
+                raise WorkflowTemplateError(f"{self.name}: node {node_id} inputs must be an object")
+            for input_name, value in inputs.items():
+                if _is_link(value) and str(value[0]) not in self.graph:
+                    raise WorkflowTemplateError(
+                        f"{self.name}: input {input_name} of node {node_id} links to missing node {value[0]}"
+                    )
+            if any(isinstance(value, str) and value.startswith(_SLOT_MARK) for value in inputs.values()):
+                raise WorkflowTemplateError(f"{self.name}: node {node_id} contains a reserved value")
+        for slot, targets in self.slots.items():
+            for node_id, input_name in targets:
+                inputs = self.graph.get(node_id, {}).get('inputs') or {}
+                if input_name not in inputs:
+                    raise WorkflowTemplateError(f"{self.name}: slot {slot} targets missing input {node_id}.{input_name}")
+                if _is_link(inputs[input_name]):
+                    raise WorkflowTemplateError(f"{self.name}: slot {slot} targets link {node_id}.{input_name}")
+        self._check_acyclic()
+
+    def _check_acyclic(self) -> None:
+        # Iterative three-colour DFS over link edges
+        state: Dict[str, int] = {}
+        for root in self.graph:
+            if root in state:
+                continue
+            stack = [(root, iter(self._links(root)))]
+            state[root] = 1
+            while stack:
+                node_id, children = stack[-1]
+                child = next(children, None)
+                if child is None:
+                    state[node_id] = 2
+                    stack.pop()
+                elif state.get(child) == 1:
+                    raise WorkflowTemplateError(f"{self.name}: graph has a cycle through node {child}")
+                elif child not in state:
+                    state[child] = 1
+                    stack.append((child, iter(self._links(child))))
+
+    def _links(self, node_id: str) -> List[str]:
+        return [str(value[0]) for value in (self.graph[node_id].get('inputs') or {}).values() if _is_link(value)]
+
+    def _check_values(self, values: Dict[str, Any]) -> None:
+        for slot in values:
+            if slot not in self.slots:
+                raise WorkflowTemplateError(f"{self.name}: unknown slot {slot}")
+
+    def render(self, **values: Any) -> Dict[str, Any]:
+        """The prompt graph with ``values`` filled into their slots."""
+        self._check_values(values)
+        workflow = self.graph.copy()
+        for node_id, node, node_slots in self._slotted_nodes:
+            inputs = None
+            for input_name, slot in node_slots:
+                if slot in values:
+                    if inputs is None:
+                        inputs = node['inputs'].copy()
+                    inputs[input_name] = values[slot]
+            if inputs is not None:
+                node = node.copy()
+                node['inputs'] = inputs
+                workflow[node_id] = node
+        return workflow
+
+    def render_json(self, **values: Any) -> str:
+        """``json.dumps(self.render(**values))``, built from the pre-serialized fragments."""
+        self._check_values(values)
+        # Each slot value is encoded once however many inputs it fills
+        encoded = {slot: json.dumps(value) for slot, value in values.items()}
+        fragments = self._fragments
+        parts = [fragments[0]]
+        for index, (slot, own_value) in enumerate(self._fragment_slots):
+            parts.append(encoded.get(slot, own_value))
+            parts.append(fragments[index + 1])
+        return ''.join(parts)
+
+
+_template_cache: Dict[Tuple[str, Any], Tuple[Tuple[int, int], WorkflowTemplate]] = {}
+_template_cache_lock = threading.Lock()
+
+
+def load_template(
+    path: Union[str, "os.PathLike[str]"],
+    rules=STANDARD_SLOTS,
+    prepare: Optional[Callable[[Dict[str, Any]], Dict[str, Any]]] = None,
+) -> WorkflowTemplate:
+    """Compile the API-format workflow at ``path``, or return the cached template if the file is unchanged.
+
+    ``prepare`` may normalize the parsed graph (model names, default inputs)
+    before slots are discovered; it runs once per file version. Editor-only
+    nodes such as notes are dropped.
+    """
+    path = os.path.abspath(path)
+    stat = os.stat(path)
+    version = (stat.st_mtime_ns, stat.st_size)
+    key = (path, prepare)
+    with _template_cache_lock:
+        cached = _template_cache.get(key)
+    if cached is not None and cached[0] == version:
+        return cached[1]
+
+    with open(path, 'r') as f:
+        graph = json.load(f)
+    if isinstance(graph, dict) and not ('nodes' in graph and 'links' in graph):
+        graph = {
+            node_id: node for node_id, node in graph.items()
+            if not (isinstance(node, dict) and node.get('class_type') in UI_ONLY_CLASS_TYPES)
+        }
+        if prepare is not None:
+            graph = prepare(graph)
+    slots = discover_slots(graph, rules) if isinstance(graph, dict) else {}
+    template = WorkflowTemplate(graph, slots, name=os.path.basename(path))
+    with _template_cache_lock:
+        _template_cache[key] = (version, template)
+    return template